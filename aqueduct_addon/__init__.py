@@ -30,12 +30,28 @@ import bpy
 
 # submodules
 from . import ad_utils
+from . import ad_raycast
+from . import ad_bounds
+from . import ad_transform
+from . import ad_modal
+from . import ad_scatter
+from . import ad_pool
+from . import ad_worker
+from . import ad_jobs
+from . import ad_hash
+from . import ad_thumbcache
+from . import ad_textures
+from . import ad_blendfile
+from . import ad_catalog
+from . import ad_watcher
 
 from . import ad_ops_utility
 from . import ad_ops_import
 from . import ad_ops_export
 from . import ad_ops_filelist
 from . import ad_ops_tools
+from . import ad_ops_jobs
+from . import ad_ops_catalog
 
 from . import ad_gui
 
@@ -45,12 +61,28 @@ if "bpy" in locals():
     ad_utils.log("[INIT] Reloading submodules")
 
     importlib.reload(ad_utils)
+    importlib.reload(ad_raycast)
+    importlib.reload(ad_bounds)
+    importlib.reload(ad_transform)
+    importlib.reload(ad_modal)
+    importlib.reload(ad_scatter)
+    importlib.reload(ad_pool)
+    importlib.reload(ad_worker)
+    importlib.reload(ad_jobs)
+    importlib.reload(ad_hash)
+    importlib.reload(ad_thumbcache)
+    importlib.reload(ad_textures)
+    importlib.reload(ad_blendfile)
+    importlib.reload(ad_catalog)
+    importlib.reload(ad_watcher)
 
     importlib.reload(ad_ops_utility)
     importlib.reload(ad_ops_import)
     importlib.reload(ad_ops_export)
     importlib.reload(ad_ops_filelist)
     importlib.reload(ad_ops_tools)
+    importlib.reload(ad_ops_jobs)
+    importlib.reload(ad_ops_catalog)
 
     importlib.reload(ad_gui)
 
@@ -70,6 +102,11 @@ def register():
     ad_ops_export.register()
     ad_ops_filelist.register()
     ad_ops_tools.register()
+    ad_ops_jobs.register()
+    ad_ops_catalog.register()
+    ad_watcher.register()
+    ad_raycast.register()
+    ad_bounds.register()
 
 
     # hotkeys
@@ -96,6 +133,14 @@ def unregister():
     ad_ops_export.unregister()
     ad_ops_filelist.unregister()
     ad_ops_tools.unregister()
+    ad_ops_jobs.unregister()
+    ad_ops_catalog.unregister()
+    ad_watcher.unregister()
+    ad_raycast.unregister()
+    ad_bounds.unregister()
+
+    # stop the persistent background workers
+    ad_pool.shutdown_pool()
 
 
     # hotkeys
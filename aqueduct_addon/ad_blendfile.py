@@ -0,0 +1,593 @@
+# Reader for .blend files that doesn't need blender
+#
+# Lists the datablocks, library paths, image paths and the preview of a
+# blendfile by parsing its block headers and SDNA directly. Uncompressed
+# files are memory mapped, gzip and zstd compressed files get decompressed
+# into memory first. Only uses the standard library, so it can be used by
+# tools outside of blender:
+#
+#   python ad_blendfile.py file.blend [--json]
+#   python ad_blendfile.py --benchmark [--repeat N] file_or_folder [...]
+#
+# tests/test_blendfile.py checks it against compressed and converted copies
+# of the studio file: python -m unittest discover tests
+import os
+import re
+import sys
+import gzip
+import json
+import mmap
+import time
+import zlib
+import struct
+
+from collections import namedtuple
+
+# two character ID codes of the block headers, named like the bpy.data collections
+ID_CODES = {
+        'AC': 'actions',
+        'AR': 'armatures',
+        'BR': 'brushes',
+        'CA': 'cameras',
+        'CF': 'cache_files',
+        'CU': 'curves',
+        'GD': 'grease_pencils',
+        'GR': 'collections',
+        'IM': 'images',
+        'LA': 'lights',
+        'LI': 'libraries',
+        'LP': 'lightprobes',
+        'LS': 'linestyles',
+        'LT': 'lattices',
+        'MA': 'materials',
+        'MB': 'metaballs',
+        'MC': 'movieclips',
+        'ME': 'meshes',
+        'MS': 'masks',
+        'NT': 'node_groups',
+        'OB': 'objects',
+        'PA': 'particles',
+        'PL': 'palettes',
+        'SC': 'scenes',
+        'SO': 'sounds',
+        'SK': 'speakers',
+        'TE': 'textures',
+        'TX': 'texts',
+        'VF': 'fonts',
+        'WO': 'worlds',
+        'WS': 'workspaces',
+        }
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+BlockHeader = namedtuple('BlockHeader', ['code', 'sdna', 'old', 'size', 'count', 'offset'])
+Field = namedtuple('Field', ['offset', 'size', 'type', 'pointer'])
+
+# struct formats of the basic SDNA types
+TYPE_FORMATS = {
+        'char': 'b', 'uchar': 'B', 'int8_t': 'b', 'uint8_t': 'B',
+        'short': 'h', 'ushort': 'H', 'int16_t': 'h', 'uint16_t': 'H',
+        'int': 'i', 'uint': 'I', 'int32_t': 'i', 'uint32_t': 'I',
+        'int64_t': 'q', 'uint64_t': 'Q', 'float': 'f', 'double': 'd',
+        }
+
+class BlendFileError(Exception):
+    pass
+
+def decompress(f, magic):
+    """ reads a compressed blendfile into memory """
+    if magic == GZIP_MAGIC:
+        with gzip.GzipFile(fileobj=f) as stream:
+            return stream.read()
+
+    try:
+        import zstandard
+        with zstandard.ZstdDecompressor().stream_reader(f) as stream:
+            return stream.read()
+    except ImportError:
+        pass
+
+    try:
+        # python 3.14+
+        from compression import zstd
+        with zstd.ZstdFile(f) as stream:
+            return stream.read()
+    except ImportError:
+        raise BlendFileError("Reading zstd compressed files needs the zstandard module")
+
+class SDNA:
+    """ struct layouts stored in the DNA1 block """
+
+    def __init__(self, data, offset, endian, pointer_size):
+        self.pointer_size = pointer_size
+
+        def align(pos):
+            # relative to the block, the 17 byte header of newer files leaves it unaligned in the file
+            return offset + ((pos - offset + 3) & ~3)
+
+        def read_strings(pos, count):
+            strings = []
+            for _ in range(count):
+                end = data.find(b"\0", pos)
+                strings.append(data[pos:end].decode('utf-8', 'replace'))
+                pos = end + 1
+            return strings, align(pos)
+
+        pos = offset
+        if data[pos:pos + 8] != b"SDNANAME":
+            raise BlendFileError("Invalid SDNA block")
+
+        count, = struct.unpack_from(endian + "i", data, pos + 8)
+        self.names, pos = read_strings(pos + 12, count)
+
+        count, = struct.unpack_from(endian + "i", data, pos + 4)
+        self.types, pos = read_strings(pos + 8, count)
+
+        self.lengths = struct.unpack_from(endian + "{}h".format(count), data, pos + 4)
+        pos = align(pos + 4 + 2 * count)
+
+        count, = struct.unpack_from(endian + "i", data, pos + 4)
+        pos += 8
+        # struct index -> (type index, [(field type index, field name index)])
+        self.structs = []
+        for _ in range(count):
+            type_index, field_count = struct.unpack_from(endian + "hh", data, pos)
+            fields = struct.unpack_from(endian + "{}h".format(field_count * 2), data, pos + 4)
+            self.structs.append((type_index, list(zip(fields[0::2], fields[1::2]))))
+            pos += 4 + field_count * 4
+
+        self.struct_index = {self.types[type_index]: i for i, (type_index, _) in enumerate(self.structs)}
+        self._layouts = {}
+
+    def field_size(self, type_index, name):
+        """ size in bytes of a field including its array dimensions """
+        if name.startswith("*") or name.startswith("(*"):
+            size = self.pointer_size
+        else:
+            size = self.lengths[type_index]
+
+        for dimension in re.findall(r"\[(\d+)\]", name):
+            size *= int(dimension)
+        return size
+
+    def layout(self, struct_name):
+        """ field name -> Field(offset, size, type name, pointer) of a struct """
+        if struct_name not in self._layouts:
+            layout = {}
+            offset = 0
+            for type_index, name_index in self.structs[self.struct_index[struct_name]][1]:
+                name = self.names[name_index]
+                size = self.field_size(type_index, name)
+                base = re.sub(r"[\*\(\)]|\[.*", "", name)
+                pointer = name.startswith("*") or name.startswith("(*")
+                layout[base] = Field(offset, size, self.types[type_index], pointer)
+                offset += size
+            self._layouts[struct_name] = layout
+        return self._layouts[struct_name]
+
+class BlendFile:
+    """ read only view of the blocks of a .blend file
+
+        with BlendFile(filepath) as blend:
+            blend.id_names('OB')
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self._file = open(filepath, 'rb')
+        self._mmap = None
+
+        magic = self._file.read(4)
+        self._file.seek(0)
+        if magic[:2] == GZIP_MAGIC or magic == ZSTD_MAGIC:
+            self.data = decompress(self._file, magic[:2] if magic[:2] == GZIP_MAGIC else magic)
+            self.compressed = True
+        else:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.data = self._mmap
+            self.compressed = False
+
+        try:
+            self.read_header()
+            self.read_blocks()
+        except (struct.error, ValueError, IndexError) as e:
+            self.close()
+            raise BlendFileError("Invalid blendfile {}: {}".format(filepath, e))
+
+    def read_header(self):
+        data = self.data
+        if data[:7] != b"BLENDER":
+            self.close()
+            raise BlendFileError("Not a blendfile: {}".format(self.filepath))
+
+        if data[7:8] in (b"_", b"-"):
+            # BLENDER-v283: pointer size, endianness, version
+            self.pointer_size = 8 if data[7:8] == b"-" else 4
+            self.endian = "<" if data[8:9] == b"v" else ">"
+            self.version = int(data[9:12])
+            self.header_size = 12
+            self.large_bheads = False
+        else:
+            # BLENDER17-01v0500: header size, format version, endianness, version
+            self.header_size = int(data[7:9])
+            self.pointer_size = 8
+            self.endian = "<" if data[12:13] == b"v" else ">"
+            self.version = int(data[13:self.header_size])
+            self.large_bheads = True
+
+        if self.large_bheads:
+            # code, sdna, old pointer, length, count
+            self._bhead = struct.Struct(self.endian + "4siQqq")
+        elif self.pointer_size == 8:
+            # code, length, old pointer, sdna, count
+            self._bhead = struct.Struct(self.endian + "4siQii")
+        else:
+            self._bhead = struct.Struct(self.endian + "4siIii")
+
+    def read_blocks(self):
+        """ reads all block headers up to ENDB and the SDNA """
+        self.blocks = []
+        self.sdna = None
+        self._by_address = None
+
+        data = self.data
+        bhead = self._bhead
+        offset = self.header_size
+        end = len(data)
+
+        while offset + bhead.size <= end:
+            fields = bhead.unpack_from(data, offset)
+            offset += bhead.size
+
+            if self.large_bheads:
+                code, sdna, old, size, count = fields
+            else:
+                code, size, old, sdna, count = fields
+
+            if code == b"ENDB":
+                break
+
+            if code == b"DNA1":
+                self.sdna = SDNA(data, offset, self.endian, self.pointer_size)
+            elif code != b"DATA":
+                self.blocks.append(BlockHeader(code.rstrip(b"\0").decode('ascii', 'replace'),
+                    sdna, old, size, count, offset))
+
+            offset += size
+
+        if self.sdna is None:
+            raise BlendFileError("No SDNA block in {}".format(self.filepath))
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self.data = b""
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def read_string(self, block, struct_name, field):
+        """ null terminated string field of the struct stored in a block """
+        offset, size, _, _ = self.sdna.layout(struct_name)[field]
+        start = block.offset + offset
+        raw = self.data[start:start + size]
+        return raw[:raw.find(b"\0") if b"\0" in raw else size].decode('utf-8', 'replace')
+
+    def read_field(self, block, struct_name, field, index=0):
+        """ values of a numeric or pointer field of the index-th struct in a block """
+        offset, size, type_name, pointer = self.sdna.layout(struct_name)[field]
+        if pointer:
+            fmt = "Q" if self.pointer_size == 8 else "I"
+        else:
+            fmt = TYPE_FORMATS[type_name]
+
+        start = block.offset + index * self.struct_size(struct_name) + offset
+        count = size // struct.calcsize(fmt)
+        return struct.unpack_from("{}{}{}".format(self.endian, count, fmt), self.data, start)
+
+    def has_field(self, struct_name, field):
+        return struct_name in self.sdna.struct_index and field in self.sdna.layout(struct_name)
+
+    def struct_size(self, struct_name):
+        return self.sdna.lengths[self.sdna.structs[self.sdna.struct_index[struct_name]][0]]
+
+    def find_block(self, address):
+        """ block stored at an old memory address, None for null or unknown pointers """
+        if address == 0:
+            return None
+
+        # index all blocks including DATA only once pointers are followed
+        if self._by_address is None:
+            self._by_address = {}
+            data = self.data
+            bhead = self._bhead
+            offset = self.header_size
+            while offset + bhead.size <= len(data):
+                fields = bhead.unpack_from(data, offset)
+                offset += bhead.size
+                if self.large_bheads:
+                    code, sdna, old, size, count = fields
+                else:
+                    code, size, old, sdna, count = fields
+                if code == b"ENDB":
+                    break
+                self._by_address[old] = BlockHeader(code.rstrip(b"\0").decode('ascii', 'replace'),
+                        sdna, old, size, count, offset)
+                offset += size
+
+        return self._by_address.get(address)
+
+    def iter_listbase(self, block, struct_name, field, item_struct):
+        """ blocks of the items of a ListBase field, item structs start with next """
+        first, = self.read_field(block, struct_name, field)[:1]
+        item = self.find_block(first)
+        while item is not None:
+            yield item
+            item = self.find_block(self.read_field(item, item_struct, 'next')[0])
+
+    def block_struct(self, block):
+        return self.sdna.types[self.sdna.structs[block.sdna][0]]
+
+    def id_blocks(self, code):
+        """ blocks of the local datablocks of an ID code, e.g. 'OB' """
+        return [block for block in self.blocks if block.code == code]
+
+    def id_name(self, block):
+        """ name of the datablock stored in the block, without the ID code """
+        # every ID struct starts with its ID
+        return self.read_string(block, 'ID', 'name')[2:]
+
+    def id_names(self, code):
+        return [self.id_name(block) for block in self.id_blocks(code)]
+
+    def datablocks(self):
+        """ dict of bpy.data collection name -> datablock names, like data_from of libraries.load """
+        names = {}
+        for block in self.blocks:
+            if block.code in ID_CODES:
+                names.setdefault(ID_CODES[block.code], []).append(self.id_name(block))
+        return names
+
+    def libraries(self):
+        """ paths of the linked libraries as stored in the file """
+        layout = self.sdna.layout('Library')
+        # 3.0 renamed the stored path from name to filepath
+        field = 'filepath' if 'filepath_abs' in layout else 'name'
+        return [self.read_string(block, 'Library', field) for block in self.id_blocks('LI')]
+
+    def images(self):
+        """ (name, filepath) of the images as stored in the file """
+        layout = self.sdna.layout('Image')
+        field = 'filepath' if 'filepath' in layout else 'name'
+        return [(self.id_name(block), self.read_string(block, 'Image', field))
+                for block in self.id_blocks('IM')]
+
+    def preview(self):
+        """ (width, height, rgba bytes) of the file thumbnail, None if there is none
+            rows are stored bottom up
+        """
+        for block in self.blocks:
+            if block.code == 'TEST':
+                width, height = struct.unpack_from(self.endian + "ii", self.data, block.offset)
+                start = block.offset + 8
+                return width, height, bytes(self.data[start:start + width * height * 4])
+        return None
+
+    def write_preview(self, filepath):
+        """ saves the file thumbnail as png, returns False if there is none """
+        preview = self.preview()
+        if preview is None:
+            return False
+
+        width, height, pixels = preview
+        stride = width * 4
+        # flip the rows, png stores them top down
+        raw = b"".join(b"\0" + pixels[row * stride:(row + 1) * stride] for row in reversed(range(height)))
+
+        def chunk(tag, content):
+            return (struct.pack(">I", len(content)) + tag + content
+                    + struct.pack(">I", zlib.crc32(tag + content) & 0xffffffff))
+
+        with open(filepath, 'wb') as png:
+            png.write(b"\x89PNG\r\n\x1a\n")
+            png.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)))
+            png.write(chunk(b"IDAT", zlib.compress(raw, 6)))
+            png.write(chunk(b"IEND", b""))
+        return True
+
+    def mesh_positions(self, mesh):
+        """ vertex positions of a mesh block as a flat tuple of floats """
+        vertex_count = self.read_field(mesh, 'Mesh', 'totvert' if self.has_field('Mesh', 'totvert') else 'verts_num')[0]
+        if vertex_count == 0:
+            return ()
+
+        if self.has_field('Mesh', 'mvert'):
+            # up to 3.4 positions are the first member of the MVert structs
+            block = self.find_block(self.read_field(mesh, 'Mesh', 'mvert')[0])
+            stride = self.struct_size('MVert')
+        else:
+            # from 3.5 on positions are the float3 "position" vertex attribute
+            block = None
+            vdata = self.sdna.layout('Mesh')['vdata'].offset
+            layers_field = self.sdna.layout('CustomData')['layers']
+            layers = self.find_block(struct.unpack_from(
+                self.endian + ("Q" if self.pointer_size == 8 else "I"),
+                self.data, mesh.offset + vdata + layers_field.offset)[0])
+            for i in range(layers.count if layers is not None else 0):
+                start = (layers.offset + i * self.struct_size('CustomDataLayer')
+                        + self.sdna.layout('CustomDataLayer')['name'].offset)
+                name = self.data[start:start + 64]
+                if name.split(b"\0")[0] == b"position":
+                    block = self.find_block(self.read_field(layers, 'CustomDataLayer', 'data', i)[0])
+                    break
+            stride = 12
+
+        if block is None:
+            return ()
+
+        count = min(vertex_count, block.size // stride)
+        fmt = self.endian + "3f" + ("{}x".format(stride - 12) if stride > 12 else "")
+        buffer = memoryview(self.data)[block.offset:block.offset + count * stride]
+        try:
+            return [value for vertex in struct.iter_unpack(fmt, buffer) for value in vertex]
+        finally:
+            buffer.release()
+
+    def mesh_polycount(self, mesh):
+        return self.read_field(mesh, 'Mesh', 'totpoly' if self.has_field('Mesh', 'totpoly') else 'faces_num')[0]
+
+    def object_matrix(self, obj):
+        """ world matrix of an object block as 16 floats, column major """
+        for field in ('obmat', 'object_to_world'):
+            if self.has_field('Object', field):
+                return self.read_field(obj, 'Object', field)
+
+        # no stored matrix, use location and scale
+        x, y, z = self.read_field(obj, 'Object', 'loc')
+        sx, sy, sz = self.read_field(obj, 'Object', 'scale' if self.has_field('Object', 'scale') else 'size')
+        return (sx, 0, 0, 0, 0, sy, 0, 0, 0, 0, sz, 0, x, y, z, 1)
+
+    def object_stats(self, obj):
+        """ polycount and world space (min, max) bounds of an object block
+            bounds are None for objects without mesh data
+        """
+        data = self.find_block(self.read_field(obj, 'Object', 'data')[0])
+        if data is None or data.code != 'ME':
+            return 0, None
+
+        positions = self.mesh_positions(data)
+        if not positions:
+            return self.mesh_polycount(data), None
+
+        xs, ys, zs = positions[0::3], positions[1::3], positions[2::3]
+        corners = [(x, y, z)
+                for x in (min(xs), max(xs))
+                for y in (min(ys), max(ys))
+                for z in (min(zs), max(zs))]
+
+        m = self.object_matrix(obj)
+        world = [tuple(m[i] * x + m[4 + i] * y + m[8 + i] * z + m[12 + i] for i in range(3))
+                for x, y, z in corners]
+
+        bounds = (tuple(min(c[i] for c in world) for i in range(3)),
+                tuple(max(c[i] for c in world) for i in range(3)))
+        return self.mesh_polycount(data), bounds
+
+    def collection_objects(self, collection, seen=None):
+        """ object blocks of a collection block and its child collections """
+        seen = set() if seen is None else seen
+        if collection.old in seen:
+            return []
+        seen.add(collection.old)
+
+        objects = []
+        for item in self.iter_listbase(collection, 'Collection', 'gobject', 'CollectionObject'):
+            obj = self.find_block(self.read_field(item, 'CollectionObject', 'ob')[0])
+            if obj is not None:
+                objects.append(obj)
+
+        for item in self.iter_listbase(collection, 'Collection', 'children', 'CollectionChild'):
+            child = self.find_block(self.read_field(item, 'CollectionChild', 'collection')[0])
+            if child is not None:
+                objects += self.collection_objects(child, seen)
+
+        return objects
+
+    def summary(self):
+        """ json serializable description of the file contents """
+        preview = self.preview()
+        return {
+                'filepath': self.filepath,
+                'version': self.version,
+                'compressed': self.compressed,
+                'datablocks': self.datablocks(),
+                'libraries': self.libraries(),
+                'images': [{'name': name, 'filepath': path} for name, path in self.images()],
+                'preview': [preview[0], preview[1]] if preview is not None else None,
+                }
+
+def read_datablocks(filepath):
+    """ datablock names by bpy.data collection name of a blendfile """
+    with BlendFile(filepath) as blend:
+        return blend.datablocks()
+
+def find_blendfiles(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    if name.endswith(".blend"):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+def benchmark(paths, repeat=5):
+    """ prints the time it takes to open each file and list its contents """
+    timings = []
+    for filepath in find_blendfiles(paths):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            try:
+                with BlendFile(filepath) as blend:
+                    blend.summary()
+            except BlendFileError as e:
+                print("{}: {}".format(filepath, e))
+                break
+            duration = time.perf_counter() - start
+            best = duration if best is None else min(best, duration)
+
+        if best is not None:
+            timings.append(best)
+            print("{:8.2f} ms  {:8.1f} KB  {}".format(best * 1000, os.path.getsize(filepath) / 1024, filepath))
+
+    if timings:
+        print("{} files, {:.2f} ms total, {:.2f} ms mean".format(
+            len(timings), sum(timings) * 1000, sum(timings) / len(timings) * 1000))
+
+def main(arguments):
+    if "--benchmark" in arguments:
+        arguments = [a for a in arguments if a != "--benchmark"]
+        repeat = 5
+        if "--repeat" in arguments:
+            index = arguments.index("--repeat")
+            repeat = int(arguments[index + 1])
+            del arguments[index:index + 2]
+        benchmark(arguments, repeat)
+        return 0
+
+    as_json = "--json" in arguments
+    status = 0
+    for filepath in find_blendfiles([a for a in arguments if a != "--json"]):
+        try:
+            with BlendFile(filepath) as blend:
+                summary = blend.summary()
+        except (OSError, BlendFileError) as e:
+            print("{}: {}".format(filepath, e), file=sys.stderr)
+            status = 1
+            continue
+
+        if as_json:
+            print(json.dumps(summary, indent=2))
+            continue
+
+        print("{} (blender {}{})".format(filepath, summary['version'], ", compressed" if summary['compressed'] else ""))
+        for collection, names in sorted(summary['datablocks'].items()):
+            print("  {}: {}".format(collection, ", ".join(names)))
+        for library in summary['libraries']:
+            print("  library: {}".format(library))
+        for image in summary['images']:
+            print("  image: {} ({})".format(image['name'], image['filepath']))
+        if summary['preview'] is not None:
+            print("  preview: {}x{}".format(*summary['preview']))
+
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
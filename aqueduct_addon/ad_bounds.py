@@ -0,0 +1,200 @@
+# World space bounds
+#
+# Axis aligned world bounds of all objects, computed at once with NumPy from
+# matrix_world and bound_box read through foreach_get. The local bounds are
+# cached per object until a depsgraph update changes their geometry. World
+# matrices are read again on every query, a single foreach_get, so objects
+# moved without a depsgraph update still get the right bounds.
+import numpy as np
+
+import bpy
+
+from bpy.app.handlers import persistent
+from mathutils import Vector
+
+# face of the bounds -> (axis, 0 for the min side, 1 for the max side)
+FACES = {
+        '-X': (0, 0),
+        'X': (0, 1),
+        '-Y': (1, 0),
+        'Y': (1, 1),
+        '-Z': (2, 0),
+        'Z': (2, 1),
+        }
+
+def read_matrices(objects):
+    """ world matrices of a bpy.data.objects like collection as (n, 4, 4) array """
+    matrices = np.empty(len(objects) * 16, dtype=np.float64)
+    objects.foreach_get('matrix_world', matrices)
+    # blender stores matrices column by column
+    return matrices.reshape(-1, 4, 4).transpose(0, 2, 1)
+
+def transform_bounds(matrices, corners):
+    """ min and max of the corners (n, 8, 3) transformed by the matrices (n, 4, 4) """
+    world = np.einsum('nij,nkj->nki', matrices[:, :3, :3], corners) + matrices[:, None, :3, 3]
+    return world.min(axis=1), world.max(axis=1)
+
+class BoundsCache:
+    """ world bounds of the objects of bpy.data.objects """
+
+    def __init__(self):
+        self.index = None
+        self.pointers = None
+        self.stale = set()
+
+    def invalidate(self):
+        self.index = None
+
+    def rebuild(self):
+        objects = bpy.data.objects
+        self.pointers = [obj.as_pointer() for obj in objects]
+        self.index = {pointer: i for i, pointer in enumerate(self.pointers)}
+
+        corners = np.empty(len(objects) * 24, dtype=np.float64)
+        objects.foreach_get('bound_box', corners)
+        self.corners = corners.reshape(-1, 8, 3)
+
+        self.matrices = read_matrices(objects)
+        self.min, self.max = transform_bounds(self.matrices, self.corners)
+        self.stale.clear()
+
+    def refresh(self):
+        """ brings the cached bounds up to date with the objects """
+        objects = bpy.data.objects
+
+        # Case: Objects got added, removed or renamed, bpy.data.objects is sorted by name
+        if self.index is None or [obj.as_pointer() for obj in objects] != self.pointers:
+            self.rebuild()
+            return
+
+        rows = set()
+        for pointer in self.stale:
+            row = self.index.get(pointer)
+            if row is None:
+                self.rebuild()
+                return
+            self.corners[row] = [tuple(corner) for corner in objects[row].bound_box]
+            rows.add(row)
+        self.stale.clear()
+
+        matrices = read_matrices(objects)
+        moved = np.nonzero((matrices != self.matrices).any(axis=(1, 2)))[0]
+        rows.update(moved.tolist())
+
+        if rows:
+            rows = np.array(sorted(rows), dtype=np.int64)
+            self.matrices[rows] = matrices[rows]
+            self.min[rows], self.max[rows] = transform_bounds(self.matrices[rows], self.corners[rows])
+
+    def rows(self, objects):
+        rows = [self.index.get(obj.as_pointer()) for obj in objects]
+        # Case: Object the cache doesn't know yet
+        if None in rows:
+            self.rebuild()
+            rows = [self.index[obj.as_pointer()] for obj in objects]
+        return np.array(rows, dtype=np.int64)
+
+    def bounds(self, objects):
+        """ world min and max of each object as two (n, 3) arrays """
+        self.refresh()
+        rows = self.rows(objects)
+        return self.min[rows], self.max[rows]
+
+    def update(self, depsgraph):
+        """ called after depsgraph updates, marks objects with changed geometry """
+        if self.index is None:
+            return
+
+        for update in depsgraph.updates:
+            block = update.id
+            if isinstance(block, bpy.types.Object):
+                if update.is_updated_geometry:
+                    self.stale.add(block.original.as_pointer())
+            elif isinstance(block, (bpy.types.Mesh, bpy.types.Curve, bpy.types.Collection)):
+                # don't know which objects use it
+                self.index = None
+                return
+
+cache = BoundsCache()
+
+def object_bounds(objects):
+    """ world min and max of each object as two (n, 3) arrays """
+    return cache.bounds(objects)
+
+def group_min_max(objects):
+    """ world min and max of a group of objects
+        returns a tuple of 2 mathutils.Vector
+    """
+    mins, maxs = cache.bounds(objects)
+    return Vector(mins.min(axis=0)), Vector(maxs.max(axis=0))
+
+def face_center(extents, axis):
+    """ center of a side of the bounds, CENTER for the center of the bounds
+        returns the location in worldspace as mathutils.Vector, False for unknown sides
+    """
+    ws_min, ws_max = extents
+    center = (Vector(ws_min) + Vector(ws_max)) / 2
+
+    if axis == 'CENTER':
+        return center
+    if axis not in FACES:
+        return False
+
+    index, side = FACES[axis]
+    center[index] = (ws_min, ws_max)[side][index]
+    return center
+
+def tight_bounds(objects, depsgraph):
+    """ world min and max of the evaluated geometry of a group of objects
+        objects without geometry count with their bound box
+        returns a tuple of 2 mathutils.Vector
+    """
+    mins = []
+    maxs = []
+    for obj in objects:
+        obj_eval = obj.evaluated_get(depsgraph)
+        matrix = np.array(obj_eval.matrix_world, dtype=np.float64)
+
+        mesh = None
+        if obj_eval.type == 'MESH':
+            mesh = obj_eval.data
+        elif obj_eval.type in {'CURVE', 'SURFACE', 'FONT', 'META'}:
+            mesh = obj_eval.to_mesh()
+
+        if mesh is not None and len(mesh.vertices) != 0:
+            points = np.empty(len(mesh.vertices) * 3, dtype=np.float64)
+            mesh.vertices.foreach_get('co', points)
+            points = points.reshape(-1, 3)
+        else:
+            points = np.array([tuple(corner) for corner in obj_eval.bound_box], dtype=np.float64)
+
+        if obj_eval.type != 'MESH' and mesh is not None:
+            obj_eval.to_mesh_clear()
+
+        world = points @ matrix[:3, :3].T + matrix[:3, 3]
+        mins.append(world.min(axis=0))
+        maxs.append(world.max(axis=0))
+
+    return Vector(np.min(mins, axis=0)), Vector(np.max(maxs, axis=0))
+
+@persistent
+def depsgraph_update(scene, depsgraph=None):
+    # Case: Handler without the depsgraph (before 2.81)
+    if depsgraph is None:
+        cache.invalidate()
+        return
+    cache.update(depsgraph)
+
+@persistent
+def load_post(*args):
+    cache.invalidate()
+
+def register():
+    bpy.app.handlers.depsgraph_update_post.append(depsgraph_update)
+    bpy.app.handlers.load_post.append(load_post)
+
+def unregister():
+    if depsgraph_update in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.remove(depsgraph_update)
+    if load_post in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(load_post)
@@ -0,0 +1,307 @@
+# Library catalog
+#
+# SQLite index of the .blend files in the library folder: their datablocks,
+# poly counts, bounds, texture references, thumbnails and content hashes.
+# Files are read with ad_blendfile on several processes, rescans only read
+# files whose mtime or size changed. Runs without blender:
+#
+#   python ad_catalog.py scan <library folder> <database> [--processes N]
+#   python ad_catalog.py search <database> <pattern> [--type materials]
+import os
+import sys
+import time
+import struct
+import sqlite3
+import hashlib
+
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from . import ad_blendfile
+except ImportError:
+    # run as a script
+    import ad_blendfile
+
+# name of the database kept in the library folder if no other path is set
+CATALOG_NAME = "aqueduct_catalog.db"
+
+THUMBNAIL_EXTENSIONS = (".png", ".jpg")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    version INTEGER,
+    thumbnail TEXT,
+    error TEXT,
+    scanned REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS datablocks (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    type TEXT NOT NULL,
+    name TEXT NOT NULL,
+    polycount INTEGER,
+    min_x REAL, min_y REAL, min_z REAL,
+    max_x REAL, max_y REAL, max_z REAL
+);
+CREATE TABLE IF NOT EXISTS refs (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    type TEXT NOT NULL,
+    name TEXT,
+    path TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS datablocks_name ON datablocks(name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS datablocks_type_name ON datablocks(type, name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS datablocks_file ON datablocks(file_id);
+CREATE INDEX IF NOT EXISTS refs_file ON refs(file_id);
+CREATE INDEX IF NOT EXISTS refs_path ON refs(path);
+"""
+
+# datablock types that are part of every file and not worth indexing
+SKIPPED_TYPES = {'brushes', 'workspaces', 'linestyles', 'palettes', 'screens'}
+
+def connect(database):
+    conn = sqlite3.connect(database, timeout=30)
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+def content_hash(filepath):
+    """ same digest as ad_hash.file_hash """
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def find_thumbnail(filepath):
+    for extension in THUMBNAIL_EXTENSIONS:
+        path = os.path.splitext(filepath)[0] + extension
+        if os.path.exists(path):
+            return path
+    return ""
+
+def union_bounds(bounds):
+    bounds = [b for b in bounds if b is not None]
+    if not bounds:
+        return None
+    return (tuple(min(b[0][i] for b in bounds) for i in range(3)),
+            tuple(max(b[1][i] for b in bounds) for i in range(3)))
+
+def scan_file(filepath):
+    """ reads the catalog entry of a blendfile, runs in the scanner processes """
+    stat = os.stat(filepath)
+    entry = {
+            'path': filepath,
+            'mtime': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'hash': content_hash(filepath),
+            'thumbnail': find_thumbnail(filepath),
+            'version': None,
+            'error': None,
+            'datablocks': [],
+            'refs': [],
+            }
+
+    try:
+        with ad_blendfile.BlendFile(filepath) as blend:
+            entry['version'] = blend.version
+
+            stats = {}
+            for block in blend.id_blocks('OB'):
+                stats[block.old] = blend.object_stats(block)
+
+            for block in blend.blocks:
+                datatype = ad_blendfile.ID_CODES.get(block.code)
+                if datatype is None or datatype in SKIPPED_TYPES:
+                    continue
+
+                polycount, bounds = None, None
+                if block.code == 'OB':
+                    polycount, bounds = stats[block.old]
+                elif block.code == 'GR':
+                    objects = [stats[obj.old] for obj in blend.collection_objects(block) if obj.old in stats]
+                    polycount = sum(s[0] for s in objects)
+                    bounds = union_bounds(s[1] for s in objects)
+                elif block.code == 'ME':
+                    polycount = blend.mesh_polycount(block)
+
+                entry['datablocks'].append((datatype, blend.id_name(block), polycount, bounds))
+
+            for name, path in blend.images():
+                if path != "":
+                    entry['refs'].append(('IMAGE', name, path))
+            for path in blend.libraries():
+                entry['refs'].append(('LIBRARY', None, path))
+    except (ad_blendfile.BlendFileError, KeyError, struct.error) as e:
+        entry['error'] = str(e)
+
+    return entry
+
+def find_blendfiles(folder):
+    for root, dirs, files in os.walk(folder):
+        # skip hidden folders
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for name in files:
+            if name.endswith(".blend"):
+                yield os.path.join(root, name)
+
+def store_entry(conn, entry):
+    conn.execute("DELETE FROM files WHERE path = ?", (entry['path'],))
+    cursor = conn.execute(
+            "INSERT INTO files (path, mtime, size, hash, version, thumbnail, error, scanned) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (entry['path'], entry['mtime'], entry['size'], entry['hash'], entry['version'],
+                entry['thumbnail'], entry['error'], time.time()))
+    file_id = cursor.lastrowid
+
+    conn.executemany(
+            "INSERT INTO datablocks (file_id, type, name, polycount, min_x, min_y, min_z, max_x, max_y, max_z) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(file_id, datatype, name, polycount) + (bounds[0] + bounds[1] if bounds else (None,) * 6)
+                for datatype, name, polycount, bounds in entry['datablocks']])
+    conn.executemany(
+            "INSERT INTO refs (file_id, type, name, path) VALUES (?, ?, ?, ?)",
+            [(file_id,) + ref for ref in entry['refs']])
+
+def scan(folder, database, processes=0, progress=None):
+    """ brings the catalog of folder up to date
+        only files that are new or changed in mtime or size get read
+        returns the number of added/updated, unchanged and removed files
+    """
+    conn = connect(database)
+    known = {path: (mtime, size) for path, mtime, size in conn.execute("SELECT path, mtime, size FROM files")}
+
+    stale = []
+    found = set()
+    for filepath in find_blendfiles(folder):
+        found.add(filepath)
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            continue
+        if known.get(filepath) != (stat.st_mtime_ns, stat.st_size):
+            stale.append(filepath)
+
+    removed = [path for path in known if path not in found and path.startswith(folder)]
+    with conn:
+        conn.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in removed])
+
+    processes = processes or os.cpu_count() or 1
+    if stale:
+        with ProcessPoolExecutor(max_workers=min(processes, len(stale))) as executor:
+            for i, entry in enumerate(executor.map(scan_file, stale, chunksize=8)):
+                with conn:
+                    store_entry(conn, entry)
+                if progress is not None:
+                    progress(i + 1, len(stale))
+
+    conn.close()
+    return len(stale), len(found) - len(stale), len(removed)
+
+def update_files(database, paths):
+    """ updates the entries of single files, removed files get dropped
+        returns the entries that were read again
+    """
+    conn = connect(database)
+    entries = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            with conn:
+                conn.execute("DELETE FROM files WHERE path = ?", (path,))
+            continue
+
+        known = conn.execute("SELECT mtime, size FROM files WHERE path = ?", (path,)).fetchone()
+        if known != (stat.st_mtime_ns, stat.st_size):
+            entry = scan_file(path)
+            with conn:
+                store_entry(conn, entry)
+            entries.append(entry)
+
+    conn.close()
+    return entries
+
+def remove_folder(database, folder):
+    """ drops the entries of all files below folder """
+    conn = connect(database)
+    with conn:
+        conn.execute("DELETE FROM files WHERE substr(path, 1, ?) = ?",
+                (len(folder) + 1, os.path.join(folder, "")))
+    conn.close()
+
+def move_path(database, source, destination):
+    """ renames the entry of a moved file, or of all files below a moved folder """
+    conn = connect(database)
+    prefix = os.path.join(source, "")
+    with conn:
+        conn.execute("DELETE FROM files WHERE path = ?", (destination,))
+        conn.execute("UPDATE files SET path = ? WHERE path = ?", (destination, source))
+        conn.execute("UPDATE files SET path = ? || substr(path, ?) WHERE substr(path, 1, ?) = ?",
+                (os.path.join(destination, ""), len(prefix) + 1, len(prefix), prefix))
+    conn.close()
+
+def glob_to_like(pattern):
+    """ turns a *brick* style pattern into a LIKE pattern """
+    escaped = pattern.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    like = escaped.replace("*", "%").replace("?", "_")
+    if "*" not in pattern and "?" not in pattern:
+        like = "%" + like + "%"
+    return like
+
+def search(database, pattern, datatype=None, limit=500):
+    """ datablocks with names matching pattern, case insensitive
+        returns rows of (type, name, path, thumbnail, polycount)
+    """
+    conn = connect(database)
+    query = ("SELECT d.type, d.name, f.path, f.thumbnail, d.polycount FROM datablocks d "
+            "JOIN files f ON f.id = d.file_id WHERE d.name LIKE ? ESCAPE '\\'")
+    arguments = [glob_to_like(pattern)]
+    if datatype is not None:
+        query += " AND d.type = ?"
+        arguments.append(datatype)
+    query += " ORDER BY d.name COLLATE NOCASE LIMIT ?"
+    arguments.append(limit)
+
+    rows = conn.execute(query, arguments).fetchall()
+    conn.close()
+    return rows
+
+def main(arguments):
+    if len(arguments) >= 3 and arguments[0] == 'scan':
+        processes = 0
+        if "--processes" in arguments:
+            processes = int(arguments[arguments.index("--processes") + 1])
+
+        def progress(done, total):
+            print("PROGRESS {} {}".format(done, total), flush=True)
+
+        start = time.time()
+        updated, unchanged, removed = scan(os.path.abspath(arguments[1]), arguments[2], processes, progress)
+        print("Scanned in {:.2f}s: {} updated, {} unchanged, {} removed".format(
+            time.time() - start, updated, unchanged, removed))
+        return 0
+
+    if len(arguments) >= 3 and arguments[0] == 'search':
+        datatype = None
+        if "--type" in arguments:
+            datatype = arguments[arguments.index("--type") + 1]
+        start = time.time()
+        rows = search(arguments[1], arguments[2], datatype)
+        for datatype, name, path, _, polycount in rows:
+            print("{:12} {:32} {:>8} {}".format(datatype, name, polycount if polycount is not None else "", path))
+        print("{} results in {:.1f} ms".format(len(rows), (time.time() - start) * 1000))
+        return 0
+
+    print("usage: ad_catalog.py scan <folder> <database> [--processes N]")
+    print("       ad_catalog.py search <database> <pattern> [--type materials]")
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -4,7 +4,13 @@ import bpy
 import bpy.utils.previews
 
 from bpy.types import Operator, Menu, AddonPreferences, UIList, PropertyGroup
-from bpy.props import StringProperty, EnumProperty, IntProperty, CollectionProperty, IntProperty
+from bpy.props import StringProperty, EnumProperty, IntProperty, CollectionProperty, BoolProperty
+
+from .ad_textures import LINK_MODES
+from .ad_raycast import RAYCAST_METHODS
+from .ad_thumbcache import QUALITY_TIERS, IMAGE_FORMATS
+from . import ad_ops_catalog
+from . import ad_watcher
 
 def make_path_absolute(key):
     props = bpy.context.preferences.addons[__package__].preferences
@@ -49,7 +55,7 @@ class AD_Preferences(AddonPreferences):
     AD_library_path : StringProperty(
             default="",
             subtype="DIR_PATH",
-            update=lambda s,c: make_path_absolute('AD_library_path')
+            update=lambda s,c: (make_path_absolute('AD_library_path'), ad_watcher.update_watcher(s, c))
                 )
 
     # Studio paths
@@ -70,6 +76,122 @@ class AD_Preferences(AddonPreferences):
             min=150,
             max=500,
             subtype='PIXEL')
+    AD_thumbnail_quality : EnumProperty(
+            name="Quality",
+            description="Quality tier of rendered thumbnails",
+            items=QUALITY_TIERS,
+            default='STANDARD')
+    AD_thumbnail_pyramid : StringProperty(
+            name="Sizes",
+            description="Comma separated sizes of scaled down thumbnails written from each render, empty for none",
+            default="")
+    AD_thumbnail_formats : EnumProperty(
+            name="Formats",
+            description="Formats of the scaled down thumbnails",
+            items=IMAGE_FORMATS,
+            options={'ENUM_FLAG'},
+            default={'PNG'})
+    AD_thumbnail_cache : BoolProperty(
+            name="Cache thumbnails",
+            description="Reuse thumbnails of unchanged files rendered with the same studio file and size",
+            default=True)
+    AD_thumbnail_cache_size : IntProperty(
+            name="Cache size",
+            description="Remove the least recently used thumbnails once the cache grows beyond this (MB)",
+            default=256,
+            min=1)
+    AD_render_batch_size : IntProperty(
+            name="Renders per batch",
+            description="Thumbnails a worker renders in one studio session before the next batch",
+            default=50,
+            min=1)
+    AD_thumbnail_sheet : BoolProperty(
+            name="Contact sheets",
+            description="Render object thumbnails in a grid with one orthographic render per sheet and cut them apart",
+            default=False)
+    AD_sheet_columns : IntProperty(
+            name="Sheet columns",
+            description="Thumbnails per row of a contact sheet, a sheet holds columns x columns thumbnails",
+            default=4,
+            min=1,
+            max=16)
+
+    # Library catalog
+    AD_catalog_path : StringProperty(
+            name="Catalog database",
+            description="SQLite catalog of the library, empty keeps it in the library folder",
+            default="",
+            subtype='FILE_PATH',
+            update=lambda s,c: make_path_absolute('AD_catalog_path'))
+
+    AD_watch_library : BoolProperty(
+            name="Watch library folder",
+            description="Keep the catalog and batch list up to date when files in the library change",
+            default=False,
+            update=lambda s,c: ad_watcher.update_watcher(s, c))
+    AD_watch_thumbnails : BoolProperty(
+            name="Rerender stale thumbnails",
+            description="Queue thumbnails of changed library files in the background",
+            default=True)
+
+    # Texture packaging
+    AD_texture_store : BoolProperty(
+            name="Shared texture store",
+            description="Keep each packaged texture once in a library-wide folder, named by its content",
+            default=False)
+    AD_texture_store_path : StringProperty(
+            name="Texture store",
+            description="Folder of the texture store, empty uses texture_store in the library folder",
+            default="",
+            subtype='DIR_PATH',
+            update=lambda s,c: make_path_absolute('AD_texture_store_path'))
+    AD_texture_link_mode : EnumProperty(
+            name="Link mode",
+            description="How packaged files reference the stored textures",
+            items=LINK_MODES,
+            default='HARDLINK')
+
+    # Modal tools
+    AD_raycast_method : EnumProperty(
+            name="Raycast",
+            description="How the modal tools find the object under the mouse",
+            items=RAYCAST_METHODS,
+            default='BVH')
+    AD_modal_budget : IntProperty(
+            name="Update budget",
+            description="Time the modal tools may spend per update, mouse moves in between get combined (ms)",
+            default=16,
+            min=1,
+            max=200)
+    AD_modal_timing : BoolProperty(
+            name="Show update timing",
+            description="Show how long the updates of the modal tools take in the header",
+            default=False)
+
+    # Background workers
+    AD_background_jobs : BoolProperty(
+            name="Run jobs in the background",
+            description="Keep working while exports and renders run, progress is shown in the status bar",
+            default=True)
+    AD_max_workers : IntProperty(
+            name="Parallel workers",
+            description="Background workers running at once, 0 uses one per CPU core",
+            default=0,
+            min=0)
+    AD_worker_pool : BoolProperty(
+            name="Persistent background workers",
+            description="Keep headless blender instances running between jobs",
+            default=False)
+    AD_worker_max_jobs : IntProperty(
+            name="Jobs per worker",
+            description="Restart a worker after it ran this many jobs",
+            default=50,
+            min=1)
+    AD_worker_max_memory : IntProperty(
+            name="Worker memory limit",
+            description="Restart a worker once it uses more memory than this (MB)",
+            default=4096,
+            min=256)
 
     # Recent chosen export path
     AD_export_path : StringProperty(default="")
@@ -90,6 +212,84 @@ class AD_Preferences(AddonPreferences):
         split = row.split(factor=0.23)
         split.label(text="Thumbnail size:")
         split.prop(self, 'AD_thumbnail_size', text="", slider=True)
+        row = layout.row()
+        split = row.split(factor=0.23)
+        split.label(text="Thumbnail quality:")
+        split.prop(self, 'AD_thumbnail_quality', text="")
+        row = layout.row()
+        split = row.split(factor=0.23)
+        split.label(text="Scaled thumbnails:")
+        sub = split.row()
+        sub.prop(self, 'AD_thumbnail_pyramid', text="")
+        sub.prop(self, 'AD_thumbnail_formats')
+        row = layout.row()
+        row.prop(self, 'AD_thumbnail_cache')
+        sub = row.row(align=True)
+        sub.enabled = self.AD_thumbnail_cache
+        sub.prop(self, 'AD_thumbnail_cache_size')
+        sub.operator("ad.thumbnail_cache_stats", text="", icon='INFO')
+        sub.operator("ad.thumbnail_cache_clear", text="", icon='TRASH')
+        row = layout.row()
+        row.prop(self, 'AD_render_batch_size')
+        row.prop(self, 'AD_thumbnail_sheet')
+        sub = row.row(align=True)
+        sub.enabled = self.AD_thumbnail_sheet
+        sub.prop(self, 'AD_sheet_columns')
+        row.operator("ad.thumbnail_benchmark", text="", icon='TIME')
+
+        row = layout.row()
+        row.separator()
+        row = layout.row()
+        row.label(text="Library Catalog:")
+        row = layout.row()
+        row.prop(self, 'AD_catalog_path', text="Database")
+        row = layout.row()
+        row.prop(self, 'AD_watch_library')
+        sub = row.row()
+        sub.enabled = self.AD_watch_library
+        sub.prop(self, 'AD_watch_thumbnails')
+        row = layout.row(align=True)
+        row.operator("ad.catalog_update", text="Update catalog", icon='FILE_REFRESH')
+        row.operator("ad.catalog_search", text="Search", icon='VIEWZOOM')
+        if ad_ops_catalog.status != "":
+            row = layout.row()
+            row.label(text=ad_ops_catalog.status)
+
+        row = layout.row()
+        row.separator()
+        row = layout.row()
+        row.label(text="Texture Packaging:")
+        row = layout.row()
+        row.prop(self, 'AD_texture_store')
+        row.prop(self, 'AD_texture_link_mode', text="")
+        row = layout.row()
+        row.enabled = self.AD_texture_store
+        row.prop(self, 'AD_texture_store_path', text="Store folder")
+
+        row = layout.row()
+        row.separator()
+        row = layout.row()
+        row.label(text="Modal Tools:")
+        row = layout.row(align=True)
+        row.prop(self, 'AD_raycast_method')
+        row.operator("ad.raycast_benchmark", text="", icon='TIME')
+        row = layout.row()
+        row.prop(self, 'AD_modal_budget')
+        row.prop(self, 'AD_modal_timing')
+
+        row = layout.row()
+        row.separator()
+        row = layout.row()
+        row.label(text="Background Workers:")
+        row = layout.row()
+        row.prop(self, 'AD_background_jobs')
+        row = layout.row()
+        row.prop(self, 'AD_max_workers')
+        row.prop(self, 'AD_worker_pool')
+        row = layout.row()
+        row.enabled = self.AD_worker_pool
+        row.prop(self, 'AD_worker_max_jobs')
+        row.prop(self, 'AD_worker_max_memory')
 
         row = layout.row()
         row.separator()
@@ -108,6 +308,7 @@ class AD_Preferences(AddonPreferences):
         row.operator("ad.filelist_clear", text="Clear")
         row = layout.row(align=True)
         row.operator("ad.filelist_render", text="Render")
+        row.operator("ad.filelist_upgrade", text="Upgrade")
         row.operator("ad.filelist_package", text="Package textures")
         row = layout.row()
         row.operator("ad.filelist_relocate", text="Relocate")
@@ -178,12 +379,14 @@ class VIEW3D_MT_PIE_Aqueduct(Menu):
         tools.operator("ad.material_quickapply", icon='MATERIAL')
         tools.operator("ad.object_quickplace", icon='OBJECT_ORIGIN')
         tools.operator("ad.object_quickrotate", icon='FILE_REFRESH')
+        tools.operator("ad.scatter_objects", icon='PARTICLES')
         export = pie.box()
         export.label(text="Export:")
         export.operator("ad.save_material_filedialog", icon='EXPORT')
         export.operator("ad.save_object_filedialog", icon='EXPORT')
         export.operator("ad.save_collection_filedialog", icon='EXPORT')
         pie.operator("ad.open_settings", icon='PREFERENCES')
+        pie.operator("ad.catalog_search", icon='VIEWZOOM')
 
         # other = pie.column()
         # gap = other.column()
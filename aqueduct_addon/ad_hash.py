@@ -0,0 +1,356 @@
+import os
+import json
+import hashlib
+import threading
+
+import bpy
+import numpy as np
+
+# manifest kept in export folders, maps library files to the hash they were exported from
+MANIFEST_NAME = "aqueduct_manifest.json"
+
+# (path, mtime, size) -> digest of files hashed this session
+_file_hashes = {}
+
+# attribute data type -> (property, numpy type, components) to read its values with foreach_get
+ATTRIBUTE_VALUES = {
+        'FLOAT': ('value', np.float32, 1),
+        'INT': ('value', np.int32, 1),
+        'INT8': ('value', np.int32, 1),
+        'BOOLEAN': ('value', np.bool_, 1),
+        'FLOAT2': ('vector', np.float32, 2),
+        'INT32_2D': ('value', np.int32, 2),
+        'FLOAT_VECTOR': ('vector', np.float32, 3),
+        'FLOAT_COLOR': ('color', np.float32, 4),
+        'BYTE_COLOR': ('color', np.float32, 4),
+        'QUATERNION': ('value', np.float32, 4),
+        'FLOAT4X4': ('value', np.float32, 16),
+        }
+
+def file_hash(filepath):
+    """ content hash of a file, cached as long as its mtime and size don't change
+        returns an empty string if the file doesn't exist
+    """
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        return ""
+
+    key = (os.path.abspath(filepath), stat.st_mtime_ns, stat.st_size)
+    if key not in _file_hashes:
+        hasher = hashlib.blake2b(digest_size=16)
+        with open(filepath, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(chunk)
+        _file_hashes[key] = hasher.hexdigest()
+
+    return _file_hashes[key]
+
+class HashIndex:
+    """ persistent index of file hashes stored as json at path
+
+        Entries stay valid as long as the mtime and size of the file match,
+        so looking up unchanged files doesn't need to read them.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = None
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    def load(self):
+        if self.entries is None:
+            try:
+                with open(self.path, encoding='utf-8') as indexfile:
+                    self.entries = json.load(indexfile)
+            except (OSError, ValueError):
+                self.entries = {}
+        return self.entries
+
+    def save(self):
+        # unique temp name, several processes may share the index
+        tmp = "{}.{}.tmp".format(self.path, os.getpid())
+        with self.lock:
+            with open(tmp, 'w', encoding='utf-8') as indexfile:
+                json.dump(self.load(), indexfile)
+            os.replace(tmp, self.path)
+            self.dirty = False
+
+    def flush(self):
+        """ writes the index if files were hashed without saving it """
+        if self.dirty:
+            self.save()
+
+    def clear(self):
+        self.entries = {}
+        self.save()
+
+    def digest(self, filepath, save=True):
+        """ content hash of the file, an empty string if it doesn't exist
+            save: write the index if the file had to be hashed, else flush() writes it later
+        """
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return ""
+
+        path = os.path.abspath(filepath)
+        with self.lock:
+            entry = self.load().get(path)
+        if entry is not None and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+            return entry[2]
+
+        digest = file_hash(path)
+        with self.lock:
+            self.entries[path] = [stat.st_mtime_ns, stat.st_size, digest]
+            self.dirty = True
+        if save:
+            self.save()
+
+        return digest
+
+def collection_array(collection, attribute, dtype, components=1):
+    """ reads an attribute of all items of a bpy collection into a numpy array """
+    array = np.empty(len(collection) * components, dtype=dtype)
+    collection.foreach_get(attribute, array)
+    return array
+
+class DatablockHasher:
+    """ computes stable content hashes of datablocks
+
+        Shared meshes, materials and images are only hashed once per instance.
+    """
+
+    def __init__(self):
+        self.memo = {}
+
+    def digest(self, block):
+        """ hex digest of an object, collection or material
+            data without a hasher gets a random digest, it never counts as unchanged
+        """
+        key = (type(block).__name__, block.name, block.library.filepath if block.library else "")
+        if key not in self.memo:
+            hasher = hashlib.blake2b(digest_size=16)
+            # guard against cycles, e.g. objects referencing each other
+            self.memo[key] = ""
+
+            if isinstance(block, bpy.types.Object):
+                self.hash_object(hasher, block)
+            elif isinstance(block, bpy.types.Collection):
+                self.hash_collection(hasher, block)
+            elif isinstance(block, bpy.types.Material):
+                self.hash_material(hasher, block)
+            elif isinstance(block, bpy.types.Mesh):
+                self.hash_mesh(hasher, block)
+            elif isinstance(block, bpy.types.NodeTree):
+                self.hash_nodetree(hasher, block)
+            elif isinstance(block, bpy.types.Image):
+                self.hash_image(hasher, block)
+            else:
+                # Case: No hasher knows the content, e.g. curves, texts or grease pencil,
+                # a digest that never matches exports it every time
+                hasher.update(os.urandom(16))
+
+            self.hash_idprops(hasher, block)
+            self.memo[key] = hasher.hexdigest()
+
+        return self.memo[key]
+
+    def export_digest(self, datablocks, options=()):
+        """ hex digest of a library file exported from the datablocks with options """
+        hasher = hashlib.blake2b(digest_size=16)
+        hasher.update(repr(tuple(options)).encode('utf-8'))
+        for block in sorted(datablocks, key=lambda b: b.name):
+            hasher.update(block.name.encode('utf-8'))
+            hasher.update(self.digest(block).encode('utf-8'))
+        return hasher.hexdigest()
+
+    def hash_rna(self, hasher, struct):
+        """ hashes the plain properties of a struct, datablocks by their digest """
+        for prop in struct.bl_rna.properties:
+            identifier = prop.identifier
+            if identifier == 'rna_type' or prop.type == 'COLLECTION':
+                continue
+
+            try:
+                value = getattr(struct, identifier)
+            except AttributeError:
+                continue
+
+            if prop.type == 'POINTER':
+                # only follow references to other datablocks
+                if isinstance(value, bpy.types.ID) and value != struct:
+                    value = self.digest(value)
+                else:
+                    continue
+            elif getattr(prop, 'is_array', False):
+                value = tuple(value)
+            elif isinstance(value, set):
+                # enum flags, the order of a set changes between sessions
+                value = sorted(value)
+
+            hasher.update(identifier.encode('utf-8'))
+            hasher.update(repr(value).encode('utf-8'))
+
+    def hash_idprops(self, hasher, struct):
+        """ hashes the custom properties of a struct, like the inputs of geometry nodes modifiers """
+        try:
+            names = sorted(struct.keys())
+        except TypeError:
+            # Case: Struct type without custom properties
+            return
+
+        for name in names:
+            value = struct[name]
+            if isinstance(value, bpy.types.ID):
+                value = self.digest(value)
+            elif hasattr(value, 'to_dict'):
+                value = value.to_dict()
+            elif hasattr(value, 'to_list'):
+                value = value.to_list()
+
+            hasher.update(name.encode('utf-8'))
+            hasher.update(repr(value).encode('utf-8'))
+
+    def hash_object(self, hasher, obj):
+        hasher.update(obj.type.encode('utf-8'))
+        hasher.update(np.array(obj.matrix_world, dtype=np.float32).tobytes())
+
+        if obj.data is not None:
+            hasher.update(self.digest(obj.data).encode('utf-8'))
+
+        for modifier in obj.modifiers:
+            self.hash_rna(hasher, modifier)
+            self.hash_idprops(hasher, modifier)
+
+        # the weights are part of the mesh, the names of the groups of the object
+        hasher.update(repr([group.name for group in obj.vertex_groups]).encode('utf-8'))
+
+        for slot in obj.material_slots:
+            hasher.update(slot.link.encode('utf-8'))
+            if slot.material is not None:
+                hasher.update(self.digest(slot.material).encode('utf-8'))
+
+        if obj.instance_type == 'COLLECTION' and obj.instance_collection is not None:
+            hasher.update(self.digest(obj.instance_collection).encode('utf-8'))
+
+    def hash_collection(self, hasher, collection):
+        for obj in sorted(collection.objects, key=lambda o: o.name):
+            hasher.update(obj.name.encode('utf-8'))
+            hasher.update(self.digest(obj).encode('utf-8'))
+
+        for child in sorted(collection.children, key=lambda c: c.name):
+            hasher.update(child.name.encode('utf-8'))
+            hasher.update(self.digest(child).encode('utf-8'))
+
+    def hash_mesh(self, hasher, mesh):
+        hasher.update(collection_array(mesh.vertices, 'co', np.float32, 3).tobytes())
+        hasher.update(collection_array(mesh.loops, 'vertex_index', np.int32).tobytes())
+        hasher.update(collection_array(mesh.polygons, 'loop_total', np.int32).tobytes())
+        hasher.update(collection_array(mesh.polygons, 'material_index', np.int32).tobytes())
+        hasher.update(collection_array(mesh.polygons, 'use_smooth', np.bool_).tobytes())
+
+        for uv_layer in mesh.uv_layers:
+            hasher.update(uv_layer.name.encode('utf-8'))
+            hasher.update(collection_array(uv_layer.data, 'uv', np.float32, 2).tobytes())
+
+        if mesh.shape_keys is not None:
+            for key_block in mesh.shape_keys.key_blocks:
+                hasher.update(repr((key_block.name, key_block.value, key_block.mute,
+                    key_block.relative_key.name, key_block.vertex_group,
+                    key_block.slider_min, key_block.slider_max)).encode('utf-8'))
+                hasher.update(collection_array(key_block.data, 'co', np.float32, 3).tobytes())
+
+        # vertex group weights can't be read with foreach_get
+        weights = [(vertex.index, group.group, group.weight) for vertex in mesh.vertices for group in vertex.groups]
+        hasher.update(np.array(weights, dtype=np.float64).tobytes())
+
+        # custom attributes, not in blender versions before 2.91
+        for attribute in sorted(getattr(mesh, 'attributes', ()), key=lambda a: a.name):
+            # Case: Internal attribute like the selection
+            if attribute.name.startswith("."):
+                continue
+
+            hasher.update(repr((attribute.name, attribute.domain, attribute.data_type)).encode('utf-8'))
+            if attribute.data_type in ATTRIBUTE_VALUES:
+                prop, dtype, components = ATTRIBUTE_VALUES[attribute.data_type]
+                hasher.update(collection_array(attribute.data, prop, dtype, components).tobytes())
+            elif attribute.data_type == 'STRING':
+                hasher.update(repr([item.value for item in attribute.data]).encode('utf-8'))
+            else:
+                # Case: Data type of a newer blender version, unknown content never matches
+                hasher.update(os.urandom(16))
+
+        for material in mesh.materials:
+            if material is not None:
+                hasher.update(self.digest(material).encode('utf-8'))
+
+    def hash_material(self, hasher, material):
+        hasher.update(repr(tuple(material.diffuse_color)).encode('utf-8'))
+        hasher.update(material.blend_method.encode('utf-8'))
+
+        if material.use_nodes and material.node_tree is not None:
+            self.hash_nodetree(hasher, material.node_tree)
+
+    def hash_nodetree(self, hasher, tree):
+        for node in sorted(tree.nodes, key=lambda n: n.name):
+            hasher.update(node.name.encode('utf-8'))
+            hasher.update(node.bl_idname.encode('utf-8'))
+            self.hash_rna(hasher, node)
+
+            for socket in node.inputs:
+                if hasattr(socket, 'default_value') and not socket.is_linked:
+                    value = socket.default_value
+                    if hasattr(value, '__len__'):
+                        value = tuple(value)
+                    hasher.update(socket.identifier.encode('utf-8'))
+                    hasher.update(repr(value).encode('utf-8'))
+
+        links = sorted(
+                (link.from_node.name, link.from_socket.identifier,
+                    link.to_node.name, link.to_socket.identifier)
+                for link in tree.links)
+        hasher.update(repr(links).encode('utf-8'))
+
+    def hash_image(self, hasher, image):
+        if image.packed_file is not None:
+            hasher.update(image.packed_file.data)
+            return
+
+        filepath = bpy.path.abspath(image.filepath, library=image.library)
+        digest = file_hash(filepath)
+
+        # fall back to the path for missing files and generated images
+        hasher.update((digest or image.filepath or image.name).encode('utf-8'))
+
+def load_manifest(folder):
+    try:
+        with open(os.path.join(folder, MANIFEST_NAME), encoding='utf-8') as manifest:
+            return json.load(manifest)
+    except (OSError, ValueError):
+        return {'assets': {}}
+
+def save_manifest(folder, manifest):
+    """ writes the manifest, replacing the old one only once it is complete """
+    path = os.path.join(folder, MANIFEST_NAME)
+    with open(path + ".tmp", 'w', encoding='utf-8') as tmp:
+        json.dump(manifest, tmp, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+def is_unchanged(filepath, digest, manifest):
+    """ True if the library file exists and was exported from the same content """
+    entry = manifest['assets'].get(os.path.basename(filepath))
+    return entry is not None and entry['hash'] == digest and os.path.exists(filepath)
+
+def record_exports(folder, exports):
+    """ stores the hashes of exported library files in the folder's manifest
+        exports: list of (filepath, digest, blocknames) tuples
+    """
+    manifest = load_manifest(folder)
+    for filepath, digest, blocknames in exports:
+        manifest['assets'][os.path.basename(filepath)] = {
+                'hash': digest,
+                'blocks': blocknames,
+                }
+    save_manifest(folder, manifest)
@@ -0,0 +1,400 @@
+import os
+import json
+import time
+import traceback
+import subprocess
+
+import bpy
+
+from .ad_utils import log, worker_command, temp_filepath
+
+class Job:
+    """ job specs to run in one headless blender instance
+
+        label: name shown in logs and reports
+        specs: job spec or list of job specs, see ad_worker
+    """
+
+    def __init__(self, label, specs):
+        self.label = label
+        self.specs = [specs] if isinstance(specs, dict) else list(specs)
+
+        # QUEUED, RUNNING, DONE, FAILED or CANCELLED
+        self.status = 'QUEUED'
+        self.error = ""
+        self.duration = 0.0
+        # result of each spec as reported by the worker
+        self.results = []
+
+        # jobs queued once this one finished successfully
+        self.followups = []
+        # called with the job once it finished successfully
+        self.on_finish = None
+        # called with the job once it finished, also if some of its specs failed
+        self.on_results = None
+
+        self.started = 0.0
+        self.process = None
+        self.worker = None
+        self.logpath = ""
+        self.resultpath = ""
+
+    def finish(self, success, error=""):
+        self.status = 'DONE' if success else 'FAILED'
+        self.error = error
+        self.duration = time.time() - self.started
+
+def worker_count(max_workers=0):
+    """ number of workers to run at once, 0 uses one per cpu core """
+    if max_workers > 0:
+        return max_workers
+    return os.cpu_count() or 1
+
+def thread_count(workers):
+    """ splits the cpu cores between the workers """
+    return max(1, (os.cpu_count() or 1) // workers)
+
+def read_log_tail(logpath, lines=20):
+    try:
+        with open(logpath, encoding='utf-8', errors='replace') as logfile:
+            return "".join(logfile.readlines()[-lines:])
+    except OSError:
+        return ""
+
+def read_results(resultpath):
+    try:
+        with open(resultpath, encoding='utf-8') as resultfile:
+            return json.load(resultfile)['results']
+    except (OSError, ValueError, KeyError):
+        return []
+
+# path -> time of files written by finished jobs
+written = {}
+
+def job_paths(job):
+    """ files the specs of a job write to """
+    paths = set()
+    for spec in job.specs:
+        # contact sheets render many assets
+        for item in [spec] + spec.get('assets', []):
+            for key in ('output', 'asset', 'destination'):
+                if key in item:
+                    paths.add(os.path.normpath(item[key]))
+        if spec['type'] == 'PACKAGE':
+            paths.add(os.path.normpath(spec['filepath']))
+    return paths
+
+class JobRunner:
+    """ runs jobs concurrently in up to max_workers headless blender instances
+
+        Each job either gets its own instance or, with use_pool,
+        is dispatched to the persistent worker pool.
+        Call step() repeatedly or run() to block until all jobs are done.
+    """
+
+    def __init__(self, jobs, max_workers=0, use_pool=False):
+        self.jobs = []
+        self.queued = []
+        self.running = []
+
+        # split the cores for the jobs known upfront
+        self.workers = worker_count(max_workers)
+        self.threads = thread_count(max(1, min(self.workers, len(jobs))))
+
+        self.pool = None
+        if use_pool:
+            from . import ad_pool
+            self.pool = ad_pool.get_pool(self.workers, self.threads)
+
+        self.add(jobs)
+
+    def add(self, jobs):
+        self.jobs += jobs
+        self.queued += jobs
+
+    def start(self, job):
+        """ starts the job, returns False if no worker is free
+            the job fails if no worker could be started for it
+        """
+        if self.pool is not None:
+            try:
+                worker = self.pool.acquire()
+                if worker is None:
+                    return False
+
+                worker.dispatch(job.specs)
+            except (RuntimeError, OSError) as e:
+                job.started = time.time()
+                job.finish(False, str(e))
+                log("Failed {}:\n{}".format(job.label, job.error))
+                return True
+
+            job.worker = worker
+        else:
+            job.logpath = temp_filepath("ad_job_", ".log")
+            job.resultpath = temp_filepath("ad_job_", ".json")
+            with open(job.logpath, 'w') as logfile:
+                job.process = subprocess.Popen(
+                        worker_command(
+                            # let blender load the first file on startup
+                            filepath=job.specs[0]['filepath'],
+                            threads=self.threads,
+                            arguments=("--stdin", "--results", job.resultpath)
+                            ),
+                        stdin=subprocess.PIPE,
+                        stdout=logfile,
+                        stderr=subprocess.STDOUT
+                        )
+
+            job.process.stdin.write(json.dumps(job.specs).encode('utf-8'))
+            job.process.stdin.close()
+
+        job.status = 'RUNNING'
+        job.started = time.time()
+        return True
+
+    def collect(self, job):
+        """ returns True if the job finished """
+        if self.pool is not None:
+            result = job.worker.poll()
+            if result is None:
+                return False
+
+            self.pool.release(job.worker)
+            job.results = result['results']
+            job.finish(result['ok'], result['error'])
+        else:
+            returncode = job.process.poll()
+            if returncode is None:
+                return False
+
+            job.results = read_results(job.resultpath)
+            if returncode == 0:
+                job.finish(True)
+            else:
+                errors = [result['error'] for result in job.results if not result['ok']]
+                job.finish(False, "\n".join(errors) or read_log_tail(job.logpath))
+
+        for path in job_paths(job):
+            written[path] = time.time()
+
+        if job.on_results is not None:
+            self.callback(job, job.on_results)
+
+        if job.status == 'DONE' and job.on_finish is not None:
+            self.callback(job, job.on_finish)
+
+        if job.status == 'DONE':
+            log("Finished {} in {:.1f}s".format(job.label, job.duration))
+            self.add(job.followups)
+        else:
+            log("Failed {}:\n{}".format(job.label, job.error))
+
+        return True
+
+    def callback(self, job, function):
+        """ calls function with the job, the job fails if it raises """
+        try:
+            function(job)
+        except Exception:
+            job.status = 'FAILED'
+            job.error = traceback.format_exc()
+
+    def step(self):
+        """ collects finished jobs and starts queued ones on free slots
+            returns True once all jobs are finished
+        """
+        for job in list(self.running):
+            if self.collect(job):
+                self.running.remove(job)
+
+        while self.queued and len(self.running) < self.workers:
+            job = self.queued[0]
+            if not self.start(job):
+                break
+            self.queued.pop(0)
+
+            # Case: Failed to start
+            if job.status == 'RUNNING':
+                self.running.append(job)
+
+        return self.finished
+
+    def run(self):
+        """ blocks until all jobs are finished """
+        log("=============== Background Workers ({}x{} threads) ===============".format(
+            self.workers,
+            self.threads))
+
+        while not self.step():
+            time.sleep(0.1)
+
+        log("=============== Background Workers ===============")
+
+        return self.jobs
+
+    def cancel(self):
+        """ kills the running workers and drops the queued jobs """
+        for job in self.running:
+            if job.worker is not None:
+                job.worker.kill()
+                self.pool.release(job.worker)
+            elif job.process.poll() is None:
+                job.process.kill()
+                job.process.wait()
+
+            job.status = 'CANCELLED'
+            job.duration = time.time() - job.started
+
+        for job in self.queued:
+            job.status = 'CANCELLED'
+
+        self.running.clear()
+        self.queued.clear()
+
+    @property
+    def finished(self):
+        return len(self.queued) == 0 and len(self.running) == 0
+
+    @property
+    def progress(self):
+        """ fraction of finished jobs between 0 and 1 """
+        if len(self.jobs) == 0:
+            return 1.0
+        done = len(self.jobs) - len(self.queued) - len(self.running)
+        return done / len(self.jobs)
+
+    @property
+    def failed(self):
+        return [job for job in self.jobs if job.status == 'FAILED']
+
+    def summary(self):
+        """ one line description of the state of the jobs """
+        done = [job for job in self.jobs if job.status == 'DONE']
+        text = "{}/{} jobs done".format(len(done), len(self.jobs))
+
+        if len(self.failed) != 0:
+            text += ", {} failed".format(len(self.failed))
+
+        cancelled = [job for job in self.jobs if job.status == 'CANCELLED']
+        if len(cancelled) != 0:
+            text += ", {} cancelled".format(len(cancelled))
+
+        return text
+
+# Background queue
+# jobs submitted while the ui is running are polled by a timer
+# so the interface stays responsive while the workers are busy
+
+queue = None
+
+def poll_queue():
+    """ timer callback stepping the background queue """
+    if queue is None:
+        return None
+
+    # an exception would unregister the timer and stall the queue
+    try:
+        finished = queue.step()
+    except Exception:
+        log("Background queue error:\n{}".format(traceback.format_exc()))
+        return 0.25
+
+    # update the progress bar in the status bar
+    wm = bpy.context.window_manager
+    wm.AD_job_progress = queue.progress * 100
+    for window in wm.windows:
+        for area in window.screen.areas:
+            area.tag_redraw()
+
+    if finished:
+        log("Background jobs finished: {}".format(queue.summary()))
+        return None
+
+    return 0.25
+
+def submit(jobs):
+    """ adds the jobs to the background queue and starts polling it """
+    global queue
+
+    prefs = bpy.context.preferences.addons[__package__].preferences
+
+    # start a new queue once the last one is done
+    if queue is None or queue.finished:
+        queue = JobRunner(jobs, prefs.AD_max_workers, prefs.AD_worker_pool)
+    else:
+        queue.add(jobs)
+
+    if not bpy.app.timers.is_registered(poll_queue):
+        bpy.app.timers.register(poll_queue, first_interval=0.0, persistent=True)
+
+    return queue
+
+def cancel_queue():
+    """ cancels the running background jobs and clears the queue """
+    global queue
+
+    if bpy.app.timers.is_registered(poll_queue):
+        bpy.app.timers.unregister(poll_queue)
+
+    if queue is not None:
+        queue.cancel()
+        log("Background jobs cancelled: {}".format(queue.summary()))
+        queue = None
+
+def pending_paths(grace=10.0):
+    """ files written by unfinished background jobs or by jobs that finished
+        less than grace seconds ago
+    """
+    paths = {path for path, finished in written.items() if time.time() - finished < grace}
+
+    if queue is not None:
+        for job in queue.queued + queue.running:
+            paths.update(job_paths(job))
+
+    return paths
+
+def run_jobs(jobs, background=None):
+    """ runs the jobs with the worker settings from the addon preferences
+
+        background: submit the jobs to the background queue and return
+        immediately, defaults to the preferences if there is a ui
+    """
+    prefs = bpy.context.preferences.addons[__package__].preferences
+
+    if background is None:
+        background = prefs.AD_background_jobs and not bpy.app.background
+
+    if background:
+        return submit(jobs)
+
+    runner = JobRunner(jobs, prefs.AD_max_workers, prefs.AD_worker_pool)
+    runner.run()
+
+    return runner
+
+def spec_files(spec):
+    """ number of files a job spec works on """
+    return len(spec.get('assets', [spec]))
+
+def report_jobs(operator, runner, action):
+    """ reports the result of a batch of jobs on the operator """
+    if not runner.finished:
+        operator.report({'INFO'}, "Queued background jobs: {}".format(runner.summary()))
+        return
+
+    files = sum(spec_files(spec) for job in runner.jobs for spec in job.specs)
+    failed = runner.failed
+    if len(failed) == 0:
+        operator.report({'INFO'}, "{} {} file/s".format(action, files))
+    else:
+        # a batch job can fail for some of its files only
+        failed_files = 0
+        for job in failed:
+            failed_specs = [spec for spec, result in zip(job.specs, job.results) if not result['ok']]
+            failed_files += sum(spec_files(spec) for spec in (failed_specs or job.specs))
+        operator.report({'WARNING'}, "{} {} file/s, {} failed: {}".format(
+            action,
+            files - failed_files,
+            failed_files,
+            ", ".join(job.label for job in failed)))
@@ -0,0 +1,128 @@
+# Modal update scheduling
+#
+# Mouse moves arrive faster than the viewport redraws. Instead of updating
+# on every MOUSEMOVE the modal tools hand the events to a ModalScheduler,
+# which only keeps the latest mouse state and runs one update per timer
+# tick. An update that takes longer than the time budget pushes the next
+# one back, so slow updates don't pile up. Update and phase timings are
+# kept to show where the latency goes.
+import time
+
+from collections import namedtuple
+from contextlib import contextmanager
+
+import bpy
+
+from .ad_utils import log
+
+# event attributes the tools use, events themselves can't be kept
+MouseState = namedtuple('MouseState', ['mouse_x', 'mouse_y', 'mouse_region_x', 'mouse_region_y', 'shift', 'ctrl', 'alt'])
+
+# weight of the newest update in the average duration
+SMOOTHING = 0.2
+
+def mouse_state(event):
+    return MouseState(event.mouse_x, event.mouse_y, event.mouse_region_x, event.mouse_region_y,
+            event.shift, event.ctrl, event.alt)
+
+class ModalScheduler:
+    """ coalesces mouse moves of a modal operator into budgeted updates """
+
+    def __init__(self, context, name):
+        prefs = context.preferences.addons[__package__].preferences
+        self.name = name
+        self.budget = prefs.AD_modal_budget / 1000
+        self.show_timing = prefs.AD_modal_timing
+
+        self.mouse = None
+        self.pending = False
+        self.next_update = 0.0
+
+        # timing
+        self.events = 0
+        self.updates = 0
+        self.last = 0.0
+        self.average = 0.0
+        self.slowest = 0.0
+        self.phases = {}
+        self.running = False
+
+        # ticks at the budget, but at most 100 per second
+        self.timer = context.window_manager.event_timer_add(max(self.budget, 0.01), window=context.window)
+
+    def push(self, event):
+        """ records a mouse move, the update runs on the next due timer tick """
+        self.mouse = mouse_state(event)
+        self.pending = True
+        self.events += 1
+
+    def due(self):
+        return self.pending and time.perf_counter() >= self.next_update
+
+    def run(self, context, update):
+        """ runs update(context, mouse) if a mouse move is pending and the budget allows it
+            returns True if it ran
+        """
+        if not self.due():
+            return False
+
+        self.pending = False
+        self.phases = {}
+        self.running = True
+
+        start = time.perf_counter()
+        try:
+            update(context, self.mouse)
+        finally:
+            self.running = False
+        end = time.perf_counter()
+
+        self.record(end - start)
+        # Case: Update was over budget, give blender the time back before the next one
+        self.next_update = end + max(0.0, self.last - self.budget)
+
+        context.area.tag_redraw()
+        return True
+
+    def record(self, duration):
+        self.updates += 1
+        self.last = duration
+        self.slowest = max(self.slowest, duration)
+        if self.updates == 1:
+            self.average = duration
+        else:
+            self.average += (duration - self.average) * SMOOTHING
+
+    @contextmanager
+    def phase(self, name):
+        """ times a part of an update, shown next to the update timing
+            updates run outside of the scheduler, e.g. on key presses, aren't timed
+        """
+        if not self.running:
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def timing(self):
+        """ header text with the timing of the last update, empty if timing is off """
+        if not self.show_timing or self.updates == 0:
+            return ""
+
+        text = " | {:.1f} ms (avg {:.1f}, max {:.1f})".format(
+                self.last * 1000, self.average * 1000, self.slowest * 1000)
+        if self.phases:
+            text += " " + ", ".join("{} {:.1f}".format(name, duration * 1000)
+                    for name, duration in self.phases.items())
+        return text
+
+    def stop(self, context):
+        context.window_manager.event_timer_remove(self.timer)
+
+        if self.show_timing and self.updates != 0:
+            log("{}: {} updates for {} mouse moves, avg {:.1f} ms, max {:.1f} ms".format(
+                self.name, self.updates, self.events, self.average * 1000, self.slowest * 1000))
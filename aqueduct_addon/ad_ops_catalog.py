@@ -0,0 +1,218 @@
+import os
+import sys
+import subprocess
+
+import bpy
+
+from bpy.types import Operator
+from bpy.props import StringProperty, EnumProperty
+
+from .ad_utils import log, temp_filepath
+from . import ad_catalog
+
+# the running scanner process and its log
+scanner = None
+scanner_log = ""
+# last progress or result line of the scanner
+status = ""
+
+# rows of the last search
+results = []
+
+DATATYPES = [
+        ('ALL', "All", "Search all datablock types", 'NONE', 0),
+        ('objects', "Objects", "Search objects", 'OBJECT_DATA', 1),
+        ('materials', "Materials", "Search materials", 'MATERIAL', 2),
+        ('collections', "Collections", "Search collections", 'GROUP', 3),
+        ]
+
+# append operator of each datablock type
+APPEND_OPERATORS = {
+        'objects': "ad.merge_obj_from_blend",
+        'materials': "ad.merge_mat_from_blend",
+        'collections': "ad.merge_col_from_blend",
+        }
+
+def catalog_path():
+    """ path of the catalog database, empty if no library folder is set """
+    prefs = bpy.context.preferences.addons[__package__].preferences
+    if prefs.AD_catalog_path != "":
+        return prefs.AD_catalog_path
+    if prefs.AD_library_path != "":
+        return os.path.join(prefs.AD_library_path, ad_catalog.CATALOG_NAME)
+    return ""
+
+def python_binary():
+    # before 2.91 sys.executable is the blender binary itself
+    return getattr(bpy.app, 'binary_path_python', sys.executable)
+
+def read_status():
+    """ last line the scanner printed """
+    try:
+        with open(scanner_log, encoding='utf-8', errors='replace') as logfile:
+            lines = logfile.read().splitlines()
+    except OSError:
+        return ""
+    return lines[-1] if lines else ""
+
+def poll_scanner():
+    """ timer callback waiting for the scanner process """
+    global scanner, status
+
+    if scanner is None:
+        return None
+
+    line = read_status()
+    if line.startswith("PROGRESS"):
+        done, total = line.split()[1:3]
+        status = "Scanning library: {}/{} files".format(done, total)
+    elif line != "":
+        status = line
+
+    for window in bpy.context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type == 'PREFERENCES':
+                area.tag_redraw()
+
+    if scanner.poll() is None:
+        return 0.5
+
+    if scanner.returncode != 0:
+        status = "Library scan failed, see the console"
+        log("Library scan failed:\n{}".format(open(scanner_log, errors='replace').read()))
+    else:
+        log(status)
+
+    scanner = None
+    return None
+
+def start_scan(folder, database):
+    """ scans the folder into the catalog in a separate python process
+        returns False if a scan is already running
+    """
+    global scanner, scanner_log, status
+
+    if scanner is not None:
+        return False
+
+    # the scanner runs as plain python on all cores, blender stays responsive
+    scanner_log = temp_filepath("ad_catalog_", ".log")
+    with open(scanner_log, 'w') as logfile:
+        scanner = subprocess.Popen(
+                [
+                    python_binary(),
+                    os.path.join(os.path.dirname(__file__), "ad_catalog.py"),
+                    "scan",
+                    folder,
+                    database,
+                    ],
+                stdout=logfile,
+                stderr=subprocess.STDOUT
+                )
+
+    status = "Scanning library"
+    bpy.app.timers.register(poll_scanner, first_interval=0.5, persistent=True)
+    return True
+
+class AD_OT_catalog_update(Operator):
+    """ Scans the library folder for new and changed files and updates the catalog """
+    bl_idname = "ad.catalog_update"
+    bl_label = "Update library catalog"
+    bl_options = {'INTERNAL'}
+
+    @classmethod
+    def poll(cls, context):
+        return scanner is None
+
+    def execute(self, context):
+        prefs = context.preferences.addons[__package__].preferences
+
+        # GUARD CLAUSES
+
+        # Case: No library folder
+        if prefs.AD_library_path == "" or not os.path.isdir(prefs.AD_library_path):
+            self.report({'ERROR'}, "Set a library folder in the Aqueduct settings first")
+            return {'CANCELLED'}
+
+        start_scan(prefs.AD_library_path, catalog_path())
+
+        self.report({'INFO'}, "Scanning library in the background")
+        return {'FINISHED'}
+
+class AD_OT_catalog_search(Operator):
+    """ Searches the datablocks of the library catalog by name """
+    bl_idname = "ad.catalog_search"
+    bl_label = "Search library"
+    bl_options = {'INTERNAL'}
+
+    pattern : StringProperty(name="Name", description="Name to search, * matches any text", default="")
+    datatype : EnumProperty(name="Type", items=DATATYPES, default='ALL')
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self, width=600)
+
+    def execute(self, context):
+        global results
+
+        database = catalog_path()
+
+        # Case: Catalog doesn't exist yet
+        if database == "" or not os.path.exists(database):
+            self.report({'ERROR'}, "No library catalog, update the catalog first")
+            return {'CANCELLED'}
+
+        results = ad_catalog.search(database, self.pattern, None if self.datatype == 'ALL' else self.datatype)
+        log("Catalog search '{}': {} results".format(self.pattern, len(results)))
+
+        bpy.ops.ad.catalog_results('INVOKE_DEFAULT')
+        return {'FINISHED'}
+
+    def draw(self, context):
+        layout = self.layout
+        row = layout.row()
+        row.prop(self, 'pattern')
+        row = layout.row()
+        row.prop(self, 'datatype', expand=True)
+
+class AD_OT_catalog_results(Operator):
+    """ Shows the results of the last library search """
+    bl_idname = "ad.catalog_results"
+    bl_label = "Library search results"
+    bl_options = {'INTERNAL'}
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_popup(self, width=700)
+
+    def execute(self, context):
+        return {'FINISHED'}
+
+    def draw(self, context):
+        layout = self.layout
+        layout.label(text="{} results".format(len(results)))
+
+        col = layout.column(align=True)
+        for datatype, name, path, _, polycount in results:
+            row = col.row()
+            split = row.split(factor=0.35)
+            split.label(text=name, icon={
+                'objects': 'OBJECT_DATA',
+                'materials': 'MATERIAL',
+                'collections': 'GROUP',
+                }.get(datatype, 'FILE_BLEND'))
+            split = split.split(factor=0.2)
+            split.label(text="{} faces".format(polycount) if polycount else datatype)
+            split = split.split(factor=0.85)
+            split.label(text=path)
+
+            # Case: Type can be appended
+            if datatype in APPEND_OPERATORS:
+                props = split.operator(APPEND_OPERATORS[datatype], text="", icon='APPEND_BLEND')
+                props.filepath = path
+
+classes = (
+        AD_OT_catalog_update,
+        AD_OT_catalog_search,
+        AD_OT_catalog_results,
+        )
+
+register, unregister = bpy.utils.register_classes_factory(classes)
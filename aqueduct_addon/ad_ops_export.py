@@ -23,6 +23,7 @@ class Save_Resource_BaseClass:
     render_thumbnail : BoolProperty(default=False)
     package_images: BoolProperty(default=False)
     split_into_files : BoolProperty(default=False)
+    skip_unchanged : BoolProperty(default=True)
     pivot_placement : EnumProperty(name="Pivot Placement",
             items=[
                 ('-Z', "-Z", "bbox negative Z"),
@@ -52,10 +53,29 @@ class Save_Resource_BaseClass:
         row = layout.row()
         row.prop(self, 'split_into_files', text="Each asset in its own file")
         row = layout.row()
+        row.prop(self, 'skip_unchanged', text="Skip unchanged resources")
+        row = layout.row()
         row.label(text="Pivot Placement:")
         row = layout.row()
         row.prop(self, 'pivot_placement', text="")
 
+    def export_resources(self, mode, data_blocks):
+        """ exports the datablocks, files without thumbnails get queued
+            in the batch render list
+        """
+        # save out datablocks, each asset in its own file if split
+        bpy.ops.ad.export_resource(
+                filepath=self.filepath,
+                mode=mode,
+                blocknames=json.dumps(data_blocks),
+                pivot=self.pivot_placement,
+                package_images=self.package_images,
+                render_thumbnail=self.render_thumbnail,
+                split_into_files=self.split_into_files,
+                incremental=self.skip_unchanged
+                )
+        log("{} {}/s exported".format(len(data_blocks), mode.lower()))
+
 class AD_OT_save_col_filedialog(Operator, ExportHelper, Save_Resource_BaseClass):
     """ Saves Collection to blendfile """
     bl_idname = "ad.save_collection_filedialog"
@@ -127,51 +147,7 @@ class AD_OT_save_col_filedialog(Operator, ExportHelper, Save_Resource_BaseClass)
             self.report({'ERROR'}, "No resources chosen for export")
             return {'CANCELLED'}
 
-        if self.split_into_files:
-            for block in data_blocks:
-                # construct filepaths for asset
-                filepath = os.path.join(os.path.dirname(self.filepath), block + ".blend")
-
-                # construct single data_block 
-                asset = [block,]
-
-                # save out datablocks
-                bpy.ops.ad.export_resource(
-                        filepath=filepath,
-                        mode='COLLECTION',
-                        blocknames=json.dumps(asset),
-                        pivot=self.pivot_placement,
-                        package_images=self.package_images
-                        )
-
-                # render thumbnail
-                if self.render_thumbnail:
-                    bpy.ops.ad.render_thumbnail(filepath=filepath, mode='OBJECT')
-                else:
-                    _list = prefs.AD_batchrender_list
-                    entry = _list.add()
-                    entry.mode = 'OBJECT'
-                    entry.filepath = filepath
-        else:
-            # Write out the selected resources to a library file in tmp folder
-            bpy.ops.ad.export_resource(
-                    filepath=self.filepath,
-                    mode='COLLECTION',
-                    blocknames=json.dumps(data_blocks),
-                    pivot=self.pivot_placement,
-                    package_images=self.package_images
-                    )
-            log("{} collection/s exported".format(len(data_blocks)))
-
-            # Render thumbnail
-            if self.render_thumbnail:
-                bpy.ops.ad.render_thumbnail(filepath=self.filepath, mode='OBJECT')
-            else:
-                # add it to the batch render list
-                _list = prefs.AD_batchrender_list
-                entry = _list.add()
-                entry.mode = 'OBJECT'
-                entry.filepath = self.filepath
+        self.export_resources('COLLECTION', data_blocks)
 
         return {'FINISHED'}
 
@@ -236,53 +212,7 @@ class AD_OT_save_obj_filedialog(Operator, ExportHelper, Save_Resource_BaseClass)
             self.report({'ERROR'}, "No resources chosen for export")
             return {'CANCELLED'}
 
-        if self.split_into_files:
-            for block in data_blocks:
-                # construct filepaths for asset
-                filepath = os.path.join(os.path.dirname(self.filepath), block + ".blend")
-
-                # construct single data_block 
-                asset = [block,]
-
-                # save out datablocks
-                bpy.ops.ad.export_resource(
-                        filepath=filepath,
-                        mode='OBJECT',
-                        blocknames=json.dumps(asset),
-                        pivot=self.pivot_placement,
-                        package_images=self.package_images
-                        )
-
-                # render thumbnail
-                if self.render_thumbnail:
-                    bpy.ops.ad.render_thumbnail(filepath=filepath, mode='OBJECT')
-                else:
-                    _list = prefs.AD_batchrender_list
-                    entry = _list.add()
-                    entry.mode = 'OBJECT'
-                    entry.filepath = filepath
-        else:
-            # Write out the selected resources to a library file in tmp folder
-            bpy.ops.ad.export_resource(
-                    filepath=self.filepath,
-                    mode='OBJECT',
-                    blocknames=json.dumps(data_blocks),
-                    pivot=self.pivot_placement,
-                    package_images=self.package_images
-                    )
-
-            log("{} object/s exported".format(len(data_blocks)))
-
-            # Render Thumbnail
-            if self.render_thumbnail:
-                bpy.ops.ad.render_thumbnail(filepath=self.filepath, mode='OBJECT')
-            else:
-                # add it to the batch render list
-                _list = prefs.AD_batchrender_list
-                entry = _list.add()
-                entry.mode = 'OBJECT'
-                entry.filepath = self.filepath
-
+        self.export_resources('OBJECT', data_blocks)
 
         return {'FINISHED'}
 
@@ -358,50 +288,7 @@ class AD_OT_save_mat_filedialog(Operator, ExportHelper, Save_Resource_BaseClass)
             self.report({'ERROR'}, "No resources chosen for export")
             return {'CANCELLED'}
 
-        if self.split_into_files:
-            for block in data_blocks:
-                # construct filepaths for asset
-                filepath = os.path.join(os.path.dirname(self.filepath), block + ".blend")
-
-                # construct single data_block 
-                asset = [block,]
-
-                # save out datablocks
-                bpy.ops.ad.export_resource(
-                        filepath=filepath,
-                        mode='MATERIAL',
-                        blocknames=json.dumps(asset),
-                        package_images=self.package_images
-                        )
-
-                # render thumbnail
-                if self.render_thumbnail:
-                    bpy.ops.ad.render_thumbnail(filepath=filepath, mode='MATERIAL')
-                else:
-                    _list = prefs.AD_batchrender_list
-                    entry = _list.add()
-                    entry.mode = 'MATERIAL'
-                    entry.filepath = filepath
-
-        else:
-            # # Write out the selected resources to a library file in tmp folder
-            bpy.ops.ad.export_resource(
-                    filepath=self.filepath,
-                    mode='MATERIAL',
-                    blocknames=json.dumps(data_blocks),
-                    package_images=self.package_images
-                    )
-            log("{} material/s exported".format(len(data_blocks)))
-
-            # render thumbnail
-            if self.render_thumbnail:
-                bpy.ops.ad.render_thumbnail(filepath=self.filepath, mode='MATERIAL')
-            else:
-                # add it to the batch render list
-                _list = prefs.AD_batchrender_list
-                entry = _list.add()
-                entry.mode = 'MATERIAL'
-                entry.filepath = self.filepath
+        self.export_resources('MATERIAL', data_blocks)
 
         return {'FINISHED'}
 
@@ -422,6 +309,8 @@ class AD_OT_save_mat_filedialog(Operator, ExportHelper, Save_Resource_BaseClass)
         row.prop(self, 'package_images', text="Package and relink textures")
         row = layout.row()
         row.prop(self, 'split_into_files', text="Each asset in its own file")
+        row = layout.row()
+        row.prop(self, 'skip_unchanged', text="Skip unchanged resources")
 
 classes = (
         AD_OT_save_obj_filedialog,
@@ -2,6 +2,9 @@ import os
 import shutil
 
 from .ad_utils import log
+from .ad_jobs import run_jobs, report_jobs
+from .ad_ops_utility import thumbnail_batch_jobs, package_job, relocate_job
+from .ad_thumbcache import QUALITY_TIERS, QUALITY_RANK, split_cached, thumbnail_files, rendered_thumbnail, thumbnail_quality, tier_timings
 
 import bpy
 
@@ -10,6 +13,21 @@ from bpy.props import CollectionProperty, StringProperty, EnumProperty
 
 from bpy_extras.io_utils import ExportHelper
 
+def finish_relocation(source, destination):
+    """ removes the source of a relocated file and moves its thumbnails along """
+    # proceed only if relocation of file was successfull
+    if not os.path.exists(destination):
+        return
+
+    # delete old file
+    if os.path.exists(source):
+        os.remove(source)
+
+    # move the thumbnails, their material and scaled down variants and the sidecar along
+    stem = os.path.splitext(destination)[0]
+    for suffix, thumbnail_sourcepath in thumbnail_files(source).items():
+        shutil.move(thumbnail_sourcepath, stem + suffix)
+
 class AD_OT_Filelist_Add(Operator, ExportHelper):
     """ Adds selected files to the Filelist """
     bl_idname = "ad.filelist_add"
@@ -70,17 +88,78 @@ class AD_OT_Filelist_Render(Operator):
         prefs = context.preferences.addons[__package__].preferences
         _list = prefs.AD_batchrender_list
 
-        # render each file
-        for entry in _list:
-            # check if the file still exists
-            if os.path.exists(entry.filepath):
-                bpy.ops.ad.render_thumbnail(filepath=entry.filepath, mode=entry.mode)
+        # GUARD CLAUSES
+
+        # Case: Studio files do not exist
+        for mode, studio_path in (
+                ('OBJECT', prefs.AD_object_studio_path),
+                ('MATERIAL', prefs.AD_material_studio_path)):
+            if mode in [entry.mode for entry in _list] and not os.path.exists(studio_path):
+                self.report({'ERROR'}, "Path to Studio blendfile is invalid")
+                return {'CANCELLED'}
+
+        # render each file that still exists and has no cached thumbnail
+        entries = [(entry.filepath, entry.mode) for entry in _list if os.path.exists(entry.filepath)]
+        stale = split_cached(entries)
+        jobs = thumbnail_batch_jobs(stale)
+
+        # Case: All thumbnails are up to date
+        if len(jobs) == 0:
+            self.report({'INFO'}, "Restored {} thumbnail/s from cache".format(len(entries)))
+            return {'FINISHED'}
+
+        context.window.cursor_set('WAIT')
+        runner = run_jobs(jobs)
+        context.window.cursor_set('DEFAULT')
+
+        report_jobs(self, runner, "Rendered")
 
         # clear the list
         # _list.clear()
 
         return {'FINISHED'}
 
+class AD_OT_Filelist_Upgrade(Operator):
+    """ Renders the thumbnails of the batch render list that are below a quality tier again, in the background """
+    bl_idname = "ad.filelist_upgrade"
+    bl_label = "Upgrade the thumbnails of the Batch render list"
+
+    quality : EnumProperty(name="Quality", items=QUALITY_TIERS, default='STANDARD')
+
+    @classmethod
+    def poll(cls, context):
+        return context.preferences.addons[__package__].preferences.AD_batchrender_list
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
+
+    def execute(self, context):
+        prefs = context.preferences.addons[__package__].preferences
+        _list = prefs.AD_batchrender_list
+
+        entries = [(entry.filepath, entry.mode) for entry in _list if os.path.exists(entry.filepath)]
+
+        for quality, (count, average) in tier_timings(filepath for filepath, _ in entries).items():
+            log("{} thumbnails: {} rendered, {:.2f}s on average".format(quality, count, average))
+
+        # files without thumbnail or with a thumbnail below the quality
+        rank = QUALITY_RANK[self.quality]
+        lower = [(filepath, mode) for filepath, mode in entries
+                if rendered_thumbnail(filepath) == "" or QUALITY_RANK.get(thumbnail_quality(filepath), 0) < rank]
+
+        # Case: All thumbnails are good enough
+        if len(lower) == 0:
+            self.report({'INFO'}, "All thumbnails are at {} quality or better".format(self.quality.lower()))
+            return {'FINISHED'}
+
+        stale = split_cached(lower, self.quality)
+        if len(stale) != 0:
+            run_jobs(thumbnail_batch_jobs(stale, self.quality), background=True)
+
+        self.report({'INFO'}, "Upgrading {} thumbnail/s, {} restored from cache".format(
+            len(stale), len(lower) - len(stale)))
+        return {'FINISHED'}
+
 class AD_OT_Filelist_Package(Operator):
     """ Package the batch render filelist """
     bl_idname = "ad.filelist_package"
@@ -94,15 +173,18 @@ class AD_OT_Filelist_Package(Operator):
         prefs = context.preferences.addons[__package__].preferences
         _list = prefs.AD_batchrender_list
 
-        context.window.cursor_set('WAIT')
-        # render each file
+        # package each file that still exists
+        jobs = []
         for entry in _list:
-            # check if the file still exists
             if os.path.exists(entry.filepath):
-                bpy.ops.ad.package_images_batch(filepath=entry.filepath)
-
+                jobs.append(package_job(entry.filepath))
 
+        context.window.cursor_set('WAIT')
+        runner = run_jobs(jobs)
         context.window.cursor_set('DEFAULT')
+
+        report_jobs(self, runner, "Packaged")
+
         return {'FINISHED'}
 
 class AD_OT_Filelist_Relocate(Operator):
@@ -126,8 +208,8 @@ class AD_OT_Filelist_Relocate(Operator):
         prefs = context.preferences.addons[__package__].preferences
         _list = prefs.AD_batchrender_list
 
-        context.window.cursor_set('WAIT')
         # move/resave each file
+        jobs = []
         for entry in _list:
             source = entry.filepath
             destination = os.path.join(
@@ -135,24 +217,16 @@ class AD_OT_Filelist_Relocate(Operator):
                     os.path.basename(source))
 
             if os.path.exists(source):
-                bpy.ops.ad.relocate_file(source=source, destination=destination)
-
-            # proceed only if relocation of file was successfull
-            if os.path.exists(destination):
-                # delete old file
-                if os.path.exists(source):
-                    os.remove(source)
-
-                # move existing thumbnails to the new location
-                extensions = [".jpg", ".png", ".JPG", ".PNG"]
-                for extension in extensions:
-                    thumbnail_sourcepath = os.path.splitext(source)[0] + extension
-                    
-                    if os.path.exists(thumbnail_sourcepath):
-                        thumbnail_destinationpath = os.path.splitext(destination)[0] + extension
-                        shutil.move(thumbnail_sourcepath, thumbnail_destinationpath)
+                job = relocate_job(source, destination)
+                job.on_finish = lambda job, s=source, d=destination: finish_relocation(s, d)
+                jobs.append(job)
 
+        context.window.cursor_set('WAIT')
+        runner = run_jobs(jobs)
         context.window.cursor_set('DEFAULT')
+
+        report_jobs(self, runner, "Relocated")
+
         return {'FINISHED'}
 
 class AD_OT_Filelist_Clear(Operator):
@@ -197,6 +271,7 @@ classes = (
         AD_OT_Filelist_Remove,
         AD_OT_Filelist_Relocate,
         AD_OT_Filelist_Render,
+        AD_OT_Filelist_Upgrade,
         AD_OT_Filelist_Package,
         AD_OT_Filelist_Clear,
         )
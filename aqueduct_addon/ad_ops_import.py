@@ -1,3 +1,8 @@
+import os
+import struct
+
+from collections import OrderedDict
+
 import bpy
 
 from bpy.types import Operator
@@ -6,6 +11,60 @@ from bpy.props import StringProperty, BoolProperty, CollectionProperty
 from .ad_utils import *
 
 from .ad_ops_utility import AD_TYPE_Resource
+from . import ad_blendfile
+
+# number of dropped files whose contents are kept
+LISTING_CACHE_SIZE = 32
+
+# filepath -> ((mtime, size), datablock names by type), least recently used first
+listings = OrderedDict()
+
+def read_listing(filepath):
+    """ datablock names by bpy.data collection name of a blendfile """
+    try:
+        return ad_blendfile.read_datablocks(filepath)
+    except (ad_blendfile.BlendFileError, KeyError, struct.error) as e:
+        log("Falling back to blender to list {}: {}".format(filepath, e))
+
+    with bpy.data.libraries.load(filepath) as (data_from, data_to):
+        return {datatype: list(getattr(data_from, datatype))
+                for datatype in ('objects', 'materials', 'collections')}
+
+def list_datablocks(filepath, datatype):
+    """ names of the datablocks of a type in a blendfile
+        listings are cached until the file changes, so dropping
+        the same file again doesn't read it again
+    """
+    stat = os.stat(filepath)
+    key = (stat.st_mtime_ns, stat.st_size)
+
+    # Case: File was listed before and didn't change
+    cached = listings.get(filepath)
+    if cached is not None and cached[0] == key:
+        listings.move_to_end(filepath)
+        return cached[1].get(datatype, [])
+
+    names = read_listing(filepath)
+    listings[filepath] = (key, names)
+    listings.move_to_end(filepath)
+    while len(listings) > LISTING_CACHE_SIZE:
+        listings.popitem(last=False)
+
+    return names.get(datatype, [])
+
+def fill_resource_list(operator, datatype):
+    """ fills the resource list of an append operator, False if the file can't be read """
+    operator.resource_list.clear()
+    try:
+        names = list_datablocks(operator.filepath, datatype)
+    except OSError as e:
+        operator.report({'ERROR'}, "Can't read the dropped file: {}".format(e))
+        return False
+
+    for name in names:
+        entry = operator.resource_list.add()
+        entry.name = name
+    return True
 
 class AD_OT_append_obj(Operator):
     """ Append objects from dropped file """
@@ -19,12 +78,9 @@ class AD_OT_append_obj(Operator):
     resource_list: CollectionProperty(name="Object List", type=AD_TYPE_Resource)
 
     def invoke(self, context, event):
-        # look into the file and gather list of objects
-        self.resource_list.clear()
-        with bpy.data.libraries.load(self.filepath, self.link, False) as (data_from, data_to):
-            for obj in data_from.objects:
-                entry = self.resource_list.add()
-                entry.name = obj
+        # list the file contents without loading anything, the listing is cached
+        if not fill_resource_list(self, 'objects'):
+            return {'CANCELLED'}
 
         # GUARD CLAUSES
 
@@ -45,14 +101,17 @@ class AD_OT_append_obj(Operator):
     def execute(self, context):
 
         # load chosen objects from the file
-        self.selected_resources = []
-        with bpy.data.libraries.load(self.filepath, self.link, False) as (data_from, data_to):
-            for i, entry in enumerate(self.resource_list):
-                if entry.selected:
-                    self.selected_resources.append(data_from.objects[i])
+        # the names come from the listing, so this is the only time the file gets opened
+        self.selected_resources = [entry.name for entry in self.resource_list if entry.selected]
+        if len(self.selected_resources) == 0:
+            return {'CANCELLED'}
 
+        with bpy.data.libraries.load(self.filepath, self.link, False) as (data_from, data_to):
             data_to.objects = self.selected_resources
 
+        # names of datablocks that failed to load are replaced by None
+        self.selected_resources = [res for res in data_to.objects if res is not None]
+
         if len(self.selected_resources) == 0:
             return {'CANCELLED'}
 
@@ -92,12 +151,9 @@ class AD_OT_append_mat(Operator):
     resource_list: CollectionProperty(name="Material List", type=AD_TYPE_Resource)
 
     def invoke(self, context, event):
-        # look into the file but don't load any resources
-        self.resource_list.clear()
-        with bpy.data.libraries.load(self.filepath, self.link, False) as (data_from, data_to):
-            for mat in data_from.materials:
-                entry = self.resource_list.add()
-                entry.name = mat
+        # list the file contents without loading anything, the listing is cached
+        if not fill_resource_list(self, 'materials'):
+            return {'CANCELLED'}
 
         # GUARD CLAUSES
 
@@ -127,14 +183,17 @@ class AD_OT_append_mat(Operator):
     def execute(self, context):
 
         # load chosen materials from the file
-        self.selected_resources = []
-        with bpy.data.libraries.load(self.filepath, self.link, False) as (data_from, data_to):
-            for i, entry in enumerate(self.resource_list):
-                if entry.selected:
-                    self.selected_resources.append(data_from.materials[i])
+        # the names come from the listing, so this is the only time the file gets opened
+        self.selected_resources = [entry.name for entry in self.resource_list if entry.selected]
+        if len(self.selected_resources) == 0:
+            return {'CANCELLED'}
 
+        with bpy.data.libraries.load(self.filepath, self.link, False) as (data_from, data_to):
             data_to.materials = self.selected_resources
 
+        # names of datablocks that failed to load are replaced by None
+        self.selected_resources = [res for res in data_to.materials if res is not None]
+
         # Case: No material chosen
         if len(self.selected_resources) == 0:
             return {'CANCELLED'}
@@ -236,12 +295,9 @@ class AD_OT_append_col(Operator):
     resource_list: CollectionProperty(name="Object List", type=AD_TYPE_Resource)
 
     def invoke(self, context, event):
-        # look into the file and gather list of objects
-        self.resource_list.clear()
-        with bpy.data.libraries.load(self.filepath, self.link, False) as (data_from, data_to):
-            for col in data_from.collections:
-                entry = self.resource_list.add()
-                entry.name = col
+        # list the file contents without loading anything, the listing is cached
+        if not fill_resource_list(self, 'collections'):
+            return {'CANCELLED'}
 
         # GUARD CLAUSES
 
@@ -271,14 +327,17 @@ class AD_OT_append_col(Operator):
     def execute(self, context):
 
         # load chosen collections from the file
-        self.selected_resources = []
-        with bpy.data.libraries.load(self.filepath, self.link, False) as (data_from, data_to):
-            for i, entry in enumerate(self.resource_list):
-                if entry.selected:
-                    self.selected_resources.append(data_from.collections[i])
+        # the names come from the listing, so this is the only time the file gets opened
+        self.selected_resources = [entry.name for entry in self.resource_list if entry.selected]
+        if len(self.selected_resources) == 0:
+            return {'CANCELLED'}
 
+        with bpy.data.libraries.load(self.filepath, self.link, False) as (data_from, data_to):
             data_to.collections = self.selected_resources
 
+        # names of datablocks that failed to load are replaced by None
+        self.selected_resources = [res for res in data_to.collections if res is not None]
+
         # Case: No collections chosen
         if len(self.selected_resources) == 0:
             return {'CANCELLED'}
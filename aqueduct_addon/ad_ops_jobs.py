@@ -0,0 +1,121 @@
+import bpy
+
+from bpy.types import Operator
+from bpy.props import FloatProperty
+
+from . import ad_jobs
+
+class AD_OT_jobs_cancel(Operator):
+    """ Cancels the running background jobs """
+    bl_idname = "ad.jobs_cancel"
+    bl_label = "Cancel background jobs"
+    bl_options = {'INTERNAL'}
+
+    @classmethod
+    def poll(cls, context):
+        return ad_jobs.queue is not None
+
+    def execute(self, context):
+        ad_jobs.cancel_queue()
+
+        for area in context.screen.areas:
+            area.tag_redraw()
+
+        return {'FINISHED'}
+
+class AD_OT_jobs_status(Operator):
+    """ Shows the status of each background job """
+    bl_idname = "ad.jobs_status"
+    bl_label = "Background jobs"
+    bl_options = {'INTERNAL'}
+
+    @classmethod
+    def poll(cls, context):
+        return ad_jobs.queue is not None
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_popup(self, width=500)
+
+    def execute(self, context):
+        return {'FINISHED'}
+
+    def draw(self, context):
+        layout = self.layout
+        queue = ad_jobs.queue
+
+        # Case: Queue got cleared while the popup is open
+        if queue is None:
+            layout.label(text="No background jobs")
+            return
+
+        icons = {
+                'QUEUED': 'TIME',
+                'RUNNING': 'PLAY',
+                'DONE': 'CHECKMARK',
+                'FAILED': 'ERROR',
+                'CANCELLED': 'CANCEL',
+                }
+
+        layout.label(text=queue.summary())
+        col = layout.column(align=True)
+        for job in queue.jobs:
+            row = col.row()
+            split = row.split(factor=0.8)
+            split.label(text=job.label, icon=icons[job.status])
+            if job.status in {'DONE', 'FAILED', 'CANCELLED'}:
+                split.label(text="{:.1f}s".format(job.duration))
+            else:
+                split.label(text=job.status.capitalize())
+
+def draw_job_status(self, context):
+    """ draws progress and controls of the background jobs into the status bar """
+    queue = ad_jobs.queue
+    if queue is None:
+        return
+
+    layout = self.layout
+    row = layout.row(align=True)
+    row.label(text="Aqueduct: {}".format(queue.summary()))
+
+    if not queue.finished:
+        sub = row.row(align=True)
+        sub.ui_units_x = 6
+        sub.enabled = False
+        sub.prop(context.window_manager, 'AD_job_progress', text="", slider=True)
+
+    row.operator("ad.jobs_status", text="", icon='INFO')
+    if queue.finished:
+        row.operator("ad.jobs_cancel", text="", icon='X')
+    else:
+        row.operator("ad.jobs_cancel", text="", icon='CANCEL')
+
+classes = (
+        AD_OT_jobs_cancel,
+        AD_OT_jobs_status,
+        )
+
+def register():
+    bpy.types.WindowManager.AD_job_progress = FloatProperty(
+            name="Progress",
+            default=0.0,
+            min=0.0,
+            max=100.0,
+            subtype='PERCENTAGE')
+
+    from bpy.utils import register_class
+    for cls in classes:
+        register_class(cls)
+
+    bpy.types.STATUSBAR_HT_header.append(draw_job_status)
+
+def unregister():
+    bpy.types.STATUSBAR_HT_header.remove(draw_job_status)
+
+    # stop the workers, nobody is polling them anymore
+    ad_jobs.cancel_queue()
+
+    from bpy.utils import unregister_class
+    for cls in classes:
+        unregister_class(cls)
+
+    del bpy.types.WindowManager.AD_job_progress
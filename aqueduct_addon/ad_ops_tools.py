@@ -1,10 +1,13 @@
-import random
-
 import bpy
 
 from .ad_utils import *
+from . import ad_raycast
+from . import ad_transform
+from . import ad_modal
+from . import ad_scatter
 
 from bpy.types import Operator
+from bpy.props import StringProperty, IntProperty, BoolProperty, FloatProperty, EnumProperty
 
 class AD_OT_material_quickapply(Operator):
     """ Pick and apply materials quickly """
@@ -99,6 +102,36 @@ class AD_OT_material_quickapply(Operator):
 
         return {'RUNNING_MODAL'}
 
+class AD_OT_raycast_benchmark(Operator):
+    """ Times the raycast methods of the modal tools on generated scenes """
+    bl_idname = "ad.raycast_benchmark"
+    bl_label = "Raycast benchmark"
+    bl_options = {'INTERNAL'}
+
+    counts : StringProperty(name="Instances", description="Comma separated instance counts", default="1000,10000,100000")
+    rays : IntProperty(name="Rays", default=100, min=1)
+    loop_rays : IntProperty(name="Rays (all instances)", description="Rays of the slow reference method", default=5, min=1)
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
+
+    def execute(self, context):
+        try:
+            counts = [int(count) for count in self.counts.split(",") if count.strip() != ""]
+        except ValueError:
+            self.report({'ERROR'}, "Instance counts have to be numbers")
+            return {'CANCELLED'}
+
+        results = ad_raycast.benchmark(context, counts, self.rays, self.loop_rays)
+
+        log("Raycast benchmark:")
+        for count, instancing, method, setup, duration, hits in results:
+            log("  {:>7} {:5} instances {:6} setup {:8.1f} ms, {:8.3f} ms per ray, {} hits".format(
+                count, instancing, method, setup * 1000, duration * 1000, hits))
+
+        self.report({'INFO'}, "Raycast benchmark finished, see the console")
+        return {'FINISHED'}
+
 class AD_OT_object_quickplace_old(Operator):
     bl_idname = "ad.object_quickplace"
     bl_label = "Object QuickPlace"
@@ -244,6 +277,9 @@ class AD_OT_object_quickplace(Operator):
     bl_label = "Object QuickPlace"
     bl_options = {'REGISTER', 'UNDO'}
 
+    seed : IntProperty(name="Seed", description="Seed of the random offsets", default=0)
+    world : BoolProperty(name="World axes", description="Move along the world axes instead of the parent space axes", default=False)
+
     def invoke(self, context ,event):
         self.axis = ('X', 'Y', 'Z')
         self.axis_index = 0
@@ -252,16 +288,10 @@ class AD_OT_object_quickplace(Operator):
         self.randomness = 0
 
         if len(context.selected_objects) != 0:
-            self.objects = context.selected_objects
-
-            # get starting position for all objects
-            # set random values for each object
-            self.start_locations = []
-            self.random_values = []
-            for obj in self.objects:
-                self.start_locations.append(obj.location.copy())
-                self.random_values.append((random.random() - 0.5) * 2)
+            # start locations and random values of all objects as arrays
+            self.transform = ad_transform.BulkTransform(context.selected_objects, self.seed)
 
+            self.scheduler = ad_modal.ModalScheduler(context, self.bl_label)
             context.window_manager.modal_handler_add(self)
             return {'RUNNING_MODAL'}
         else:
@@ -271,8 +301,8 @@ class AD_OT_object_quickplace(Operator):
         context.window.cursor_set('SCROLL_X')
 
         if event.type in {'RIGHTMOUSE', 'ESC'}:
-            for i, obj in enumerate(self.objects):
-                obj.location = self.start_locations[i]
+            self.transform.reset()
+            self.scheduler.stop(context)
             context.window.cursor_set('DEFAULT')
             context.area.header_text_set(None)
             return {'CANCELLED'}
@@ -289,21 +319,37 @@ class AD_OT_object_quickplace(Operator):
 
         elif event.type == 'W' and event.value == 'PRESS':
             self.axis_index = (self.axis_index + 1) % 3
-            for i, obj in enumerate(self.objects):
-                obj.location = self.start_locations[i]
+            self.transform.reset()
 
-        elif event.type == 'MOUSEMOVE':
+        elif event.type == 'L' and event.value == 'PRESS':
+            self.world = not self.world
             self.transform_objects(context, event)
 
+        elif event.type == 'R' and event.value == 'PRESS':
+            self.seed += 1
+            self.transform.reseed(self.seed)
+            self.transform_objects(context, event)
+
+        # mouse moves get coalesced, the latest one is handled on the next timer tick
+        elif event.type == 'MOUSEMOVE':
+            self.scheduler.push(event)
+
+        elif event.type == 'TIMER':
+            self.scheduler.run(context, self.transform_objects)
+
         elif event.type == 'LEFTMOUSE':
+            self.scheduler.stop(context)
             context.window.cursor_set('DEFAULT')
             context.area.header_text_set(None)
             return {'FINISHED'}
 
-        context.area.header_text_set("QuickPlace | Transform-Offset: {:.2f} | Randomness {:.1f} | W : Toggle Transform Axis ({})".format(
+        context.area.header_text_set("QuickPlace | Transform-Offset: {:.2f} | Randomness {:.1f} | W : Toggle Transform Axis ({}) | L: Toggle Space ({}) | R: Reseed ({}){}".format(
         self.trans_offset,
         self.randomness / 10,
-        self.axis[self.axis_index]
+        self.axis[self.axis_index],
+        "World" if self.world else "Local",
+        self.seed,
+        self.scheduler.timing()
         ))
 
         return {'RUNNING_MODAL'}
@@ -311,10 +357,10 @@ class AD_OT_object_quickplace(Operator):
     def transform_objects(self, context, event):
         delta_x = event.mouse_x - self.start_mousepos
         self.trans_offset = delta_x * 0.01
-        for i, obj in enumerate(self.objects):
-            random_offset = lerp(1.0, self.random_values[i], self.randomness * 0.1)
-            obj.location = self.start_locations[i]
-            obj.location[self.axis_index] += self.trans_offset * random_offset
+        with self.scheduler.phase("math"):
+            locations = self.transform.locations(self.axis_index, self.trans_offset, self.randomness * 0.1, self.world)
+        with self.scheduler.phase("write"):
+            self.transform.write('location', locations)
 
 class AD_OT_object_quickrotate(Operator):
     """ Randomized object rotation """
@@ -322,6 +368,9 @@ class AD_OT_object_quickrotate(Operator):
     bl_label = "Object QuickRotate"
     bl_options = {'REGISTER', 'UNDO'}
 
+    seed : IntProperty(name="Seed", description="Seed of the random rotations", default=0)
+    world : BoolProperty(name="World axes", description="Rotate around the world axes instead of the local axes", default=False)
+
     def invoke(self, context, event):
         self.axis = ('X', 'Y', 'Z')
         self.axis_index = 2
@@ -330,17 +379,10 @@ class AD_OT_object_quickrotate(Operator):
         self.randomness = 0
 
         if len(context.selected_objects) != 0:
-            self.objects = context.selected_objects
-
-            # get starting rotations for all objects
-            # set random values for each object
-            self.start_rotations = []
-            self.random_values = []
-            for obj in self.objects:
-                self.start_rotations.append(obj.rotation_euler.copy())
-                self.random_values.append((random.random() - 0.5) * 2)
-
+            # start rotations and random values of all objects as arrays
+            self.transform = ad_transform.BulkTransform(context.selected_objects, self.seed)
 
+            self.scheduler = ad_modal.ModalScheduler(context, self.bl_label)
             context.window_manager.modal_handler_add(self)
             return {'RUNNING_MODAL'}
         else:
@@ -351,8 +393,8 @@ class AD_OT_object_quickrotate(Operator):
         context.window.cursor_set('SCROLL_X')
 
         if event.type in {'RIGHTMOUSE', 'ESC'}:
-            for i, obj in enumerate(self.objects):
-                obj.rotation_euler = self.start_rotations[i]
+            self.transform.reset()
+            self.scheduler.stop(context)
             context.window.cursor_set('DEFAULT')
             context.area.header_text_set(None)
             return {'CANCELLED'}
@@ -369,46 +411,173 @@ class AD_OT_object_quickrotate(Operator):
 
         elif event.type == 'E' and event.value == 'PRESS':
             self.axis_index = (self.axis_index + 1) % 3
-            for i, obj in enumerate(self.objects):
-                obj.rotation_euler = self.start_rotations[i]
+            self.transform.reset()
 
+        elif event.type == 'L' and event.value == 'PRESS':
+            self.world = not self.world
+            self.rotate_objects(context, event)
 
-        elif event.type == 'MOUSEMOVE':
+        elif event.type == 'R' and event.value == 'PRESS':
+            self.seed += 1
+            self.transform.reseed(self.seed)
             self.rotate_objects(context, event)
 
+        # mouse moves get coalesced, the latest one is handled on the next timer tick
+        elif event.type == 'MOUSEMOVE':
+            self.scheduler.push(event)
+
+        elif event.type == 'TIMER':
+            self.scheduler.run(context, self.rotate_objects)
+
         elif event.type == 'LEFTMOUSE':
+            self.scheduler.stop(context)
             context.window.cursor_set('DEFAULT')
             context.area.header_text_set(None)
             return {'FINISHED'}
 
-        context.area.header_text_set("QuickRotate | Rotation-Offset: {:.2f} | Randomness: {:.1f} | E: Toggle Rotation Axis ({})".format(
+        context.area.header_text_set("QuickRotate | Rotation-Offset: {:.2f} | Randomness: {:.1f} | E: Toggle Rotation Axis ({}) | L: Toggle Space ({}) | R: Reseed ({}){}".format(
             math.degrees(self.rot_offset),
             self.randomness / 10,
-            self.axis[self.axis_index]
+            self.axis[self.axis_index],
+            "World" if self.world else "Local",
+            self.seed,
+            self.scheduler.timing()
             ))
 
         return {'RUNNING_MODAL'}
 
     def rotate_objects(self, context, event):
-            delta_x = event.mouse_x - self.start_mousepos
-            self.rot_offset = delta_x * 0.01
-            for i, obj in enumerate(self.objects):
-                random_offset = lerp(1.0, self.random_values[i], self.randomness * 0.1)
-                obj.rotation_euler = self.start_rotations[i]
-                obj.rotation_euler.rotate_axis(self.axis[self.axis_index], (self.rot_offset * random_offset))
+        delta_x = event.mouse_x - self.start_mousepos
+        self.rot_offset = delta_x * 0.01
+        with self.scheduler.phase("math"):
+            eulers = self.transform.rotations(self.axis_index, self.rot_offset, self.randomness * 0.1, self.world)
+        with self.scheduler.phase("write"):
+            self.transform.write('rotation_euler', eulers)
+
+class AD_OT_scatter_objects(Operator):
+    """ Scatters the objects of a collection over the surfaces of the selected meshes """
+    bl_idname = "ad.scatter_objects"
+    bl_label = "Scatter"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    collection : StringProperty(name="Assets", description="Collection with the objects to scatter")
+    mode : EnumProperty(
+            name="Mode",
+            items=(
+                ('LINKED', "Linked duplicates", "Linked duplicates of the top level objects of the collection"),
+                ('INSTANCE', "Collection instances", "Instances of the collection, or of its child collections as variants"),
+                ),
+            default='LINKED')
+    count : IntProperty(name="Count", default=100, min=1, soft_max=10000)
+    seed : IntProperty(name="Seed", default=0, min=0)
+    min_distance : FloatProperty(name="Min distance", description="Minimum distance between scattered objects, 0 to allow any", default=0.0, min=0.0, unit='LENGTH')
+    density_group : StringProperty(name="Density", description="Vertex group of the targets scaling the density, empty for an even spread")
+    align : BoolProperty(name="Align to normal", default=True)
+    spin : FloatProperty(name="Random spin", description="Random rotation around the normal", default=math.radians(360), min=0.0, max=math.radians(360), subtype='ANGLE')
+    scale_min : FloatProperty(name="Scale min", default=1.0, min=0.001)
+    scale_max : FloatProperty(name="Scale max", default=1.0, min=0.001)
+
+    @classmethod
+    def poll(cls, context):
+        return any(obj.type == 'MESH' for obj in context.selected_objects)
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
+
+    def draw(self, context):
+        layout = self.layout
+        layout.prop_search(self, "collection", bpy.data, "collections")
+        layout.prop(self, "mode")
+        layout.prop(self, "count")
+        layout.prop(self, "seed")
+        layout.prop(self, "min_distance")
+
+        targets = [obj for obj in context.selected_objects if obj.type == 'MESH']
+        if context.active_object in targets:
+            layout.prop_search(self, "density_group", context.active_object, "vertex_groups")
+        else:
+            layout.prop(self, "density_group")
+
+        layout.prop(self, "align")
+        layout.prop(self, "spin")
+        row = layout.row(align=True)
+        row.prop(self, "scale_min")
+        row.prop(self, "scale_max")
+
+    def variants(self, assets):
+        """ objects or collections to pick from for each point """
+        if self.mode == 'INSTANCE':
+            return list(assets.children) or [assets]
+        return [obj for obj in assets.all_objects if obj.parent is None]
+
+    def execute(self, context):
+        # GUARD CLAUSES
+        assets = bpy.data.collections.get(self.collection)
+        if assets is None:
+            self.report({'ERROR'}, "Choose a collection to scatter")
+            return {'CANCELLED'}
+
+        variants = self.variants(assets)
+        if not variants:
+            self.report({'ERROR'}, "Collection {} has no objects".format(assets.name))
+            return {'CANCELLED'}
+
+        targets = [obj for obj in context.selected_objects if obj.type == 'MESH' and obj.name not in assets.all_objects]
+        if not targets:
+            self.report({'ERROR'}, "Select the meshes to scatter on")
+            return {'CANCELLED'}
+
+        start = time.perf_counter()
+        depsgraph = context.evaluated_depsgraph_get()
+        points, normals = ad_scatter.scatter_surfaces(targets, depsgraph, self.count, self.seed,
+                self.min_distance, self.density_group)
+        if len(points) == 0:
+            self.report({'WARNING'}, "No surface to scatter on")
+            return {'CANCELLED'}
+
+        choices, angles, scales = ad_scatter.random_placements(len(points), len(variants), self.seed,
+                self.spin, self.scale_min, self.scale_max)
+
+        scatter = bpy.data.collections.new("Scatter_" + assets.name)
+        context.view_layer.active_layer_collection.collection.children.link(scatter)
+
+        up = Vector((0, 0, 1))
+        for point, normal, choice, angle, scale in zip(points.tolist(), normals.tolist(),
+                choices.tolist(), angles.tolist(), scales.tolist()):
+            variant = variants[choice]
+
+            # Case: Collection instance
+            if self.mode == 'INSTANCE':
+                obj = bpy.data.objects.new(variant.name, None)
+                obj.instance_type = 'COLLECTION'
+                obj.instance_collection = variant
+                obj.scale = (scale, scale, scale)
+            # Case: Linked duplicate, shares the data of the asset
+            else:
+                obj = variant.copy()
+                obj.parent = None
+                obj.scale = variant.scale * scale
+
+            scatter.objects.link(obj)
+            obj.location = point
+
+            if self.align:
+                orient_to_vector(obj, Vector(normal), up, None)
+            else:
+                obj.rotation_euler = (0, 0, 0)
+            obj.rotation_euler.rotate_axis('Z', angle)
 
-                # if self.world:
-                    # if self.axis[self.axis_index] == 'X':
-                    #     obj.rotation_euler.x = self.start_rotations[i].x + (self.rot_offset * random_offset)
-                    # if self.axis[self.axis_index] == 'Y':
-                    #     obj.rotation_euler.y = self.start_rotations[i].y + (self.rot_offset * random_offset)
-                    # if self.axis[self.axis_index] == 'Z':
-                    #     obj.rotation_euler.z = self.start_rotations[i].z + (self.rot_offset * random_offset)
+        log("Scattered {} objects on {} meshes in {:.2f}s".format(len(points), len(targets), time.perf_counter() - start))
+        if len(points) < self.count:
+            self.report({'WARNING'}, "Only {} of {} objects fit at the minimum distance".format(len(points), self.count))
+        return {'FINISHED'}
 
 classes = (
     AD_OT_material_quickapply,
     AD_OT_object_quickplace,
     AD_OT_object_quickrotate,
+    AD_OT_raycast_benchmark,
+    AD_OT_scatter_objects,
         )
 
 register, unregister = bpy.utils.register_classes_factory(classes)
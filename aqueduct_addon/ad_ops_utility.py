@@ -1,13 +1,19 @@
 import json
 import os
-from shutil import copyfile
+import time
+import shutil
+import tempfile
 
 import bpy
 
 from bpy.types import Operator, PropertyGroup 
-from bpy.props import StringProperty, EnumProperty, BoolProperty, CollectionProperty
+from bpy.props import StringProperty, EnumProperty, BoolProperty, IntProperty, CollectionProperty
 
 from .ad_utils import *
+from .ad_jobs import Job, JobRunner, run_jobs, worker_count
+from .ad_hash import DatablockHasher, load_manifest, is_unchanged, record_exports
+from . import ad_thumbcache
+from .ad_textures import LINK_MODES, package_textures, log_transfers, texture_settings
 
 class AD_TYPE_Resource(PropertyGroup):
     selected: BoolProperty(name="Selected", default=False)
@@ -70,6 +76,9 @@ class AD_OT_export_resource(Operator):
     blocknames : StringProperty(default="")
     pivot : StringProperty(default='-Z')
     package_images: BoolProperty(default=False)
+    render_thumbnail: BoolProperty(default=False)
+    split_into_files: BoolProperty(default=False)
+    incremental: BoolProperty(default=False)
 
     def execute(self, context):
         # restore namelist from string
@@ -93,72 +102,134 @@ class AD_OT_export_resource(Operator):
                 if name in bpy.data.materials.keys():
                     self.datablocks.append(bpy.data.materials[name])
 
+        # hash the content of each file to export
+        hasher = DatablockHasher()
+        options = (self.mode, self.pivot, self.package_images)
+        if self.package_images:
+            options += tuple(sorted(texture_settings().items()))
+        if self.split_into_files:
+            exports = [(
+                asset_filepath(self.filepath, block.name),
+                hasher.export_digest([block], options),
+                [block.name]
+                ) for block in self.datablocks]
+        else:
+            exports = [(
+                self.filepath,
+                hasher.export_digest(self.datablocks, options),
+                [block.name for block in self.datablocks]
+                )]
+
+        # skip files exported from the same content before
+        if self.incremental:
+            manifest = load_manifest(os.path.dirname(self.filepath))
+            stale = [export for export in exports if not is_unchanged(export[0], export[1], manifest)]
+            log("Skipping {} unchanged file/s".format(len(exports) - len(stale)))
+
+            # unchanged files that lost their thumbnail only need it rendered again
+            if self.render_thumbnail:
+                missing = [(export[0], self.thumbnail_mode) for export in exports
+                        if export not in stale and ad_thumbcache.rendered_thumbnail(export[0]) == ""]
+                missing = ad_thumbcache.split_cached(missing)
+                if missing:
+                    log("Rendering {} missing thumbnail/s".format(len(missing)))
+                    run_jobs(thumbnail_batch_jobs(missing))
+
+            exports = stale
+
+        # Case: Nothing changed since the last export
+        if len(exports) == 0:
+            self.report({'INFO'}, "All resources are unchanged, nothing to export")
+            return {'FINISHED'}
+
+        blocknames = [name for export in exports for name in export[2]]
+        self.datablocks = [block for block in self.datablocks if block.name in blocknames]
+
         # write them to the tempfile
-        lib_path = os.path.join(os.path.abspath(bpy.app.tempdir), "ad_res_tmp.blend")
+        lib_path = temp_filepath("ad_res_tmp_", ".blend")
         if bpy.app.version[1] < 90:
             bpy.data.libraries.write(lib_path, set(self.datablocks), relative_remap=True)
         else:
             bpy.data.libraries.write(lib_path, set(self.datablocks), path_remap='RELATIVE_ALL') 
 
-        # write cleanup script
-        scriptpath = self.write_lib_cleanup_script(self.filepath)
-
-        # cleanup and save the file
-        background_worker(scriptpath, lib_path)
+        if self.split_into_files:
+            job = self.split_export_job(lib_path, blocknames)
+        else:
+            job = self.export_job(lib_path)
+
+        # remember what the files were exported from once they are written
+        folder = os.path.dirname(self.filepath)
+        thumbnails = []
+        if self.split_into_files and self.render_thumbnail:
+            thumbnails = [(export[0], self.thumbnail_mode) for export in exports]
+        job.on_finish = lambda job: finish_export(folder, exports, thumbnails)
+
+        run_jobs([job])
+
+        # add files without thumbnails to the batch render list
+        if not self.render_thumbnail:
+            _list = context.preferences.addons[__package__].preferences.AD_batchrender_list
+            queued = {entry.filepath for entry in _list}
+            for export in exports:
+                # Case: Already waiting for its thumbnail
+                if export[0] in queued:
+                    continue
+                entry = _list.add()
+                entry.mode = self.thumbnail_mode
+                entry.filepath = export[0]
 
         return {'FINISHED'}
 
-    def write_lib_cleanup_script(self, save_path):
-        scriptpath = os.path.join(bpy.app.tempdir, "ad_res_script.py")
-        script = open(scriptpath, 'w', encoding='utf-8')
-
-        script.write("import bpy\n")
-        script.write("context = bpy.context\n")
-        script.write("scene = context.scene\n")
-
-        # rename the scene from Empty to Scene
-        script.write("scene.name = 'Scene'\n")
-
-        if self.mode == 'OBJECT':
-            # link the resources to the master collection
-            script.write("for obj in bpy.data.objects:\n")
-            script.write("    scene.collection.objects.link(obj)\n")
-
-            # center the objects around origin
-            script.write("bpy.ops.object.select_all(action='SELECT')\n")
-            script.write("bpy.ops.ad.center_objects(pivot='{}')\n".format(self.pivot))
-
-        if self.mode == 'COLLECTION':
-            # link all collections to the scene master collection
-            script.write("for col in bpy.data.collections:\n")
-            script.write("    scene.collection.children.link(col)\n")
-
-            # center the objects around origin
-            script.write("bpy.ops.object.select_all(action='SELECT')\n")
-            script.write("bpy.ops.ad.center_objects(pivot='{}')\n".format(self.pivot))
-
-        if self.mode == 'MATERIAL':
-            # create geometry to hold the materials
-            # TODO: Bevel geometry
-            script.write("for i, mat in enumerate(bpy.data.materials):\n")
-            script.write("    bpy.ops.mesh.primitive_cube_add(location=(4*i, 0, 0))\n")
-            script.write("    bpy.ops.object.material_slot_add()\n")
-            script.write("    bpy.context.active_object.material_slots[0].material = mat\n")
-
-        # save the file
-        # disable blend1 files just in case of overwriting of existing blendfiles
-        script.write("bpy.context.preferences.filepaths.save_version = 0\n")
-        script.write("bpy.ops.wm.save_as_mainfile(filepath='{}')\n".format(save_path))
-
-        if self.package_images:
-            # relink
-            script.write("bpy.ops.ad.package_images()\n")
-            # save after relinking
-            script.write("bpy.ops.wm.save_as_mainfile(filepath='{}')\n".format(save_path))
-
-        script.close()
-
-        return scriptpath
+    def export_job(self, lib_path):
+        """ cleans up the library and saves it to filepath """
+        job = Job("Export {}".format(os.path.basename(self.filepath)), {
+                'type': 'EXPORT',
+                'filepath': lib_path,
+                'output': self.filepath,
+                'mode': self.mode,
+                'pivot': self.pivot,
+                'package_images': self.package_images,
+                'textures': texture_settings(),
+                })
+
+        # render the thumbnail once the file is saved
+        if self.render_thumbnail:
+            job.followups.append(thumbnail_job(self.filepath, self.thumbnail_mode))
+
+        return job
+
+    def split_export_job(self, lib_path, blocknamelist):
+        """ saves each datablock of the library to its own file next to filepath
+            all files and thumbnails get written by a single worker
+        """
+        specs = []
+        filepaths = []
+        for name in blocknamelist:
+            filepath = asset_filepath(self.filepath, name)
+            filepaths.append(filepath)
+            specs.append({
+                    'type': 'EXPORT_ASSET',
+                    'filepath': "",
+                    'library': lib_path,
+                    'block': name,
+                    'output': filepath,
+                    'mode': self.mode,
+                    'pivot': self.pivot,
+                    'package_images': self.package_images,
+                    'textures': texture_settings(),
+                    })
+
+        # render the thumbnails in the same session
+        if self.render_thumbnail:
+            for filepath in filepaths:
+                specs += thumbnail_job(filepath, self.thumbnail_mode).specs
+
+        label = "Export {} files to {}".format(len(filepaths), os.path.dirname(self.filepath))
+        return Job(label, specs)
+
+    @property
+    def thumbnail_mode(self):
+        return 'MATERIAL' if self.mode == 'MATERIAL' else 'OBJECT'
 
 class AD_OT_relocate_file(Operator):
     """ moves the blendfile and its resources to a new location """
@@ -174,41 +245,27 @@ class AD_OT_relocate_file(Operator):
         log("Source: {}".format(self.source))
         log("Destination: {}".format(self.destination))
 
-        # write the script
-        scriptpath = self.write_relocate_script()
-
         # call background worker
-        background_worker(scriptpath, filepath=self.source)
+        run_jobs([relocate_job(self.source, self.destination)])
 
 
         return {'FINISHED'}
 
-    def write_relocate_script(self):
-        scriptpath = os.path.join(bpy.app.tempdir, "ad_relocate_script.py")
-        script = open(scriptpath, 'w', encoding='utf-8')
-
-        script.write("import bpy\n")
-
-        # save file to the new location
-        script.write("bpy.context.preferences.filepaths.save_version = 0\n")
-        script.write("bpy.ops.wm.save_as_mainfile(filepath='{}')\n".format(self.destination))
-
-        # package its assets next to it
-        script.write("bpy.ops.ad.package_images()\n")
-
-        # save again
-        script.write("bpy.ops.wm.save_mainfile()\n")
-
-        script.close()
-
-        return scriptpath
-
 class AD_OT_package_images(Operator):
     """ gathers images, packages and relinks paths """
     bl_idname = "ad.package_images"
     bl_label = "Package textures"
     bl_options = {'INTERNAL'}
 
+    store_path : StringProperty(
+            name="Texture store",
+            description="Library-wide folder keeping each texture once, empty copies them next to the file",
+            default="",
+            subtype='DIR_PATH'
+            )
+    link_mode : EnumProperty(name="Link mode", items=LINK_MODES)
+    threads : IntProperty(name="Parallel copies", default=8, min=1)
+
     def execute(self, context):
         log("executing {}".format(self.bl_idname))
 
@@ -242,26 +299,30 @@ class AD_OT_package_images(Operator):
                 self.report({'ERROR'}, "Can't write files, no write permission")
                 return {'CANCELLED'}
 
-        relink_count = 0
+        # gather the files of the used images, packed images get unpacked
+        sources = {}
         for image in images:
             if image.users > 0:
-
-                # copy the image to a texture folder next to the blendfile
-                file_src = bpy.path.abspath(image.filepath)
-                file_dest = os.path.join(dirpath, bpy.path.basename(image.filepath))
+                file_src = os.path.normpath(bpy.path.abspath(image.filepath, library=image.library))
                 if os.path.exists(file_src):
-                    if not os.path.exists(file_dest):
-                        copyfile(file_src, file_dest)
-
-                    # relink the image filepaths to the new location
-                    image.filepath = bpy.path.relpath(file_dest)
-                    relink_count += 1
+                    sources[image] = file_src
                 # if the image is packed into the blend
                 elif image.packed_file != None:
                     # unpack() will put the image into a textures folder next to the blend
                     # and relink the image node
                     image.unpack()
 
+        # copy or link the images to a texture folder next to the blendfile
+        start = time.time()
+        destinations, stats = package_textures(
+                sources.values(), dirpath, self.store_path, self.link_mode, self.threads)
+        log_transfers(stats, time.time() - start)
+
+        # relink the image filepaths to the new location
+        for image, file_src in sources.items():
+            image.filepath = bpy.path.relpath(destinations[file_src])
+        relink_count = len(sources)
+
         log("Relinked {} images!".format(relink_count))
         return {'FINISHED'}
 
@@ -285,31 +346,12 @@ class AD_OT_package_images_batch(Operator):
             return {'CANCELLED'}
 
         context.window.cursor_set('WAIT')
-        # Write Script file
-        scriptpath = self.write_package_script()
-        # Call Background worker to render
-        background_worker(scriptpath, self.filepath)
+        # Call Background worker to package
+        run_jobs([package_job(self.filepath)])
 
         context.window.cursor_set('DEFAULT')
         return {'FINISHED'}
 
-    def write_package_script(self):
-        scriptpath = os.path.join(bpy.app.tempdir, "ad_package_script.py")
-        script = open(scriptpath, 'w', encoding='utf-8')
-
-        script.write("import bpy\n")
-
-        # Package images and relink image nodes
-        script.write("bpy.ops.ad.package_images()\n")
-
-        # Save the file and disable backup versions (no .blend1)
-        script.write("bpy.context.preferences.filepaths.save_version = 0\n")
-        script.write("bpy.ops.wm.save_mainfile()\n")
-
-        script.close()
-
-        return scriptpath
-
 class AD_OT_render_thumbnail(Operator):
     bl_idname = "ad.render_thumbnail"
     bl_label = "Render thumbnail"
@@ -326,8 +368,13 @@ class AD_OT_render_thumbnail(Operator):
                 ('MATERIAL', "Material", 'MATERIAL', 1)
                 ])
 
+    quality : EnumProperty(name="Quality",
+            items=[('DEFAULT', "Default", "Quality tier of the addon preferences")] + ad_thumbcache.QUALITY_TIERS,
+            default='DEFAULT')
+
     def execute(self, context):
         prefs = context.preferences.addons[__package__].preferences
+        quality = None if self.quality == 'DEFAULT' else self.quality
 
         #GUARD CLAUSES
 
@@ -344,110 +391,278 @@ class AD_OT_render_thumbnail(Operator):
         if self.mode == 'MATERIAL' and os.path.exists(prefs.AD_material_studio_path) == False:
             self.report({'ERROR'}, "Path to Studio blendfile is invalid")
             return {'CANCELLED'}
-        context.window.cursor_set('WAIT')
-        if self.mode == 'OBJECT':
-            # Write Script file
-            scriptpath = self.write_objrender_script(self.filepath)
-            # Call Background worker to render
-            background_worker(scriptpath, prefs.AD_object_studio_path)
-
-        else:
-            scriptpath = self.write_matrender_script(self.filepath)
-            background_worker(scriptpath, prefs.AD_material_studio_path)
+        # Case: Thumbnail of the same file and settings is cached
+        if len(ad_thumbcache.split_cached([(self.filepath, self.mode)], quality)) == 0:
+            self.report({'INFO'}, "Thumbnail restored from cache")
+            return {'FINISHED'}
 
+        context.window.cursor_set('WAIT')
+        # Call Background worker to render
+        run_jobs([thumbnail_job(self.filepath, self.mode, quality)])
 
         context.window.cursor_set('DEFAULT')
         return {'FINISHED'}
 
-    def write_objrender_script(self, blend_filepath):
-        prefs = bpy.context.preferences.addons[__package__].preferences
-        studio_path = prefs.AD_object_studio_path
-        thumbnail_size = prefs.AD_thumbnail_size
-        scriptpath = os.path.join(bpy.app.tempdir, "ad_objrender_script.py")
-        thumbnail_path = os.path.splitext(blend_filepath)[0]
-        script = open(scriptpath, 'w', encoding='utf-8')
-
-        script.write("import bpy\n")
-
-        script.write("context = bpy.context\n")
-        script.write("scene = context.scene\n")
-        script.write("prefs = context.preferences.addons['{}'].preferences\n".format(__package__))
-
-        # merge all objects from the blendfile
-        script.write("with bpy.data.libraries.load('{}') as (data_from, data_to):\n".format(
-            blend_filepath))
-        script.write("    data_to.objects = data_from.objects\n")
-
-        # link all objects to the scene and select them
-        script.write("for obj in data_to.objects:\n")
-        script.write("    scene.collection.objects.link(obj)\n")
-        script.write("    obj.select_set(True)\n")
+class AD_OT_thumbnail_cache_stats(Operator):
+    """ Reports the hit/miss statistics of the thumbnail cache """
+    bl_idname = "ad.thumbnail_cache_stats"
+    bl_label = "Thumbnail cache statistics"
+    bl_options = {'INTERNAL'}
 
-        # frame all objects with camera
-        script.write("scene.camera.data.lens += 5\n")
-        script.write("bpy.ops.view3d.camera_to_view_selected()\n")
-        script.write("scene.camera.data.lens -= 5\n")
+    def execute(self, context):
+        summary = ad_thumbcache.summary()
+        log("Thumbnail cache: {}".format(summary))
+        self.report({'INFO'}, summary)
 
-        # render frame
-        script.write("render = scene.render\n")
-        script.write("render.resolution_x = {}\n".format(thumbnail_size))
-        script.write("render.resolution_y = {}\n".format(thumbnail_size))
-        script.write("render.use_file_extension = True\n")
-        script.write("render.filepath='{}'\n".format(thumbnail_path))
+        return {'FINISHED'}
 
-        script.write("bpy.ops.render.render(write_still=True)\n")
+class AD_OT_thumbnail_cache_clear(Operator):
+    """ Removes all cached thumbnails """
+    bl_idname = "ad.thumbnail_cache_clear"
+    bl_label = "Clear thumbnail cache"
+    bl_options = {'INTERNAL'}
 
-        script.close()
+    def execute(self, context):
+        ad_thumbcache.clear()
+        self.report({'INFO'}, "Thumbnail cache cleared")
 
-        return scriptpath
+        return {'FINISHED'}
 
-    def write_matrender_script(self, blend_filepath):
-        prefs = bpy.context.preferences.addons[__package__].preferences
-        studio_path = prefs.AD_material_studio_path
-        thumbnail_size = prefs.AD_thumbnail_size
-        scriptpath = os.path.join(bpy.app.tempdir, "ad_matrender_script.py")
-        thumbnail_path = os.path.splitext(blend_filepath)[0]
+class AD_OT_thumbnail_benchmark(Operator):
+    """ Times one render per asset against contact sheets for the object files of the batch render list """
+    bl_idname = "ad.thumbnail_benchmark"
+    bl_label = "Thumbnail benchmark"
+    bl_options = {'INTERNAL'}
 
-        script = open(scriptpath, 'w', encoding='utf-8')
+    count : IntProperty(name="Files", description="Object files of the batch render list to render", default=16, min=1)
 
-        script.write("import bpy\n")
+    @classmethod
+    def poll(cls, context):
+        prefs = context.preferences.addons[__package__].preferences
+        return any(entry.mode == 'OBJECT' for entry in prefs.AD_batchrender_list)
 
-        script.write("context = bpy.context\n")
-        script.write("scene = context.scene\n")
-        script.write("prefs = context.preferences.addons['{}'].preferences\n".format(__package__))
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
 
-        # merge all materials from the blendfile
-        script.write("with bpy.data.libraries.load('{}') as (data_from, data_to):\n".format(
-            blend_filepath))
-        script.write("    data_to.materials = data_from.materials\n")
+    def execute(self, context):
+        prefs = context.preferences.addons[__package__].preferences
 
-        script.write("materials = data_to.materials\n")
+        #GUARD CLAUSES
 
-        # get material geo
-        script.write("matgeo = [obj for obj in scene.objects if 'MATGEO' in obj.name]\n")
+        # Case: Studio file does not exist
+        if os.path.exists(prefs.AD_object_studio_path) == False:
+            self.report({'ERROR'}, "Path to Studio blendfile is invalid")
+            return {'CANCELLED'}
 
-        script.write("for geo in matgeo:\n")
-        # create matslots on geo if it doesn't have em
-        script.write("    if len(geo.material_slots) == 0:\n")
-        script.write("        context.view_layer.objects.active = geo\n")
-        script.write("        bpy.ops.object.material_slot_add()\n")
-        # assign first material to geo
-        script.write("    geo.material_slots[0].material = materials[0]\n")
+        filepaths = [entry.filepath for entry in prefs.AD_batchrender_list
+                if entry.mode == 'OBJECT' and os.path.exists(entry.filepath)][:self.count]
 
-        # setup render settings
-        script.write("render = scene.render\n")
-        script.write("render.resolution_x = {}\n".format(thumbnail_size))
-        script.write("render.resolution_y = {}\n".format(thumbnail_size))
-        script.write("render.use_file_extension = True\n")
-        script.write("render.filepath = '{}'\n".format(thumbnail_path))
+        # Case: No object files to render
+        if len(filepaths) == 0:
+            self.report({'ERROR'}, "No object files on the batch render list")
+            return {'CANCELLED'}
 
-        # render frame
-        script.write("bpy.ops.render.render(write_still=True)\n")
+        # render to a temp folder, the thumbnails next to the files stay as they are
+        folder = tempfile.mkdtemp(prefix="ad_thumbnail_benchmark_")
+
+        per_sheet = prefs.AD_sheet_columns ** 2
+        sheets = [sheet_spec(filepaths[start:start + per_sheet]) for start in range(0, len(filepaths), per_sheet)]
+        for i, item in enumerate(item for spec in sheets for item in spec['assets']):
+            item['output'] = os.path.join(folder, "sheet_{}".format(i))
+
+        # same size, quality tier and scaled down thumbnails as the sheets
+        single = []
+        for i, filepath in enumerate(filepaths):
+            spec = {
+                    'type': 'RENDER_OBJECT',
+                    'filepath': prefs.AD_object_studio_path,
+                    'asset': filepath,
+                    'output': os.path.join(folder, "single_{}".format(i)),
+                    }
+            spec.update(render_settings())
+            single.append(spec)
 
-        script.close()
+        context.window.cursor_set('WAIT')
+        timings = []
+        try:
+            for method, specs in (("One render per asset", single), ("Contact sheets", sheets)):
+                job = Job("Benchmark {}".format(method), specs)
+
+                start = time.time()
+                JobRunner([job], max_workers=1).run()
+                total = time.time() - start
+
+                if job.status != 'DONE':
+                    self.report({'ERROR'}, "Benchmark failed, see the console")
+                    return {'CANCELLED'}
+
+                # without starting the worker and loading the studio file
+                rendering = sum(result['duration'] for result in job.results)
+                timings.append((method, total, rendering))
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+            context.window.cursor_set('DEFAULT')
+
+        log("Thumbnail benchmark, {} files, {}x{} sheets:".format(
+            len(filepaths), prefs.AD_sheet_columns, prefs.AD_sheet_columns))
+        for method, total, rendering in timings:
+            log("  {:22} {:8.1f}s total, {:8.3f}s per thumbnail, {:8.3f}s per thumbnail in the worker".format(
+                method, total, total / len(filepaths), rendering / len(filepaths)))
+
+        speedup = timings[0][1] / max(timings[1][1], 1e-9)
+        self.report({'INFO'}, "Contact sheets {:.1f}x as fast as one render per asset, see the console".format(speedup))
+        return {'FINISHED'}
 
-        return scriptpath
+def finish_export(folder, exports, thumbnails):
+    """ records the exported files in the manifest and caches their thumbnails """
+    record_exports(folder, exports)
+    for filepath, mode in thumbnails:
+        ad_thumbcache.store(filepath, mode)
+    ad_thumbcache.save_index()
+
+def asset_filepath(filepath, blockname):
+    """ path of the file a datablock gets exported to if each asset gets its own file """
+    return os.path.join(os.path.dirname(filepath), blockname + ".blend")
+
+def render_settings(quality=None):
+    """ size, quality tier and scaled down sizes and formats of thumbnail specs
+        renders at the largest of the thumbnail size and the scaled down sizes
+    """
+    prefs = bpy.context.preferences.addons[__package__].preferences
+    quality = ad_thumbcache.default_quality(quality)
+    pyramid = ad_thumbcache.pyramid_sizes()
+
+    return {
+            'size': ad_thumbcache.quality_size(max([prefs.AD_thumbnail_size] + pyramid), quality),
+            'quality': quality,
+            'pyramid': pyramid,
+            'formats': sorted(prefs.AD_thumbnail_formats),
+            }
+
+def thumbnail_spec(filepath, mode, quality=None):
+    """ job spec rendering the thumbnail of a library file in the studio file of its mode
+        quality: quality tier, the one of the preferences if None
+    """
+    prefs = bpy.context.preferences.addons[__package__].preferences
+
+    if mode == 'OBJECT' and prefs.AD_thumbnail_sheet:
+        return sheet_spec([filepath], quality)
+
+    if mode == 'OBJECT':
+        job_type = 'RENDER_OBJECT'
+        studio_path = prefs.AD_object_studio_path
+    else:
+        job_type = 'RENDER_MATERIAL'
+        studio_path = prefs.AD_material_studio_path
 
+    spec = {
+            'type': job_type,
+            'filepath': studio_path,
+            'asset': filepath,
+            'output': os.path.splitext(filepath)[0],
+            }
+    spec.update(render_settings(quality))
+    return spec
+
+def sheet_spec(filepaths, quality=None):
+    """ job spec rendering the thumbnails of object library files as one contact sheet """
+    prefs = bpy.context.preferences.addons[__package__].preferences
+
+    spec = {
+            'type': 'RENDER_SHEET',
+            'filepath': prefs.AD_object_studio_path,
+            'assets': [{'asset': filepath, 'output': os.path.splitext(filepath)[0]} for filepath in filepaths],
+            'columns': prefs.AD_sheet_columns,
+            }
+    spec.update(render_settings(quality))
+    return spec
+
+def thumbnail_specs(filepaths, mode, quality=None):
+    """ job specs rendering the thumbnails of library files of the same mode
+        object files share contact sheets if they are enabled
+    """
+    prefs = bpy.context.preferences.addons[__package__].preferences
+
+    if mode == 'OBJECT' and prefs.AD_thumbnail_sheet:
+        per_sheet = prefs.AD_sheet_columns ** 2
+        return [sheet_spec(filepaths[start:start + per_sheet], quality)
+                for start in range(0, len(filepaths), per_sheet)]
+
+    return [thumbnail_spec(filepath, mode, quality) for filepath in filepaths]
+
+def spec_assets(spec):
+    """ library files a render spec makes thumbnails of """
+    if 'assets' in spec:
+        return [item['asset'] for item in spec['assets']]
+    return [spec['asset']]
+
+def thumbnail_job(filepath, mode, quality=None):
+    """ job rendering the thumbnail of a library file in the studio file of its mode """
+    quality = ad_thumbcache.default_quality(quality)
+    job = Job("Thumbnail {}".format(os.path.basename(filepath)), thumbnail_spec(filepath, mode, quality))
+
+    # keep the rendered thumbnail for the next request
+    job.on_finish = lambda job: store_thumbnail(filepath, mode, quality)
+
+    return job
+
+def store_thumbnail(filepath, mode, quality):
+    """ caches the rendered thumbnail of a single library file """
+    ad_thumbcache.store(filepath, mode, quality)
+    ad_thumbcache.save_index()
+
+def store_rendered(job, mode):
+    """ caches the thumbnails of the specs of a batch that rendered """
+    for spec, result in zip(job.specs, job.results):
+        if result['ok']:
+            for filepath in spec_assets(spec):
+                ad_thumbcache.store(filepath, mode, spec['quality'])
+    ad_thumbcache.save_index()
+
+def thumbnail_batch_jobs(entries, quality=None):
+    """ jobs rendering the thumbnails of (filepath, mode) pairs
+
+        Each job renders a batch of files in one worker, which opens the
+        studio file once and purges the last asset between renders.
+        The files of a mode are split evenly between the workers,
+        in batches of at most AD_render_batch_size files.
+    """
+    prefs = bpy.context.preferences.addons[__package__].preferences
+    workers = worker_count(prefs.AD_max_workers)
+
+    jobs = []
+    for mode in ('OBJECT', 'MATERIAL'):
+        batch = [filepath for filepath, entry_mode in entries if entry_mode == mode]
+        if len(batch) == 0:
+            continue
+
+        count = max(min(workers, len(batch)), math.ceil(len(batch) / prefs.AD_render_batch_size))
+        size = math.ceil(len(batch) / count)
+        for start in range(0, len(batch), size):
+            chunk = batch[start:start + size]
+            job = Job("Thumbnails {} ({} files)".format(os.path.basename(chunk[0]), len(chunk)),
+                    thumbnail_specs(chunk, mode, quality))
+            job.on_results = lambda job, mode=mode: store_rendered(job, mode)
+            jobs.append(job)
+
+    return jobs
+
+def package_job(filepath):
+    """ job packaging the textures of a library file """
+    return Job("Package {}".format(os.path.basename(filepath)), {
+            'type': 'PACKAGE',
+            'filepath': filepath,
+            'textures': texture_settings(),
+            })
+
+def relocate_job(source, destination):
+    """ job moving a library file and its textures to a new location """
+    return Job("Relocate {}".format(os.path.basename(source)), {
+            'type': 'RELOCATE',
+            'filepath': source,
+            'destination': destination,
+            'textures': texture_settings(),
+            })
 
 classes = (
     AD_TYPE_Resource,
@@ -458,6 +673,9 @@ classes = (
     AD_OT_center_objects,
     AD_OT_package_images,
     AD_OT_package_images_batch,
+    AD_OT_thumbnail_cache_stats,
+    AD_OT_thumbnail_cache_clear,
+    AD_OT_thumbnail_benchmark,
         )
 
 register, unregister = bpy.utils.register_classes_factory(classes)
@@ -0,0 +1,312 @@
+import os
+import json
+import time
+import atexit
+import socket
+import select
+import secrets
+import subprocess
+
+import bpy
+
+from .ad_utils import log, worker_command
+
+# seconds a worker may take to start blender and connect
+STARTUP_TIMEOUT = 120
+
+class Connection:
+    """ newline delimited json messages over a local socket """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = b""
+
+    def send(self, message):
+        data = json.dumps(message).encode('utf-8') + b"\n"
+        self.sock.sendall(data)
+
+    def poll(self, timeout=0.0):
+        """ returns True if a complete message is ready to be received
+            timeout: seconds to wait, None waits forever
+        """
+        while b"\n" not in self.buffer:
+            readable, _, _ = select.select([self.sock], [], [], timeout)
+            if not readable:
+                return False
+
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                raise ConnectionError("Connection closed by the other side")
+            self.buffer += chunk
+
+        return True
+
+    def recv(self):
+        self.poll(None)
+        line, self.buffer = self.buffer.split(b"\n", 1)
+        return json.loads(line.decode('utf-8'))
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+class PoolWorker:
+    """ a long-lived headless blender instance connected to the pool """
+
+    def __init__(self, pool):
+        self.conn = None
+        self.job = None
+        self.jobs_done = 0
+        self.memory = 0
+        self.started = time.time()
+
+        host, port = pool.listener.getsockname()
+        command = worker_command(
+                threads=pool.threads,
+                arguments=("--connect", "{}:{}".format(host, port))
+                )
+
+        env = os.environ.copy()
+        env['AD_WORKER_TOKEN'] = pool.token
+
+        self.process = subprocess.Popen(command, env=env)
+        log("Started background worker {}".format(self.process.pid))
+
+    @property
+    def alive(self):
+        return self.process.poll() is None
+
+    @property
+    def ready(self):
+        return self.conn is not None
+
+    @property
+    def busy(self):
+        return self.job is not None
+
+    def dispatch(self, specs):
+        """ sends a list of job specs to the worker """
+        self.job = specs
+        self.conn.send({'jobs': specs})
+
+    def poll(self, timeout=0.0):
+        """ returns the result of the running job or None if it is still running """
+        if self.job is None:
+            return None
+
+        try:
+            if not self.conn.poll(timeout):
+                if not self.alive:
+                    raise ConnectionError("Worker exited with code {}".format(self.process.returncode))
+                return None
+            result = self.conn.recv()
+        except (ConnectionError, OSError) as e:
+            result = {'ok': False, 'error': "Background worker crashed: {}".format(e), 'results': []}
+            self.kill()
+
+        self.jobs_done += len(self.job)
+        self.job = None
+        self.memory = result.get('memory', 0)
+
+        return result
+
+    def stop(self):
+        """ asks the worker to quit, kills it if it doesn't """
+        if self.conn is not None and self.alive:
+            try:
+                self.conn.send({'type': 'QUIT'})
+            except OSError:
+                pass
+
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.kill()
+
+        if self.conn is not None:
+            self.conn.close()
+
+    def kill(self):
+        if self.alive:
+            self.process.kill()
+            self.process.wait()
+
+        if self.conn is not None:
+            self.conn.close()
+
+class WorkerPool:
+    """ pool of headless blender instances that accept jobs over a local socket
+
+        size: maximum number of workers running at once
+        threads: render threads per worker, 0 lets blender decide
+        max_jobs: jobs a worker runs before it gets recycled
+        max_memory: resident memory in MB after which a worker gets recycled
+    """
+
+    def __init__(self, size=1, threads=0, max_jobs=50, max_memory=4096):
+        self.size = size
+        self.threads = threads
+        self.max_jobs = max_jobs
+        self.max_memory = max_memory
+
+        self.token = secrets.token_hex(16)
+        self.workers = []
+
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen()
+        self.listener.setblocking(False)
+
+    def accept(self):
+        """ hands pending connections to the workers that opened them """
+        while True:
+            try:
+                sock, _ = self.listener.accept()
+            except (BlockingIOError, socket.timeout):
+                return
+
+            sock.setblocking(True)
+            conn = Connection(sock)
+
+            # Case: Connection doesn't identify itself in time
+            try:
+                if not conn.poll(5.0):
+                    conn.close()
+                    continue
+                hello = conn.recv()
+            except (ConnectionError, OSError, ValueError):
+                conn.close()
+                continue
+
+            # Case: Connection doesn't belong to this pool
+            if hello.get('token') != self.token:
+                conn.close()
+                continue
+
+            for worker in self.workers:
+                if worker.process.pid == hello.get('pid') and not worker.ready:
+                    worker.conn = conn
+                    break
+            else:
+                conn.close()
+
+    def acquire(self):
+        """ returns an idle worker or None if all of them are busy
+            spawns new workers while the pool is below its size
+        """
+        self.accept()
+
+        for worker in list(self.workers):
+            # Case: Worker crashed or failed to start
+            if not worker.alive:
+                self.workers.remove(worker)
+                if not worker.ready:
+                    raise RuntimeError("Background worker failed to start")
+
+            # Case: Worker doesn't connect
+            elif not worker.ready and time.time() - worker.started > STARTUP_TIMEOUT:
+                worker.kill()
+                self.workers.remove(worker)
+                raise RuntimeError("Background worker did not connect in time")
+
+        for worker in self.workers:
+            if worker.ready and not worker.busy:
+                return worker
+
+        if len(self.workers) < self.size:
+            self.workers.append(PoolWorker(self))
+
+        return None
+
+    def resize(self, size):
+        """ changes the number of workers, stops idle ones above it
+            busy ones get retired by release once their job is done
+        """
+        self.size = size
+        for worker in [worker for worker in self.workers if not worker.busy]:
+            if len(self.workers) <= self.size:
+                break
+
+            log("Stopping background worker {}, the pool shrank to {}".format(worker.process.pid, self.size))
+            # Case: Still starting, there is no connection to ask it to quit
+            if worker.ready:
+                worker.stop()
+            else:
+                worker.kill()
+            self.workers.remove(worker)
+
+    def release(self, worker):
+        """ recycles the worker if it ran too many jobs or grew too large,
+            retires it if the pool has more workers than its size
+        """
+        if not worker.alive:
+            if worker in self.workers:
+                self.workers.remove(worker)
+            return
+
+        if len(self.workers) > self.size:
+            log("Retiring background worker {}, the pool shrank to {}".format(worker.process.pid, self.size))
+            worker.stop()
+            self.workers.remove(worker)
+
+        elif worker.jobs_done >= self.max_jobs or worker.memory > self.max_memory * 1024 * 1024:
+            log("Recycling background worker {} after {} jobs ({} MB)".format(
+                worker.process.pid,
+                worker.jobs_done,
+                worker.memory // (1024 * 1024)))
+            worker.stop()
+            self.workers.remove(worker)
+
+    def run(self, specs):
+        """ runs job specs on the next idle worker and waits for the result """
+        worker = self.acquire()
+        while worker is None:
+            time.sleep(0.05)
+            worker = self.acquire()
+
+        worker.dispatch(specs)
+
+        result = worker.poll(timeout=1.0)
+        while result is None:
+            result = worker.poll(timeout=1.0)
+
+        self.release(worker)
+
+        return result
+
+    def shutdown(self):
+        for worker in self.workers:
+            worker.stop()
+        self.workers.clear()
+        self.listener.close()
+
+_pool = None
+
+def get_pool(size=1, threads=0):
+    """ returns the shared worker pool configured from the addon preferences """
+    global _pool
+
+    prefs = bpy.context.preferences.addons[__package__].preferences
+
+    if _pool is None:
+        _pool = WorkerPool()
+
+    # new settings apply to workers started from now on, surplus workers stop
+    _pool.resize(size)
+    _pool.threads = threads
+    _pool.max_jobs = prefs.AD_worker_max_jobs
+    _pool.max_memory = prefs.AD_worker_max_memory
+
+    return _pool
+
+def shutdown_pool():
+    global _pool
+
+    if _pool is not None:
+        log("Shutting down background workers")
+        _pool.shutdown()
+        _pool = None
+
+atexit.register(shutdown_pool)
@@ -0,0 +1,956 @@
+# Scene raycast accelerator
+#
+# Casting against every mesh instance of the depsgraph on each click gets
+# slow in scenes with tens of thousands of instances. The accelerator keeps
+#   - the world bounds of every mesh instance in a bounding volume hierarchy
+#   - a mathutils BVHTree per evaluated mesh, built when a ray first reaches it
+# and only casts against the meshes whose bounds the ray passes, nearest
+# first. A depsgraph_update_post handler refits the bounds of moved objects
+# and drops the trees of edited meshes, the full hierarchy only gets rebuilt
+# when objects are added or removed.
+#
+# Without the hierarchy, a NumPy broad-phase tests the ray against the world
+# bounds of all instances at once and only casts against the hit ones,
+# nearest first. The per-instance loop is kept for reference.
+#
+# Geometry nodes instances can't be cached by key: their object only exists
+# while iterating the depsgraph and its original is the instancer. The
+# hierarchy casts against them like the reference loop does, on every ray,
+# the broad-phase keeps their bounds and casts against the hit ones in one
+# pass over the instances.
+#
+# The material index of hit polygons is looked up in per-mesh arrays kept in
+# an LRU, so picking a slot doesn't convert the whole mesh on every click.
+import math
+import time
+import heapq
+
+from collections import OrderedDict
+
+import numpy as np
+
+import bpy
+
+from bpy.app.handlers import persistent
+from mathutils import Vector, Matrix
+from mathutils.bvhtree import BVHTree
+
+# instances per leaf of the bounds hierarchy
+LEAF_SIZE = 4
+
+# stands in for the inverse of a zero ray direction component
+HUGE = 1e30
+
+# bytes of material index arrays kept between clicks
+MATERIAL_CACHE_SIZE = 64 * 1024 * 1024
+
+RAYCAST_METHODS = [
+        ('BVH', "Bounds hierarchy", "Keep a hierarchy of the instance bounds and a BVH tree per mesh between clicks"),
+        ('NUMPY', "NumPy broad-phase", "Test the bounds of all instances at once, cast against the hit meshes only"),
+        ('LOOP', "All instances", "Cast against every mesh instance, slow in large scenes"),
+        ]
+
+def layer_key(depsgraph):
+    return (depsgraph.scene.name, depsgraph.view_layer.name)
+
+def id_key(block):
+    """ key of an original datablock that survives undo and depsgraph updates """
+    block = block.original
+    return (block.name, block.library.filepath if block.library else None)
+
+def find_object(key):
+    name, library = key
+    if library is None:
+        return bpy.data.objects.get(name)
+    return bpy.data.objects.get((name, library))
+
+def world_bounds(corners, matrix):
+    """ min and max of the bounding box corners transformed by matrix """
+    points = [matrix @ corner for corner in corners]
+    return ([min(p[i] for p in points) for i in range(3)],
+            [max(p[i] for p in points) for i in range(3)])
+
+def ray_box(origin, inverse, bounds_min, bounds_max, far):
+    """ slab test, distance along the ray where it enters the box or None """
+    near = 0.0
+    for i in range(3):
+        t1 = (bounds_min[i] - origin[i]) * inverse[i]
+        t2 = (bounds_max[i] - origin[i]) * inverse[i]
+        if t1 > t2:
+            t1, t2 = t2, t1
+        if t1 > near:
+            near = t1
+        if t2 < far:
+            far = t2
+        if near > far:
+            return None
+    return near
+
+def raycast_instances(depsgraph, ray_origin, ray_target, excluded=()):
+    """ casts the ray against every mesh instance, the reference the accelerator is checked against
+        returns the evaluated object, world location, object space normal and face index of the nearest hit
+    """
+    excluded_eval_objs = [obj.evaluated_get(depsgraph) for obj in excluded]
+
+    best_length_squared = -1.0
+    best_obj = None
+    world_loc = (0, 0, 0)
+    hit_normal = (0, 0, 0)
+    face_id = None
+
+    for dup in depsgraph.object_instances:
+        if dup.is_instance:
+            obj = dup.instance_object
+        else:
+            obj = dup.object
+            if obj in excluded_eval_objs:
+                continue
+        if obj.type != 'MESH':
+            continue
+
+        # get the ray relative to the object
+        matrix = dup.matrix_world.copy()
+        matrix_inv = matrix.inverted()
+        ray_origin_obj = matrix_inv @ ray_origin
+        ray_direction_obj = matrix_inv @ ray_target - ray_origin_obj
+
+        success, location, normal, face_index = obj.ray_cast(ray_origin_obj, ray_direction_obj)
+        if success:
+            hit_world = matrix @ location
+            length_squared = (hit_world - ray_origin).length_squared
+            if best_obj is None or length_squared < best_length_squared:
+                best_length_squared = length_squared
+                best_obj = obj
+                world_loc = hit_world
+                hit_normal = normal
+                face_id = face_index
+
+    return best_obj, world_loc, hit_normal, face_id
+
+def is_geometry_instance(dup):
+    """ True for instances made by geometry nodes, their original is the instancer """
+    return dup.is_instance and dup.instance_object.original == dup.parent.original
+
+def has_geometry_nodes(obj):
+    return any(modifier.type == 'NODES' for modifier in obj.modifiers)
+
+def raycast_geometry_instances(depsgraph, ray_origin, direction, instancers, best, best_distance):
+    """ casts against the geometry nodes instances of the instancers like raycast_instances
+        returns the nearer of best and the nearest hit, and its distance
+    """
+    for dup in depsgraph.object_instances:
+        if not is_geometry_instance(dup) or id_key(dup.parent) not in instancers:
+            continue
+
+        obj = dup.instance_object
+        if obj.type != 'MESH':
+            continue
+
+        # get the ray relative to the instance
+        matrix = dup.matrix_world.copy()
+        matrix_inv = matrix.inverted_safe()
+        origin_local = matrix_inv @ ray_origin
+        direction_local = matrix_inv.to_3x3() @ direction
+
+        success, location, normal, face_index = obj.ray_cast(origin_local, direction_local)
+        if not success:
+            continue
+
+        hit_world = matrix @ location
+        hit_distance = (hit_world - ray_origin).length
+        if hit_distance < best_distance:
+            best_distance = hit_distance
+            best = (obj, hit_world, normal, face_index)
+
+    return best, best_distance
+
+class MaterialIndexCache:
+    """ material index per polygon of evaluated meshes, least recently used first """
+
+    def __init__(self, size=MATERIAL_CACHE_SIZE):
+        self.size = size
+        self.used = 0
+        # object key -> (mesh key, material indices)
+        self.arrays = OrderedDict()
+
+    def lookup(self, obj, face_index):
+        """ material slot index of a polygon of an evaluated object """
+        key = id_key(obj)
+        mesh = obj.data
+
+        cached = self.arrays.get(key)
+        if cached is None or len(cached[1]) != len(mesh.polygons):
+            self.discard(key)
+            indices = np.empty(len(mesh.polygons), dtype=np.int32)
+            mesh.polygons.foreach_get('material_index', indices)
+            cached = (id_key(obj.original.data), indices)
+            self.arrays[key] = cached
+            self.used += indices.nbytes
+            self.evict()
+
+        self.arrays.move_to_end(key)
+        return int(cached[1][face_index])
+
+    def clear(self):
+        self.arrays.clear()
+        self.used = 0
+
+    def discard(self, key):
+        cached = self.arrays.pop(key, None)
+        if cached is not None:
+            self.used -= cached[1].nbytes
+
+    def discard_mesh(self, mesh_key):
+        for key in [key for key, cached in self.arrays.items() if cached[0] == mesh_key]:
+            self.discard(key)
+
+    def evict(self):
+        # keep at least the newest array, even if it alone is larger than the cache
+        while self.used > self.size and len(self.arrays) > 1:
+            _, cached = self.arrays.popitem(last=False)
+            self.used -= cached[1].nbytes
+
+    def update(self, depsgraph):
+        """ drops the arrays of meshes that changed """
+        for update in depsgraph.updates:
+            block = update.id
+            if isinstance(block, bpy.types.Object) and update.is_updated_geometry:
+                self.discard(id_key(block))
+            elif isinstance(block, bpy.types.Mesh):
+                self.discard_mesh(id_key(block))
+
+class Instance:
+    """ a mesh instance in the bounds hierarchy """
+    __slots__ = ('key', 'owner', 'is_instance', 'matrix', 'matrix_inv', 'corners', 'min', 'max', 'leaf')
+
+    def __init__(self, key, owner, is_instance, matrix, corners):
+        self.key = key
+        self.owner = owner
+        self.is_instance = is_instance
+        self.corners = corners
+        self.leaf = None
+        self.set_matrix(matrix)
+
+    def set_matrix(self, matrix):
+        self.matrix = matrix
+        self.matrix_inv = matrix.inverted_safe()
+        self.min, self.max = world_bounds(self.corners, matrix)
+
+class Node:
+    __slots__ = ('min', 'max', 'parent', 'children', 'instances')
+
+    def __init__(self, parent):
+        self.parent = parent
+        self.children = ()
+        self.instances = ()
+
+    def fit(self):
+        boxes = self.children or self.instances
+        self.min = [min(box.min[i] for box in boxes) for i in range(3)]
+        self.max = [max(box.max[i] for box in boxes) for i in range(3)]
+
+def build_hierarchy(instances, parent=None):
+    """ splits the instances at the median of the longest axis of their centers """
+    node = Node(parent)
+
+    if len(instances) <= LEAF_SIZE:
+        node.instances = instances
+        for instance in instances:
+            instance.leaf = node
+    else:
+        centers = [[(inst.min[i] + inst.max[i]) * 0.5 for i in range(3)] for inst in instances]
+        extents = [max(c[i] for c in centers) - min(c[i] for c in centers) for i in range(3)]
+        axis = extents.index(max(extents))
+
+        order = sorted(range(len(instances)), key=lambda i: centers[i][axis])
+        half = len(order) // 2
+        node.children = (
+                build_hierarchy([instances[i] for i in order[:half]], node),
+                build_hierarchy([instances[i] for i in order[half:]], node),
+                )
+
+    node.fit()
+    return node
+
+class SceneRaycaster:
+    """ nearest hit of view rays against the mesh instances of a view layer """
+
+    def __init__(self):
+        self.view_layer = None
+        self.root = None
+        self.instances = []
+        # owner key -> (world matrix when it was last fitted, its instances)
+        self.owners = {}
+        # object key -> instances of its mesh
+        self.by_key = {}
+        # object key -> (mesh key, BVHTree in object space)
+        self.trees = {}
+        # keys of objects with geometry nodes instances, cast against on every ray
+        self.geometry_instancers = set()
+
+        self.dirty = True
+        # owners whose transform changed and objects whose geometry changed since the last cast
+        self.moved = set()
+        self.reshaped = set()
+        self.signature = None
+
+    def invalidate(self):
+        self.dirty = True
+
+    def rebuild(self, depsgraph):
+        self.instances = []
+        self.owners = {}
+        self.by_key = {}
+        self.geometry_instancers = set()
+        self.moved.clear()
+        self.reshaped.clear()
+
+        corners_of = {}
+        for dup in depsgraph.object_instances:
+            obj = dup.instance_object if dup.is_instance else dup.object
+            if obj.type != 'MESH':
+                continue
+
+            # Case: Geometry nodes instance, its key would be the one of the instancer
+            if is_geometry_instance(dup):
+                self.geometry_instancers.add(id_key(dup.parent))
+                continue
+
+            key = id_key(obj)
+            owner = dup.parent if dup.is_instance else obj
+            owner_key = id_key(owner)
+
+            if key not in corners_of:
+                corners_of[key] = [Vector(corner) for corner in obj.bound_box]
+
+            instance = Instance(key, owner_key, dup.is_instance, dup.matrix_world.copy(), corners_of[key])
+            self.instances.append(instance)
+
+            if owner_key not in self.owners:
+                self.owners[owner_key] = (owner.matrix_world.copy(), [])
+            self.owners[owner_key][1].append(instance)
+            self.by_key.setdefault(key, []).append(instance)
+
+        # drop the trees of objects that aren't part of the scene anymore
+        self.trees = {key: tree for key, tree in self.trees.items() if key in corners_of}
+
+        self.root = build_hierarchy(self.instances) if self.instances else None
+        self.view_layer = layer_key(depsgraph)
+        self.signature = self.scene_signature(depsgraph)
+        self.dirty = False
+
+    def scene_signature(self, depsgraph):
+        # cheap check for structural changes the update handler can't see
+        return (len(bpy.data.objects), len(depsgraph.ids))
+
+    def refit(self, depsgraph):
+        """ moves the instances of transformed objects, updates the bounds
+            of reshaped meshes and refits the nodes above them
+        """
+        changed = set()
+
+        for key in self.reshaped:
+            obj = find_object(key)
+            # Case: Object got removed or renamed
+            if obj is None:
+                self.dirty = True
+                return
+
+            corners = [Vector(corner) for corner in obj.evaluated_get(depsgraph).bound_box]
+            for instance in self.by_key.get(key, ()):
+                instance.corners = corners
+                instance.set_matrix(instance.matrix)
+                changed.add(instance.leaf)
+
+        self.reshaped.clear()
+
+        for owner_key in self.moved:
+            if owner_key not in self.owners:
+                continue
+
+            owner = find_object(owner_key)
+            # Case: Object got removed or renamed
+            if owner is None:
+                self.dirty = True
+                return
+
+            old_matrix, instances = self.owners[owner_key]
+            matrix = owner.evaluated_get(depsgraph).matrix_world.copy()
+            offset = matrix @ old_matrix.inverted_safe()
+
+            for instance in instances:
+                if instance.is_instance:
+                    # instances follow their instancer rigidly
+                    instance.set_matrix(offset @ instance.matrix)
+                else:
+                    instance.set_matrix(matrix)
+                changed.add(instance.leaf)
+
+            self.owners[owner_key] = (matrix, instances)
+
+        self.moved.clear()
+
+        # refit the changed leaves and everything above them once
+        while changed:
+            parents = set()
+            for node in changed:
+                node.fit()
+                if node.parent is not None:
+                    parents.add(node.parent)
+            changed = parents
+
+    def update(self, depsgraph):
+        """ called after depsgraph updates, records what needs to be refitted or rebuilt """
+        if self.dirty or layer_key(depsgraph) != self.view_layer:
+            return
+
+        updates = list(depsgraph.updates)
+        for update in updates:
+            block = update.id
+
+            if isinstance(block, bpy.types.Object):
+                key = id_key(block)
+
+                # Case: Object wasn't part of the scene before
+                if key not in self.owners and key not in self.by_key and key not in self.geometry_instancers \
+                        and (block.type == 'MESH' or block.instance_type != 'NONE'):
+                    self.dirty = True
+                    return
+
+                if update.is_updated_geometry:
+                    self.trees.pop(key, None)
+                    # Case: Geometry nodes, the object may have started or stopped instancing
+                    if has_geometry_nodes(block):
+                        self.dirty = True
+                        return
+                    # Case: Instancer, the instances themselves may have changed
+                    if key in self.owners and any(inst.is_instance for inst in self.owners[key][1]):
+                        self.dirty = True
+                        return
+                    if key in self.by_key:
+                        self.reshaped.add(key)
+
+                if update.is_updated_transform and key in self.owners:
+                    self.moved.add(key)
+
+            elif isinstance(block, bpy.types.Mesh):
+                mesh_key = id_key(block)
+                self.trees = {key: tree for key, tree in self.trees.items() if tree[0] != mesh_key}
+
+            elif isinstance(block, bpy.types.Collection):
+                # objects got linked or unlinked
+                self.dirty = True
+                return
+
+        # Case: Only the scene got updated, e.g. objects got hidden or revealed
+        if updates and all(isinstance(update.id, bpy.types.Scene) for update in updates):
+            self.dirty = True
+
+    def mesh_tree(self, instance, depsgraph):
+        """ cached BVHTree of the evaluated mesh of an instance """
+        cached = self.trees.get(instance.key)
+        if cached is not None:
+            return cached[1]
+
+        obj = find_object(instance.key)
+        if obj is None:
+            return None
+
+        obj_eval = obj.evaluated_get(depsgraph)
+        tree = BVHTree.FromObject(obj_eval, depsgraph)
+        self.trees[instance.key] = (id_key(obj.data), tree)
+        return tree
+
+    def ray_cast(self, depsgraph, ray_origin, ray_direction, excluded=()):
+        """ nearest hit along the ray, same result as raycast_instances
+            returns the evaluated object, world location, object space normal and face index
+        """
+        if self.dirty or layer_key(depsgraph) != self.view_layer \
+                or self.signature != self.scene_signature(depsgraph):
+            self.rebuild(depsgraph)
+        elif self.moved or self.reshaped:
+            self.refit(depsgraph)
+            if self.dirty:
+                self.rebuild(depsgraph)
+
+        direction = ray_direction.normalized()
+        best, best_distance = self.cast_hierarchy(depsgraph, ray_origin, direction, excluded)
+
+        if self.geometry_instancers:
+            best, best_distance = raycast_geometry_instances(depsgraph, ray_origin, direction,
+                    self.geometry_instancers, best, best_distance)
+
+        return best
+
+    def cast_hierarchy(self, depsgraph, ray_origin, direction, excluded):
+        """ nearest hit of the instances in the bounds hierarchy and its distance """
+        best = (None, (0, 0, 0), (0, 0, 0), None)
+        best_distance = math.inf
+        if self.root is None:
+            return best, best_distance
+
+        excluded_keys = {id_key(obj) for obj in excluded}
+        inverse = [1.0 / d if d != 0.0 else HUGE for d in direction]
+
+        start = ray_box(ray_origin, inverse, self.root.min, self.root.max, best_distance)
+        if start is None:
+            return best, best_distance
+
+        # visit nodes and instances front to back, stop once the nearest hit is closer than the next box
+        counter = 0
+        heap = [(start, counter, self.root)]
+        while heap:
+            distance, _, item = heapq.heappop(heap)
+            if distance > best_distance:
+                break
+
+            # Case: Mesh instance, cast against its mesh
+            if isinstance(item, Instance):
+                tree = self.mesh_tree(item, depsgraph)
+                if tree is None:
+                    self.dirty = True
+                    continue
+
+                origin_local = item.matrix_inv @ ray_origin
+                direction_local = item.matrix_inv.to_3x3() @ direction
+                location, normal, face_index, _ = tree.ray_cast(origin_local, direction_local)
+                if location is None:
+                    continue
+
+                hit_world = item.matrix @ location
+                hit_distance = (hit_world - ray_origin).length
+                if hit_distance < best_distance:
+                    best_distance = hit_distance
+                    obj_eval = find_object(item.key).evaluated_get(depsgraph)
+                    best = (obj_eval, hit_world, normal, face_index)
+                continue
+
+            for child in item.children or item.instances:
+                if isinstance(child, Instance) and not child.is_instance and child.key in excluded_keys:
+                    continue
+                entry = ray_box(ray_origin, inverse, child.min, child.max, best_distance)
+                if entry is not None:
+                    counter += 1
+                    heapq.heappush(heap, (entry, counter, child))
+
+        return best, best_distance
+
+class ArrayRaycaster:
+    """ nearest hit of view rays through a vectorized broad-phase over the instance bounds
+        the arrays are gathered once per depsgraph state
+    """
+
+    def __init__(self):
+        self.view_layer = None
+        self.matrices = None
+        self.moved = set()
+
+    def invalidate(self):
+        self.matrices = None
+
+    def gather(self, depsgraph):
+        keys = []
+        key_index = {}
+        corners = []
+        objects = []
+        matrices = []
+        instanced = []
+        self.rows_of = {}
+        self.instancers = set()
+        # row -> index of its geometry nodes instance in depsgraph.object_instances
+        self.geometry_duplis = {}
+
+        for index, dup in enumerate(depsgraph.object_instances):
+            obj = dup.instance_object if dup.is_instance else dup.object
+            if obj.type != 'MESH':
+                continue
+
+            # Case: Geometry nodes instance, its key would be the one of the instancer
+            # and its object can only be cast against while iterating
+            if is_geometry_instance(dup):
+                self.geometry_duplis[len(objects)] = index
+                key = (None, index)
+            else:
+                key = id_key(obj)
+
+            if key not in key_index:
+                key_index[key] = len(keys)
+                keys.append(key)
+                corners.append([tuple(corner) for corner in obj.bound_box])
+
+            if dup.is_instance:
+                self.instancers.add(id_key(dup.parent))
+            else:
+                self.rows_of.setdefault(key, []).append(len(objects))
+
+            objects.append(key_index[key])
+            matrices.append(dup.matrix_world.copy())
+            instanced.append(dup.is_instance)
+
+        self.keys = keys
+        self.key_index = key_index
+        self.corners = np.array(corners, dtype=np.float64).reshape(-1, 8, 3)
+        self.objects = np.array(objects, dtype=np.int64)
+        self.matrices = np.array(matrices, dtype=np.float64).reshape(-1, 4, 4)
+        self.instanced = np.array(instanced, dtype=bool)
+        self.view_layer = layer_key(depsgraph)
+        self.moved.clear()
+
+        self.min, self.max = self.world_bounds(np.arange(len(objects)))
+
+    def world_bounds(self, rows):
+        """ world space bounds of the instances in rows, all corners transformed at once """
+        matrices = self.matrices[rows]
+        corners = self.corners[self.objects[rows]]
+        world = np.einsum('nij,nkj->nki', matrices[:, :3, :3], corners) + matrices[:, None, :3, 3]
+        return world.min(axis=1), world.max(axis=1)
+
+    def refit(self, depsgraph):
+        for key in self.moved:
+            obj = find_object(key)
+            # Case: Object got removed or renamed
+            if obj is None:
+                self.matrices = None
+                return
+
+            rows = np.array(self.rows_of[key], dtype=np.int64)
+            self.matrices[rows] = np.array(obj.evaluated_get(depsgraph).matrix_world, dtype=np.float64)
+            self.min[rows], self.max[rows] = self.world_bounds(rows)
+
+        self.moved.clear()
+
+    def update(self, depsgraph):
+        """ called after depsgraph updates, moved objects get refitted, anything else gathers again """
+        if self.matrices is None or layer_key(depsgraph) != self.view_layer:
+            return
+
+        updates = list(depsgraph.updates)
+        for update in updates:
+            block = update.id
+
+            if isinstance(block, bpy.types.Object):
+                key = id_key(block)
+                # Case: Bounds changed, object is new or instances other objects
+                if update.is_updated_geometry or key in self.instancers:
+                    self.matrices = None
+                    return
+                if update.is_updated_transform:
+                    if key not in self.rows_of and (block.type == 'MESH' or block.instance_type != 'NONE'):
+                        self.matrices = None
+                        return
+                    if key in self.rows_of:
+                        self.moved.add(key)
+
+            elif isinstance(block, bpy.types.Collection):
+                self.matrices = None
+                return
+
+        # Case: Only the scene got updated, e.g. objects got hidden or revealed
+        if updates and all(isinstance(update.id, bpy.types.Scene) for update in updates):
+            self.matrices = None
+
+    def ray_cast(self, depsgraph, ray_origin, ray_direction, excluded=()):
+        """ nearest hit along the ray, same result as raycast_instances """
+        if self.matrices is None or layer_key(depsgraph) != self.view_layer:
+            self.gather(depsgraph)
+        elif self.moved:
+            self.refit(depsgraph)
+            if self.matrices is None:
+                self.gather(depsgraph)
+
+        best = (None, (0, 0, 0), (0, 0, 0), None)
+        if len(self.objects) == 0:
+            return best
+
+        direction = ray_direction.normalized()
+        origin = np.array(ray_origin, dtype=np.float64)
+        inverse = np.array([1.0 / d if d != 0.0 else HUGE for d in direction], dtype=np.float64)
+
+        # slab test against all boxes
+        t1 = (self.min - origin) * inverse
+        t2 = (self.max - origin) * inverse
+        near = np.maximum(np.minimum(t1, t2).max(axis=1), 0.0)
+        far = np.maximum(t1, t2).min(axis=1)
+        hit = near <= far
+
+        if excluded:
+            excluded_keys = {id_key(obj) for obj in excluded}
+            for key in excluded_keys:
+                if key in self.key_index:
+                    hit &= ~((self.objects == self.key_index[key]) & ~self.instanced)
+
+        candidates = np.nonzero(hit)[0]
+        candidates = candidates[np.argsort(near[candidates], kind='stable')]
+
+        best_distance = math.inf
+        evaluated = {}
+        geometry_rows = []
+        for row in candidates:
+            # Case: Nearest hit is closer than all remaining boxes
+            if near[row] > best_distance:
+                break
+
+            # Case: Geometry nodes instance, cast against in one pass over the instances below
+            if row in self.geometry_duplis:
+                geometry_rows.append(row)
+                continue
+
+            key = self.keys[self.objects[row]]
+            if key not in evaluated:
+                obj = find_object(key)
+                evaluated[key] = obj.evaluated_get(depsgraph) if obj is not None else None
+            obj_eval = evaluated[key]
+            if obj_eval is None:
+                self.matrices = None
+                continue
+
+            # get the ray relative to the object
+            matrix = Matrix(self.matrices[row].tolist())
+            matrix_inv = matrix.inverted_safe()
+            origin_local = matrix_inv @ ray_origin
+            direction_local = matrix_inv.to_3x3() @ direction
+
+            success, location, normal, face_index = obj_eval.ray_cast(origin_local, direction_local)
+            if not success:
+                continue
+
+            hit_world = matrix @ location
+            hit_distance = (hit_world - ray_origin).length
+            if hit_distance < best_distance:
+                best_distance = hit_distance
+                best = (obj_eval, hit_world, normal, face_index)
+
+        if geometry_rows:
+            best = self.cast_geometry_instances(depsgraph, ray_origin, direction, geometry_rows,
+                    near, best, best_distance)
+
+        return best
+
+    def cast_geometry_instances(self, depsgraph, ray_origin, direction, rows, near, best, best_distance):
+        """ casts against the geometry nodes instances of the rows hit by the broad-phase
+            their objects are only valid while iterating, so they get cast against in one pass
+        """
+        row_of = {self.geometry_duplis[row]: row for row in rows}
+        last = max(row_of)
+
+        for index, dup in enumerate(depsgraph.object_instances):
+            if index > last:
+                break
+            row = row_of.get(index)
+            if row is None or near[row] > best_distance:
+                continue
+
+            # Case: Instances changed without an update, gather again on the next ray
+            if not is_geometry_instance(dup):
+                self.matrices = None
+                break
+
+            obj = dup.instance_object
+            matrix = dup.matrix_world.copy()
+            matrix_inv = matrix.inverted_safe()
+            origin_local = matrix_inv @ ray_origin
+            direction_local = matrix_inv.to_3x3() @ direction
+
+            success, location, normal, face_index = obj.ray_cast(origin_local, direction_local)
+            if not success:
+                continue
+
+            hit_world = matrix @ location
+            hit_distance = (hit_world - ray_origin).length
+            if hit_distance < best_distance:
+                best_distance = hit_distance
+                best = (obj, hit_world, normal, face_index)
+
+        return best
+
+def geometry_nodes_instancer(name, source):
+    """ node group instancing the geometry of the source object on the points of the mesh """
+    tree = bpy.data.node_groups.new(name, 'GeometryNodeTree')
+    # the sockets moved to the interface in 4.0
+    if hasattr(tree, 'interface'):
+        tree.interface.new_socket("Geometry", in_out='INPUT', socket_type='NodeSocketGeometry')
+        tree.interface.new_socket("Geometry", in_out='OUTPUT', socket_type='NodeSocketGeometry')
+    else:
+        tree.inputs.new('NodeSocketGeometry', "Geometry")
+        tree.outputs.new('NodeSocketGeometry', "Geometry")
+
+    group_input = tree.nodes.new('NodeGroupInput')
+    group_output = tree.nodes.new('NodeGroupOutput')
+    to_points = tree.nodes.new('GeometryNodeMeshToPoints')
+    info = tree.nodes.new('GeometryNodeObjectInfo')
+    info.inputs['Object'].default_value = source
+    instance = tree.nodes.new('GeometryNodeInstanceOnPoints')
+
+    tree.links.new(group_input.outputs[0], to_points.inputs['Mesh'])
+    tree.links.new(to_points.outputs['Points'], instance.inputs['Points'])
+    tree.links.new(info.outputs['Geometry'], instance.inputs['Instance'])
+    tree.links.new(instance.outputs['Instances'], group_output.inputs[0])
+    return tree
+
+def benchmark_scene(count, rays, seed=0, instancing='VERTS'):
+    """ scene with count cube instances scattered through vertex instancing
+        or geometry nodes and rays from above aimed at them
+        instancing: 'VERTS' or 'NODES'
+    """
+    rng = np.random.RandomState(seed)
+    side = math.sqrt(count) * 3.0
+
+    scene = bpy.data.scenes.new("AD Raycast Benchmark")
+
+    cube = bpy.data.meshes.new("AD Benchmark Cube")
+    cube.from_pydata(
+            [(x, y, z) for x in (-1, 1) for y in (-1, 1) for z in (-1, 1)],
+            [],
+            [(0, 1, 3, 2), (4, 6, 7, 5), (0, 4, 5, 1), (2, 3, 7, 6), (0, 2, 6, 4), (1, 5, 7, 3)])
+
+    points = bpy.data.meshes.new("AD Benchmark Points")
+    points.vertices.add(count)
+    positions = np.zeros((count, 3), dtype=np.float32)
+    positions[:, :2] = rng.uniform(-side / 2, side / 2, (count, 2))
+    positions[:, 2] = rng.uniform(0, 2, count)
+    points.vertices.foreach_set('co', positions.ravel())
+    points.update()
+
+    instancer = bpy.data.objects.new("AD Benchmark Instancer", points)
+    source = bpy.data.objects.new("AD Benchmark Cube", cube)
+    scene.collection.objects.link(instancer)
+    scene.collection.objects.link(source)
+
+    trees = []
+    if instancing == 'NODES':
+        # the source stays in the scene below the instances
+        source.location = (0.0, 0.0, -100.0)
+        trees.append(geometry_nodes_instancer("AD Benchmark Instances", source))
+        modifier = instancer.modifiers.new("AD Benchmark Instances", 'NODES')
+        modifier.node_group = trees[0]
+    else:
+        instancer.instance_type = 'VERTS'
+        source.parent = instancer
+
+    # rays from above, slightly tilted
+    origins = np.zeros((rays, 3))
+    origins[:, :2] = rng.uniform(-side / 2, side / 2, (rays, 2))
+    origins[:, 2] = 50.0
+    directions = np.zeros((rays, 3))
+    directions[:, :2] = rng.uniform(-0.2, 0.2, (rays, 2))
+    directions[:, 2] = -1.0
+
+    rays = [(Vector(o), Vector(d)) for o, d in zip(origins, directions)]
+    return scene, (instancer, source), (points, cube), trees, rays
+
+def remove_benchmark_scene(scene, objects, meshes, trees):
+    for obj in objects:
+        bpy.data.objects.remove(obj)
+    for mesh in meshes:
+        bpy.data.meshes.remove(mesh)
+    for tree in trees:
+        bpy.data.node_groups.remove(tree)
+    bpy.data.scenes.remove(scene)
+
+def benchmark_methods(depsgraph, scene_rays, count, instancing, rays, loop_rays):
+    global raycaster, array_raycaster
+
+    results = []
+    reference = {}
+    for method in ('LOOP', 'NUMPY', 'BVH'):
+        raycaster = SceneRaycaster()
+        array_raycaster = ArrayRaycaster()
+        method_rays = scene_rays[:loop_rays] if method == 'LOOP' else scene_rays[:rays]
+
+        start = time.perf_counter()
+        ray_cast(method, depsgraph, *method_rays[0])
+        setup = time.perf_counter() - start
+
+        hits = 0
+        start = time.perf_counter()
+        for i, (origin, direction) in enumerate(method_rays):
+            obj, location, _, _ = ray_cast(method, depsgraph, origin, direction)
+            if obj is None:
+                continue
+            hits += 1
+            # the accelerators have to find the hits of the loop
+            if i in reference and (location - reference[i]).length > 1e-4:
+                raise RuntimeError("{} hit differs from the loop at ray {}".format(method, i))
+            if method == 'LOOP':
+                reference[i] = location.copy()
+        duration = (time.perf_counter() - start) / len(method_rays)
+
+        results.append((count, instancing, method, setup, duration, hits))
+
+    return results
+
+def benchmark(context, counts=(1000, 10000, 100000), rays=100, loop_rays=5):
+    """ times the raycast methods on scenes with count instances, made by vertex instancing
+        and by geometry nodes
+        returns rows of (count, instancing, method, setup seconds, seconds per ray, hits) per method
+        setup is the time of the first ray, which builds the structures of the accelerators
+    """
+    global raycaster, array_raycaster
+
+    window = context.window
+    original_scene = window.scene
+    results = []
+
+    # instance on points exists since 3.0
+    instancings = ('VERTS', 'NODES') if bpy.app.version >= (3, 0, 0) else ('VERTS',)
+
+    try:
+        for count in counts:
+            for instancing in instancings:
+                scene, objects, meshes, trees, scene_rays = benchmark_scene(
+                        count, max(rays, loop_rays), instancing=instancing)
+                try:
+                    window.scene = scene
+                    depsgraph = context.evaluated_depsgraph_get()
+                    results += benchmark_methods(depsgraph, scene_rays, count, instancing, rays, loop_rays)
+                finally:
+                    window.scene = original_scene
+                    remove_benchmark_scene(scene, objects, meshes, trees)
+    finally:
+        raycaster = SceneRaycaster()
+        array_raycaster = ArrayRaycaster()
+
+    return results
+
+raycaster = SceneRaycaster()
+array_raycaster = ArrayRaycaster()
+material_indices = MaterialIndexCache()
+
+def ray_cast(method, depsgraph, ray_origin, ray_direction, excluded=()):
+    """ nearest mesh hit along the ray with the chosen method
+        returns the evaluated object, world location, object space normal and face index
+    """
+    if method == 'NUMPY':
+        return array_raycaster.ray_cast(depsgraph, ray_origin, ray_direction, excluded)
+    if method == 'LOOP':
+        return raycast_instances(depsgraph, ray_origin, ray_origin + ray_direction, excluded)
+    return raycaster.ray_cast(depsgraph, ray_origin, ray_direction, excluded)
+
+@persistent
+def depsgraph_update(scene, depsgraph=None):
+    # Case: Handler without the depsgraph (before 2.81)
+    if depsgraph is None:
+        raycaster.invalidate()
+        array_raycaster.invalidate()
+        material_indices.clear()
+        return
+    raycaster.update(depsgraph)
+    array_raycaster.update(depsgraph)
+    material_indices.update(depsgraph)
+
+@persistent
+def load_post(*args):
+    global raycaster, array_raycaster, material_indices
+    raycaster = SceneRaycaster()
+    array_raycaster = ArrayRaycaster()
+    material_indices = MaterialIndexCache()
+
+def register():
+    bpy.app.handlers.depsgraph_update_post.append(depsgraph_update)
+    bpy.app.handlers.load_post.append(load_post)
+
+def unregister():
+    if depsgraph_update in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.remove(depsgraph_update)
+    if load_post in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(load_post)
@@ -0,0 +1,156 @@
+# Surface scattering
+#
+# Samples points on the surfaces of meshes for the scatter tool. Triangles
+# of all target meshes are read through foreach_get, points get picked with
+# a probability of triangle area times density, so they spread evenly in
+# world space. A spatial hash with cells the size of the minimum distance
+# rejects points too close to the ones already placed.
+import numpy as np
+
+# candidates drawn per missing point while points get rejected
+OVERSAMPLING = 2
+# rounds of drawing candidates before giving up on the requested count
+MAX_ROUNDS = 10
+
+def vertex_group_weights(mesh, group_index):
+    """ weight of each vertex in a vertex group, 0 for vertices not in it """
+    weights = np.zeros(len(mesh.vertices), dtype=np.float64)
+    for vertex in mesh.vertices:
+        for group in vertex.groups:
+            if group.group == group_index:
+                weights[vertex.index] = group.weight
+    return weights
+
+def surface_triangles(obj, depsgraph, density_group=""):
+    """ world space corners (n, 3, 3) and density (n) of the evaluated triangles of an object
+        the density is the mean weight of the corners in the density group, 1 without it
+    """
+    obj_eval = obj.evaluated_get(depsgraph)
+    mesh = obj_eval.to_mesh(preserve_all_data_layers=True, depsgraph=depsgraph)
+
+    try:
+        mesh.calc_loop_triangles()
+
+        triangles = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+        mesh.loop_triangles.foreach_get('vertices', triangles)
+        triangles = triangles.reshape(-1, 3)
+
+        coords = np.empty(len(mesh.vertices) * 3, dtype=np.float64)
+        mesh.vertices.foreach_get('co', coords)
+        matrix = np.array(obj_eval.matrix_world, dtype=np.float64)
+        coords = coords.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3]
+
+        density = np.ones(len(triangles), dtype=np.float64)
+        if density_group != "" and density_group in obj.vertex_groups:
+            weights = vertex_group_weights(mesh, obj.vertex_groups[density_group].index)
+            density = weights[triangles].mean(axis=1)
+    finally:
+        obj_eval.to_mesh_clear()
+
+    return coords[triangles], density
+
+def sample_triangles(corners, density, count, rng):
+    """ count random points on the triangles, area and density weighted
+        returns the points and the triangle normals at them as (count, 3) arrays
+    """
+    a, b, c = corners[:, 0], corners[:, 1], corners[:, 2]
+    cross = np.cross(b - a, c - a)
+    doubled_area = np.linalg.norm(cross, axis=1)
+
+    cumulative = np.cumsum(doubled_area * density)
+    total = cumulative[-1] if len(cumulative) else 0.0
+    # Case: No surface, or the density is zero everywhere
+    if total <= 0.0:
+        return np.empty((0, 3)), np.empty((0, 3))
+
+    picks = np.searchsorted(cumulative, rng.uniform(0.0, total, count), side='right')
+    picks = np.minimum(picks, len(cumulative) - 1)
+
+    # uniform barycentric coordinates
+    r1 = np.sqrt(rng.uniform(size=count))[:, None]
+    r2 = rng.uniform(size=count)[:, None]
+    points = (1.0 - r1) * a[picks] + r1 * (1.0 - r2) * b[picks] + r1 * r2 * c[picks]
+
+    normals = cross[picks] / np.maximum(doubled_area[picks], 1e-12)[:, None]
+    return points, normals
+
+class SpatialHash:
+    """ points in a grid of cells the size of the minimum distance """
+
+    def __init__(self, min_distance):
+        self.min_distance = min_distance
+        self.min_squared = min_distance * min_distance
+        self.cells = {}
+
+    def cell(self, point):
+        return tuple(int(v // self.min_distance) for v in point)
+
+    def is_free(self, point):
+        """ True if no point in the hash is closer than the minimum distance """
+        x, y, z = self.cell(point)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for dz in (-1, 0, 1):
+                    for other in self.cells.get((x + dx, y + dy, z + dz), ()):
+                        distance = (point[0] - other[0]) ** 2 + (point[1] - other[1]) ** 2 + (point[2] - other[2]) ** 2
+                        if distance < self.min_squared:
+                            return False
+        return True
+
+    def insert(self, point):
+        self.cells.setdefault(self.cell(point), []).append(point)
+
+def scatter_points(corners, density, count, rng, min_distance=0.0):
+    """ up to count points on the triangles, no two closer than min_distance
+        returns the points and normals, fewer than count if the surface is full
+    """
+    # Case: No minimum distance, every sample is kept
+    if min_distance <= 0.0:
+        return sample_triangles(corners, density, count, rng)
+
+    grid = SpatialHash(min_distance)
+    points = []
+    normals = []
+    for _ in range(MAX_ROUNDS):
+        missing = count - len(points)
+        if missing <= 0:
+            break
+
+        candidates, candidate_normals = sample_triangles(corners, density, missing * OVERSAMPLING, rng)
+        for point, normal in zip(candidates.tolist(), candidate_normals.tolist()):
+            if grid.is_free(point):
+                grid.insert(point)
+                points.append(point)
+                normals.append(normal)
+                if len(points) == count:
+                    break
+
+    return np.array(points).reshape(-1, 3), np.array(normals).reshape(-1, 3)
+
+def scatter_surfaces(objects, depsgraph, count, seed=0, min_distance=0.0, density_group=""):
+    """ scatters count points over the surfaces of all objects together
+        returns the points and normals as (n, 3) arrays
+    """
+    corners = []
+    density = []
+    for obj in objects:
+        obj_corners, obj_density = surface_triangles(obj, depsgraph, density_group)
+        corners.append(obj_corners)
+        density.append(obj_density)
+
+    # Case: No meshes
+    if not corners:
+        return np.empty((0, 3)), np.empty((0, 3))
+
+    rng = np.random.RandomState(seed)
+    return scatter_points(np.concatenate(corners), np.concatenate(density), count, rng, min_distance)
+
+def random_placements(count, variants, seed=0, spin=0.0, scale_min=1.0, scale_max=1.0):
+    """ variant index, spin angle around the normal and scale of each scattered point
+        seeded separately from the points, so changing them keeps the points in place
+    """
+    rng = np.random.RandomState(seed + 1)
+    choices = rng.randint(0, max(variants, 1), count)
+    angles = rng.uniform(0.0, spin, count)
+    scales = rng.uniform(scale_min, max(scale_min, scale_max), count)
+    return choices, angles, scales
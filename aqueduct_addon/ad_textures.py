@@ -0,0 +1,289 @@
+# Texture packaging
+#
+# Images are either copied into a textures folder next to each blendfile or,
+# with a texture store, kept once per content in a library-wide folder:
+#   <store>/<first two hash characters>/<hash><extension>
+# Blendfiles then reference the stored file through a hardlink, a reflink
+# or a relative path, so identical textures only take disk space once.
+import os
+import sys
+import time
+import shutil
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+import bpy
+
+from .ad_utils import log
+from .ad_hash import HashIndex, file_hash
+
+LINK_MODES = [
+        ('HARDLINK', "Hardlink", "Link the stored file into the textures folder, falls back to copies across drives"),
+        ('REFLINK', "Reflink", "Clone the stored file on copy-on-write filesystems (Btrfs, XFS), falls back to copies"),
+        ('RELATIVE', "Relative path", "Point the images directly at the stored files"),
+        ('COPY', "Copy", "Copy the stored file into the textures folder"),
+        ]
+
+# linux ioctl cloning a file into another on copy-on-write filesystems
+FICLONE = 0x40049409
+
+_indexes = {}
+
+def store_index(store):
+    """ hash index of the texture sources, shared by everything packaging into store """
+    if store not in _indexes:
+        _indexes[store] = HashIndex(os.path.join(store, "index.json"))
+    return _indexes[store]
+
+def texture_settings():
+    """ packaging settings from the addon preferences, passed along with the job specs """
+    prefs = bpy.context.preferences.addons[__package__].preferences
+
+    store_path = ""
+    if prefs.AD_texture_store:
+        store_path = prefs.AD_texture_store_path
+        if store_path == "" and prefs.AD_library_path != "":
+            store_path = os.path.join(prefs.AD_library_path, "texture_store")
+
+    return {
+            'store_path': bpy.path.abspath(store_path) if store_path != "" else "",
+            'link_mode': prefs.AD_texture_link_mode,
+            }
+
+def reflink(source, destination):
+    """ clones source to destination, raises OSError if the filesystem can't """
+    if not sys.platform.startswith('linux'):
+        raise OSError("Reflinks are only supported on linux")
+
+    import fcntl
+    with open(source, 'rb') as src, open(destination, 'wb') as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(destination)
+            raise
+
+def kernel_copy(src, dst, size):
+    """ copies between two open files without passing the data through python
+        returns the number of bytes copied, raises OSError if not supported
+    """
+    copied = 0
+    if hasattr(os, 'copy_file_range'):
+        while copied < size:
+            count = os.copy_file_range(src.fileno(), dst.fileno(), size - copied)
+            if count == 0:
+                break
+            copied += count
+    elif sys.platform.startswith('linux'):
+        while copied < size:
+            count = os.sendfile(dst.fileno(), src.fileno(), copied, size - copied)
+            if count == 0:
+                break
+            copied += count
+
+    return copied
+
+def copy_file(source, destination):
+    """ copies source to destination, keeping its modification time
+        returns the number of bytes copied
+    """
+    stat = os.stat(source)
+    with open(source, 'rb') as src, open(destination, 'wb') as dst:
+        try:
+            copied = kernel_copy(src, dst, stat.st_size)
+        except OSError:
+            # e.g. network shares or copies across filesystems on older kernels
+            copied = 0
+
+        if copied < stat.st_size:
+            src.seek(0)
+            dst.seek(0)
+            dst.truncate()
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+
+    # lets up_to_date skip the file next time
+    os.utime(destination, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    return stat.st_size
+
+def up_to_date(source, destination):
+    """ True if destination has the size and modification time of source """
+    try:
+        src = os.stat(source)
+        dst = os.stat(destination)
+    except OSError:
+        return False
+
+    # some filesystems only store the mtime with two seconds precision
+    return src.st_size == dst.st_size and abs(src.st_mtime - dst.st_mtime) < 2.0
+
+def link_file(source, destination, link_mode):
+    """ makes destination a hardlink, reflink or copy of source
+        returns the number of bytes copied, 0 if it got linked
+    """
+    try:
+        if link_mode == 'HARDLINK':
+            os.link(source, destination)
+            return 0
+        if link_mode == 'REFLINK':
+            reflink(source, destination)
+            return 0
+    except FileExistsError:
+        # another thread linked the same content
+        return 0
+    except OSError:
+        # other drive or filesystem without support, copy instead
+        pass
+
+    return copy_file(source, destination)
+
+def replace_file(source, destination, link_mode):
+    """ link_file to a temporary name moved into place once it is complete,
+        an interrupted copy never leaves a truncated file at destination
+    """
+    # unique temp name, other workers may write the same file
+    tmp = "{}.{}.{}.tmp".format(destination, os.getpid(), threading.get_ident())
+    copied = link_file(source, tmp, link_mode)
+    os.replace(tmp, destination)
+    return copied
+
+def is_complete(source, destination):
+    """ True if destination exists with the size of source """
+    try:
+        return os.path.getsize(destination) == os.path.getsize(source)
+    except OSError:
+        return False
+
+def store_file(source, store):
+    """ adds source to the texture store
+        returns the path of the stored file and the number of bytes copied
+    """
+    digest = store_index(store).digest(source, save=False)
+    folder = os.path.join(store, digest[:2])
+    stored = os.path.join(folder, digest + os.path.splitext(source)[1].lower())
+
+    copied = 0
+    if not os.path.exists(stored):
+        os.makedirs(folder, exist_ok=True)
+        copied = replace_file(source, stored, 'REFLINK')
+
+    return stored, copied
+
+def unique_destination(source, dirpath, reserved):
+    """ path in dirpath for source that doesn't collide with a different file
+        of the same name, an existing copy of the same content is reused
+        reserved: destination -> source of the files packaged along with it
+    """
+    name, extension = os.path.splitext(os.path.basename(source))
+    destination = os.path.join(dirpath, name + extension)
+
+    if reserved.get(destination, source) == source:
+        # Case: Name is free
+        if not os.path.exists(destination):
+            return destination
+
+        # Case: Same content is already there
+        if up_to_date(source, destination):
+            return destination
+        if os.path.getsize(destination) == os.path.getsize(source) \
+                and file_hash(destination) == file_hash(source):
+            return destination
+
+    return os.path.join(dirpath, "{}_{}{}".format(name, file_hash(source)[:12], extension))
+
+def copy_texture(source, destination):
+    """ copies a texture into the textures folder unless it is already there """
+    if is_complete(source, destination):
+        return destination, 'SKIPPED', 0
+    return destination, 'COPIED', replace_file(source, destination, 'COPY')
+
+def store_texture(source, dirpath, store_path, link_mode):
+    """ adds a texture to the store and links it into the textures folder """
+    stored, copied = store_file(source, store_path)
+
+    # Case: Images point into the store
+    if link_mode == 'RELATIVE':
+        return stored, 'COPIED' if copied else 'SKIPPED', copied
+
+    # keep the name readable, the hash makes it unique
+    digest = os.path.basename(stored)[:12]
+    name = os.path.splitext(os.path.basename(source))[0]
+    if name.endswith("_" + digest):
+        # already packaged before
+        name = name[:-len(digest) - 1]
+    destination = os.path.join(dirpath, "{}_{}{}".format(name, digest, os.path.splitext(stored)[1]))
+
+    # Case: Left truncated by an interrupted copy, gets replaced
+    if is_complete(stored, destination):
+        return destination, 'SKIPPED', copied
+
+    copied += replace_file(stored, destination, link_mode)
+    return destination, 'COPIED' if copied else 'LINKED', copied
+
+def package_textures(sources, dirpath, store_path="", link_mode='HARDLINK', threads=8):
+    """ packages textures for a blendfile with the textures folder dirpath
+        copies run on a thread pool, the kernel does the copying where it can
+
+        returns a dict of source -> path the images should be relinked to
+        and the stats of each file: source, destination, action, bytes, duration
+    """
+    sources = list(dict.fromkeys(sources))
+
+    # pick the destinations upfront so files of the same name can't race each other
+    tasks = []
+    reserved = {}
+    for source in sources:
+        if store_path == "":
+            destination = unique_destination(source, dirpath, reserved)
+            reserved[destination] = source
+            tasks.append((copy_texture, (source, destination)))
+        else:
+            tasks.append((store_texture, (source, dirpath, store_path, link_mode)))
+
+    def run(task):
+        function, arguments = task
+        start = time.time()
+        destination, action, copied = function(*arguments)
+        return {
+                'source': arguments[0],
+                'destination': destination,
+                'action': action,
+                'bytes': copied,
+                'duration': time.time() - start,
+                }
+
+    with ThreadPoolExecutor(max_workers=max(1, min(threads, len(tasks)))) as executor:
+        stats = list(executor.map(run, tasks))
+
+    if store_path != "":
+        store_index(store_path).save()
+
+    return {entry['source']: entry['destination'] for entry in stats}, stats
+
+def throughput(size, duration):
+    return size / (1024 * 1024) / max(duration, 1e-6)
+
+def log_transfers(stats, duration):
+    """ logs the throughput of each copied file and of the whole packaging """
+    for entry in stats:
+        if entry['action'] == 'COPIED':
+            log("  {} {:.1f} MB in {:.2f}s ({:.1f} MB/s)".format(
+                os.path.basename(entry['source']),
+                entry['bytes'] / (1024 * 1024),
+                entry['duration'],
+                throughput(entry['bytes'], entry['duration'])))
+
+    total = sum(entry['bytes'] for entry in stats)
+    counts = {action: len([e for e in stats if e['action'] == action])
+            for action in ('COPIED', 'LINKED', 'SKIPPED')}
+
+    log("Packaged {} textures in {:.2f}s: {} copied ({:.1f} MB, {:.1f} MB/s), {} linked, {} up to date".format(
+        len(stats),
+        duration,
+        counts['COPIED'],
+        total / (1024 * 1024),
+        throughput(total, duration),
+        counts['LINKED'],
+        counts['SKIPPED']))
@@ -0,0 +1,414 @@
+# Thumbnail cache
+#
+# Rendered thumbnails are kept in the user data folder, keyed by the content
+# hash of the library file, the hash of the studio file it was rendered in
+# and the thumbnail size. A thumbnail requested again for unchanged inputs is
+# copied back next to its library file instead of being rendered.
+#
+# Material libraries also get a thumbnail per material, named
+# <file>__<material>.png, which are cached along with the file thumbnail.
+# They are only known through the sidecar, another library can be named
+# <file>__<something>.blend and its thumbnail would match any pattern.
+#
+# Thumbnails render at a quality tier, draft thumbnails can fill a library
+# quickly and get upgraded later. A sidecar <file>.thumbnail.json next to
+# the thumbnail records its tier and how long it took to render.
+#
+# The render can also be scaled down to a pyramid of sizes in several
+# formats, named <file>@<size>.<ext> and <file>__<material>@<size>.<ext>.
+# The sidecar lists them, so viewers can pick the smallest adequate one.
+#
+# The cache keeps a copy of the sidecar along with the thumbnails of a key.
+# An entry is only complete with it, so it gets restored and evicted as a
+# whole.
+import os
+import json
+import time
+import glob
+import shutil
+import hashlib
+
+import bpy
+
+from .ad_utils import log
+from .ad_hash import HashIndex
+
+# extensions a rendered thumbnail can have, depends on the studio file output format
+THUMBNAIL_EXTENSIONS = (".png", ".jpg", ".webp")
+
+# between the file name and the material name of per material thumbnails
+VARIANT_SEPARATOR = "__"
+# between the name and the size of scaled down thumbnails
+SIZE_SEPARATOR = "@"
+
+# formats of the scaled down thumbnails
+IMAGE_FORMATS = [
+        ('PNG', "PNG", "Lossless with transparency"),
+        ('JPEG', "JPEG", "Small lossy files"),
+        ('WEBP', "WebP", "Small files with transparency, needs a blender version that writes WebP"),
+        ]
+FORMAT_EXTENSIONS = {
+        'PNG': ".png",
+        'JPEG': ".jpg",
+        'WEBP': ".webp",
+        }
+
+# from fastest to best, STANDARD uses the render settings of the studio file
+QUALITY_TIERS = [
+        ('PREVIEW', "Preview", "Workbench solid shading, the fastest"),
+        ('DRAFT', "Draft", "Cycles on the CPU with few samples at half size"),
+        ('STANDARD', "Standard", "Render settings of the studio file"),
+        ('FINAL', "Final", "Cycles with adaptive sampling, a time limit and denoising"),
+        ]
+QUALITY_RANK = {tier[0]: rank for rank, tier in enumerate(QUALITY_TIERS)}
+# thumbnail size of the tiers relative to AD_thumbnail_size
+QUALITY_SCALE = {'DRAFT': 0.5}
+
+SIDECAR_SUFFIX = ".thumbnail.json"
+
+# bytes of the digest naming the cached thumbnails
+KEY_SIZE = 16
+
+# counters of this session
+stats = {
+        'hits': 0,
+        'misses': 0,
+        'stored': 0,
+        'evicted': 0,
+        }
+
+# hashes of library and studio files, so cache hits don't need to read them
+_index = None
+
+def cache_folder():
+    return bpy.utils.user_resource('DATAFILES', path="aqueduct_thumbnails", create=True)
+
+def hash_index():
+    global _index
+
+    if _index is None:
+        _index = HashIndex(os.path.join(cache_folder(), "index.json"))
+    return _index
+
+def indexed_hash(filepath):
+    """ hash of a file through the index, save_index() writes new entries """
+    return hash_index().digest(filepath, save=False)
+
+def save_index():
+    hash_index().flush()
+
+def studio_path(mode):
+    prefs = bpy.context.preferences.addons[__package__].preferences
+    if mode == 'OBJECT':
+        return prefs.AD_object_studio_path
+    return prefs.AD_material_studio_path
+
+def default_quality(quality=None):
+    """ the quality tier, the one of the preferences if None """
+    if quality is not None:
+        return quality
+    return bpy.context.preferences.addons[__package__].preferences.AD_thumbnail_quality
+
+def quality_size(size, quality):
+    """ thumbnail resolution of a quality tier """
+    return max(1, int(size * QUALITY_SCALE.get(quality, 1.0)))
+
+def sidecar_path(filepath):
+    return os.path.splitext(filepath)[0] + SIDECAR_SUFFIX
+
+def load_sidecar(path):
+    try:
+        with open(path, encoding='utf-8') as sidecar:
+            return json.load(sidecar)
+    except (OSError, ValueError):
+        return {}
+
+def read_sidecar(filepath):
+    """ quality and timing of the thumbnail of a library file, empty if unknown """
+    return load_sidecar(sidecar_path(filepath))
+
+def write_sidecar(path, quality, duration=None, size=0, variants=()):
+    """ records the quality and render time of a thumbnail in the sidecar at path
+        duration: None for thumbnails restored from the cache
+        size: bytes of the thumbnail file
+        variants: material and scaled down thumbnails, see variant_entry
+    """
+    with open(path, 'w', encoding='utf-8') as sidecar:
+        json.dump({
+                'quality': quality,
+                'duration': duration,
+                'size': size,
+                'time': time.time(),
+                'variants': list(variants),
+                }, sidecar)
+
+def thumbnail_quality(filepath):
+    """ quality tier of the thumbnail of a library file
+        thumbnails without sidecar were rendered with the studio settings
+    """
+    return read_sidecar(filepath).get('quality', 'STANDARD')
+
+def pyramid_sizes():
+    """ sizes of the scaled down thumbnails from the preferences, smallest first """
+    prefs = bpy.context.preferences.addons[__package__].preferences
+    sizes = set()
+    for size in prefs.AD_thumbnail_pyramid.split(","):
+        try:
+            sizes.add(int(size))
+        except ValueError:
+            continue
+    return sorted(size for size in sizes if size > 0)
+
+def cache_key(filepath, mode, quality=None):
+    """ key of the thumbnail of a library file with the current render settings
+        returns an empty string if the file or the studio file doesn't exist
+    """
+    prefs = bpy.context.preferences.addons[__package__].preferences
+    quality = default_quality(quality)
+
+    asset_hash = indexed_hash(filepath)
+    studio_hash = indexed_hash(studio_path(mode))
+    if asset_hash == "" or studio_hash == "":
+        return ""
+
+    key = "{}:{}:{}:{}".format(asset_hash, studio_hash, mode, prefs.AD_thumbnail_size)
+    sizes = pyramid_sizes()
+    if sizes:
+        key += ":{}:{}".format(",".join(str(size) for size in sizes), ",".join(sorted(prefs.AD_thumbnail_formats)))
+    # contact sheet thumbnails look different from single renders
+    if mode == 'OBJECT' and prefs.AD_thumbnail_sheet:
+        key += ":SHEET:{}".format(prefs.AD_sheet_columns)
+    if quality != 'STANDARD':
+        key += ":" + quality
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=KEY_SIZE).hexdigest()
+
+def cached_thumbnail(key):
+    """ path of the cached thumbnail or an empty string """
+    for extension in THUMBNAIL_EXTENSIONS:
+        path = os.path.join(cache_folder(), key + extension)
+        if os.path.exists(path):
+            return path
+    return ""
+
+def rendered_thumbnail(filepath):
+    """ path of the thumbnail next to a library file or an empty string """
+    return stem_thumbnail(os.path.splitext(filepath)[0])
+
+def stem_thumbnail(stem):
+    """ path of the thumbnail of a path without extension or an empty string """
+    for extension in THUMBNAIL_EXTENSIONS:
+        path = stem + extension
+        if os.path.exists(path):
+            return path
+    return ""
+
+def variant_name(name):
+    """ datablock name as it appears in thumbnail file names """
+    return bpy.path.clean_name(name)
+
+def variant_entry(suffix, size, image_format, material=None):
+    """ sidecar entry of a material or scaled down thumbnail
+        suffix: the part of the path after the thumbnail path without extension, like __Metal.png or @128.jpg
+    """
+    return {
+            'suffix': suffix,
+            'size': size,
+            'format': image_format,
+            'material': material,
+            }
+
+def stem_variants(stem):
+    """ suffix -> path of the existing per material and scaled down thumbnails
+        of a thumbnail path without extension, as listed in its sidecar
+    """
+    variants = {}
+    for variant in load_sidecar(stem + SIDECAR_SUFFIX).get('variants', []):
+        path = stem + variant['suffix']
+        if os.path.exists(path):
+            variants[variant['suffix']] = path
+    return variants
+
+def thumbnail_variants(filepath):
+    """ suffix -> path of the per material and scaled down thumbnails next to a library file """
+    return stem_variants(os.path.splitext(filepath)[0])
+
+def thumbnail_files(filepath):
+    """ suffix -> path of all thumbnail files of a library file, with the sidecar """
+    stem = os.path.splitext(filepath)[0]
+    files = thumbnail_variants(filepath)
+    for path in glob.glob(glob.escape(stem) + ".*"):
+        suffix = path[len(stem):]
+        if suffix.lower() in THUMBNAIL_EXTENSIONS or suffix == SIDECAR_SUFFIX:
+            files[suffix] = path
+    return files
+
+def sort_variants(variants):
+    return sorted(variants, key=lambda variant: (variant['material'] or "", variant['size'], variant['format']))
+
+def best_thumbnail(filepath, size, material=None):
+    """ path of the smallest thumbnail of a library file at least size pixels large,
+        the largest one if none is, the rendered thumbnail without scaled down ones
+    """
+    stem = os.path.splitext(filepath)[0]
+    variants = [variant for variant in read_sidecar(filepath).get('variants', [])
+            if variant['material'] == material and os.path.exists(stem + variant['suffix'])]
+
+    # Case: No scaled down thumbnails
+    if len(variants) == 0:
+        if material is None:
+            return rendered_thumbnail(filepath)
+        for extension in THUMBNAIL_EXTENSIONS:
+            path = stem + VARIANT_SEPARATOR + material + extension
+            if os.path.exists(path):
+                return path
+        return ""
+
+    adequate = [variant for variant in variants if variant['size'] >= size]
+    if adequate:
+        return stem + min(adequate, key=lambda variant: variant['size'])['suffix']
+    return stem + max(variants, key=lambda variant: variant['size'])['suffix']
+
+def cached_variants(key):
+    """ sidecar entries of the cached per material and scaled down thumbnails
+        None if the entry of the key is incomplete
+    """
+    stem = os.path.join(cache_folder(), key)
+    sidecar = load_sidecar(stem + SIDECAR_SUFFIX)
+    # Case: Stored before the sidecar was cached, or partly evicted
+    if 'variants' not in sidecar:
+        return None
+
+    variants = sidecar['variants']
+    if not all(os.path.exists(stem + variant['suffix']) for variant in variants):
+        return None
+    return variants
+
+def restore(filepath, mode, quality=None):
+    """ copies the cached thumbnail next to the library file
+        returns False on a cache miss
+    """
+    quality = default_quality(quality)
+    key = cache_key(filepath, mode, quality)
+    cached = cached_thumbnail(key) if key != "" else ""
+    variants = cached_variants(key) if cached != "" else None
+
+    if variants is None:
+        stats['misses'] += 1
+        return False
+
+    stem = os.path.splitext(filepath)[0]
+    thumbnail = stem + os.path.splitext(cached)[1]
+    shutil.copyfile(cached, thumbnail)
+    # the modification time orders the entries for eviction
+    os.utime(cached)
+
+    # replace the material and scaled down thumbnails, materials may have been renamed
+    for path in thumbnail_variants(filepath).values():
+        os.remove(path)
+    for variant in variants:
+        path = os.path.join(cache_folder(), key + variant['suffix'])
+        shutil.copyfile(path, stem + variant['suffix'])
+        os.utime(path)
+
+    write_sidecar(sidecar_path(filepath), quality, size=os.path.getsize(thumbnail), variants=variants)
+
+    stats['hits'] += 1
+    return True
+
+def store(filepath, mode, quality=None):
+    """ adds the rendered thumbnail of a library file to the cache """
+    prefs = bpy.context.preferences.addons[__package__].preferences
+    if not prefs.AD_thumbnail_cache:
+        return
+
+    rendered = rendered_thumbnail(filepath)
+    key = cache_key(filepath, mode, quality)
+    if rendered == "" or key == "":
+        return
+
+    # Case: No sidecar or some of the listed thumbnails are gone, the entry would be incomplete
+    sidecar = read_sidecar(filepath)
+    files = thumbnail_variants(filepath)
+    if 'variants' not in sidecar or len(files) != len(sidecar['variants']):
+        return
+
+    stem = os.path.join(cache_folder(), key)
+    shutil.copyfile(rendered, stem + os.path.splitext(rendered)[1])
+    for suffix, path in files.items():
+        shutil.copyfile(path, stem + suffix)
+    # written last, the entry counts as cached once its sidecar exists
+    shutil.copyfile(sidecar_path(filepath), stem + SIDECAR_SUFFIX)
+    stats['stored'] += 1
+
+    evict(prefs.AD_thumbnail_cache_size * 1024 * 1024)
+
+def cache_entries():
+    """ (paths, size, mtime) of the files cached under each key, least recently used first """
+    keys = {}
+    for entry in os.scandir(cache_folder()):
+        if os.path.splitext(entry.name)[1] in THUMBNAIL_EXTENSIONS or entry.name.endswith(SIDECAR_SUFFIX):
+            stat = entry.stat()
+            # the key is a hex digest, the suffix starts with one of . _ @
+            paths, size, mtime = keys.get(entry.name[:KEY_SIZE * 2], ([], 0, 0.0))
+            keys[entry.name[:KEY_SIZE * 2]] = (paths + [entry.path], size + stat.st_size, max(mtime, stat.st_mtime))
+
+    return sorted(keys.values(), key=lambda entry: entry[2])
+
+def evict(max_size):
+    """ removes the least recently used keys with all their thumbnails until the cache fits max_size bytes """
+    entries = cache_entries()
+    total = sum(entry[1] for entry in entries)
+
+    for paths, size, _ in entries:
+        if total <= max_size:
+            break
+        for path in paths:
+            os.remove(path)
+        total -= size
+        stats['evicted'] += 1
+
+def clear():
+    for paths, _, _ in cache_entries():
+        for path in paths:
+            os.remove(path)
+
+    hash_index().clear()
+
+def split_cached(entries, quality=None):
+    """ restores the cached thumbnails of (filepath, mode) pairs
+        returns the pairs that still need to be rendered
+    """
+    prefs = bpy.context.preferences.addons[__package__].preferences
+    if not prefs.AD_thumbnail_cache:
+        return list(entries)
+
+    stale = [(filepath, mode) for filepath, mode in entries if not restore(filepath, mode, quality)]
+    save_index()
+    log("Thumbnail cache: {} of {} thumbnails restored".format(len(entries) - len(stale), len(entries)))
+
+    return stale
+
+def tier_timings(filepaths):
+    """ quality -> (thumbnails, average render seconds) of the rendered thumbnails of library files """
+    durations = {}
+    for filepath in filepaths:
+        sidecar = read_sidecar(filepath)
+        if sidecar.get('duration') is not None:
+            durations.setdefault(sidecar['quality'], []).append(sidecar['duration'])
+
+    return {quality: (len(values), sum(values) / len(values)) for quality, values in durations.items()}
+
+def summary():
+    """ one line description of the cache state and statistics """
+    entries = cache_entries()
+    requests = stats['hits'] + stats['misses']
+    hit_rate = stats['hits'] / requests * 100 if requests else 0.0
+
+    return "{} hits, {} misses ({:.0f}% hit rate), {} stored, {} evicted, {} thumbnails using {:.1f} MB".format(
+            stats['hits'],
+            stats['misses'],
+            hit_rate,
+            stats['stored'],
+            stats['evicted'],
+            len(entries),
+            sum(entry[1] for entry in entries) / (1024 * 1024))
@@ -0,0 +1,177 @@
+# Bulk object transforms
+#
+# QuickPlace and QuickRotate move thousands of objects on every mouse move.
+# Locations and rotations of all objects are read and written at once through
+# foreach_get/foreach_set on bpy.data.objects, the math runs on NumPy arrays.
+# Offsets can follow the world axes or the axes each object moves along in
+# its parent space, random factors come from a seed so results repeat.
+import math
+
+import numpy as np
+
+import bpy
+
+from mathutils import Matrix
+
+AXES = ('X', 'Y', 'Z')
+
+def object_rows(objects):
+    """ index of each object in bpy.data.objects """
+    index = {obj.as_pointer(): i for i, obj in enumerate(bpy.data.objects)}
+    return np.array([index[obj.as_pointer()] for obj in objects], dtype=np.int64)
+
+def read_vectors(attribute):
+    """ a vector property of all objects as (n, 3) array """
+    objects = bpy.data.objects
+    values = np.empty(len(objects) * 3, dtype=np.float32)
+    objects.foreach_get(attribute, values)
+    return values.reshape(-1, 3)
+
+def parent_spaces(objects):
+    """ 3x3 matrix of the space each object's location and rotation live in """
+    spaces = np.tile(np.eye(3), (len(objects), 1, 1))
+    for i, obj in enumerate(objects):
+        if obj.parent is not None:
+            matrix = obj.parent.matrix_world @ obj.matrix_parent_inverse
+            spaces[i] = np.array(matrix.to_3x3())
+    return spaces
+
+def axis_matrices(axis, angles):
+    """ rotation matrices around an axis, one per angle """
+    matrices = np.tile(np.eye(3), (len(angles), 1, 1))
+    cos, sin = np.cos(angles), np.sin(angles)
+    a, b = [(1, 2), (0, 2), (0, 1)][axis]
+    sign = -1.0 if axis == 1 else 1.0
+    matrices[:, a, a] = cos
+    matrices[:, b, b] = cos
+    matrices[:, a, b] = -sin * sign
+    matrices[:, b, a] = sin * sign
+    return matrices
+
+def euler_to_matrix(eulers):
+    """ XYZ eulers (n, 3) to rotation matrices (n, 3, 3) """
+    return axis_matrices(2, eulers[:, 2]) @ axis_matrices(1, eulers[:, 1]) @ axis_matrices(0, eulers[:, 0])
+
+def matrix_to_euler(matrices, previous):
+    """ rotation matrices (n, 3, 3) to XYZ eulers close to the previous ones,
+        like Matrix.to_euler('XYZ', previous), so rotations don't flip
+    """
+    cy = np.hypot(matrices[:, 0, 0], matrices[:, 1, 0])
+    first = np.stack([
+        np.arctan2(matrices[:, 2, 1], matrices[:, 2, 2]),
+        np.arctan2(-matrices[:, 2, 0], cy),
+        np.arctan2(matrices[:, 1, 0], matrices[:, 0, 0]),
+        ], axis=1)
+    second = np.stack([
+        np.arctan2(-matrices[:, 2, 1], -matrices[:, 2, 2]),
+        np.arctan2(-matrices[:, 2, 0], -cy),
+        np.arctan2(-matrices[:, 1, 0], -matrices[:, 0, 0]),
+        ], axis=1)
+
+    # Case: Gimbal lock, only the sum of x and z is defined
+    locked = cy < 16.0 * np.finfo(np.float32).eps
+    if locked.any():
+        first[locked, 0] = np.arctan2(-matrices[locked, 1, 2], matrices[locked, 1, 1])
+        first[locked, 2] = 0.0
+        second[locked] = first[locked]
+
+    # move each angle to the turn closest to the previous one
+    def compatible(eulers):
+        return eulers - np.round((eulers - previous) / (2 * math.pi)) * 2 * math.pi
+
+    first, second = compatible(first), compatible(second)
+    use_second = np.abs(second - previous).sum(axis=1) < np.abs(first - previous).sum(axis=1)
+    first[use_second] = second[use_second]
+    return first
+
+class BulkTransform:
+    """ start transforms and random factors of a group of objects """
+
+    def __init__(self, objects, seed=0):
+        # sorted, so the same seed gives every object the same factor again
+        self.objects = sorted(objects, key=lambda obj: obj.name)
+        self.rows = object_rows(self.objects)
+
+        self.start_locations = read_vectors('location')[self.rows].astype(np.float64)
+        self.start_rotations = read_vectors('rotation_euler')[self.rows].astype(np.float64)
+
+        spaces = parent_spaces(self.objects)
+        self.inverse_spaces = np.linalg.pinv(spaces)
+        # rotation part of the parent spaces, without their scale
+        self.rotation_spaces = spaces / np.maximum(np.linalg.norm(spaces, axis=1, keepdims=True), 1e-12)
+
+        # only XYZ eulers are converted with NumPy, other rotation modes keep using mathutils
+        self.xyz = np.array([obj.rotation_mode == 'XYZ' for obj in self.objects], dtype=bool)
+
+        self.reseed(seed)
+
+    def reseed(self, seed):
+        self.seed = seed
+        self.random_values = np.random.RandomState(seed).uniform(-1.0, 1.0, len(self.objects))
+
+    def factors(self, randomness):
+        """ per object factor, 1 without randomness, the random value at full randomness """
+        return (1.0 - randomness) + self.random_values * randomness
+
+    def write(self, attribute, values):
+        """ sets a vector property of the objects, all objects in one call """
+        current = read_vectors(attribute)
+        current[self.rows] = values
+        bpy.data.objects.foreach_set(attribute, current.ravel())
+
+        # foreach_set doesn't tag the objects for the depsgraph
+        for obj in self.objects:
+            obj.update_tag(refresh={'OBJECT'})
+
+    def translate(self, axis, offset, randomness=0.0, world=False):
+        """ moves the objects from their start location along an axis """
+        self.write('location', self.locations(axis, offset, randomness, world))
+
+    def rotate(self, axis, angle, randomness=0.0, world=False):
+        """ rotates the objects from their start rotation around an axis """
+        self.write('rotation_euler', self.rotations(axis, angle, randomness, world))
+
+    def locations(self, axis, offset, randomness=0.0, world=False):
+        """ locations of the objects moved from their start location along an axis """
+        deltas = np.zeros((len(self.objects), 3))
+        deltas[:, axis] = offset * self.factors(randomness)
+
+        # Case: World axis, move along it in each parent space
+        if world:
+            deltas = np.einsum('nij,nj->ni', self.inverse_spaces, deltas)
+
+        return self.start_locations + deltas
+
+    def rotations(self, axis, angle, randomness=0.0, world=False):
+        """ euler rotations of the objects rotated from their start rotation around an axis """
+        angles = angle * self.factors(randomness)
+        rotations = axis_matrices(axis, angles)
+        starts = euler_to_matrix(self.start_rotations)
+
+        # Case: World axis, rotate around it in each parent space
+        if world:
+            spaces = self.rotation_spaces
+            matrices = spaces.transpose(0, 2, 1) @ rotations @ spaces @ starts
+        else:
+            matrices = starts @ rotations
+
+        eulers = matrix_to_euler(matrices, self.start_rotations)
+
+        # Case: Other rotation modes
+        for i in np.nonzero(~self.xyz)[0]:
+            obj = self.objects[i]
+            euler = obj.rotation_euler.copy()
+            euler[:] = self.start_rotations[i]
+            if world:
+                matrix = np.array(euler.to_matrix())
+                matrix = self.rotation_spaces[i].T @ rotations[i] @ self.rotation_spaces[i] @ matrix
+                euler = Matrix(matrix.tolist()).to_euler(euler.order, euler)
+            else:
+                euler.rotate_axis(AXES[axis], angles[i])
+            eulers[i] = euler
+
+        return eulers
+
+    def reset(self):
+        self.write('location', self.start_locations)
+        self.write('rotation_euler', self.start_rotations)
@@ -1,16 +1,18 @@
 import os
-import subprocess
+import tempfile
 import time
 import math
 
 import bpy
 from bpy_extras import view3d_utils
-import bmesh
 
 from mathutils import Vector
 from mathutils import Matrix
 import mathutils
 
+from . import ad_raycast
+from . import ad_bounds
+
 def log(msg):
     t = time.localtime()
     current_time = time.strftime("%H:%M", t)
@@ -35,75 +37,11 @@ def raycast_object(context, event, excluded=[]):
     # get the ray from the viewport and mouse
     view_vector = view3d_utils.region_2d_to_vector_3d(region, rv3d, coord)
     ray_origin = view3d_utils.region_2d_to_origin_3d(region, rv3d, coord)
-    ray_target = ray_origin + view_vector
-
-    def visible_objects_and_duplis():
-        """Loop over (object, matrix) pairs (mesh only)"""
-
-        depsgraph = context.evaluated_depsgraph_get()
-
-        # get the evaluated object for each excluded object
-        excluded_eval_objs = []
-        for obj in excluded:
-            excluded_eval_objs.append(obj.evaluated_get(depsgraph))
-
-        for dup in depsgraph.object_instances:
-            if dup.is_instance:  # Real dupli instance
-                obj = dup.instance_object
-                yield (obj, dup.matrix_world.copy())
-            else:  # Usual object
-                obj = dup.object
-                if obj not in excluded_eval_objs:
-                    yield (obj, obj.matrix_world.copy())
-
-
-
-    def obj_ray_cast(obj, matrix):
-        """Wrapper for ray casting that moves the ray into object space"""
-
-        # get the ray relative to the object
-        matrix_inv = matrix.inverted()
-        ray_origin_obj = matrix_inv @ ray_origin
-        ray_target_obj = matrix_inv @ ray_target
-        ray_direction_obj = ray_target_obj - ray_origin_obj
-
-        # cast the ray
-        success, location, normal, face_index = obj.ray_cast(ray_origin_obj, ray_direction_obj)
-
-        if success:
-            return location, normal, face_index
-        else:
-            return None, None, None
-
-    # cast rays and find the closest object
-    best_length_squared = -1.0
-    best_obj = None
-    world_loc = (0, 0, 0)
-    hit_normal = (0, 0, 0)
-    face_id = None
-
-    for obj, matrix in visible_objects_and_duplis():
-        if obj.type == 'MESH':
-            hit, normal, face_index = obj_ray_cast(obj, matrix)
-            if hit is not None:
-                hit_world = matrix @ hit
-                length_squared = (hit_world - ray_origin).length_squared
-                if best_obj is None or length_squared < best_length_squared:
-                    best_length_squared = length_squared
-                    best_obj = obj
-                    world_loc = hit_world
-                    hit_normal = normal
-                    face_id = face_index
-
-    return best_obj, world_loc, hit_normal, face_id
-    # now we have the object under the mouse cursor,
-    # we could do lots of stuff but for the example just select.
-    # if best_obj is not None:
-        # for selection etc. we need the original object,
-        # evaluated objects are not in viewlayer
-        # best_original = best_obj.original
-        # best_original.select_set(True)
-        # context.view_layer.objects.active = best_original
+
+    # the accelerators keep their bounds between clicks
+    prefs = context.preferences.addons[__package__].preferences
+    depsgraph = context.evaluated_depsgraph_get()
+    return ad_raycast.ray_cast(prefs.AD_raycast_method, depsgraph, ray_origin, view_vector, excluded)
 
 def raycast_plane(context, event):
     viewport_region = context.region
@@ -141,18 +79,8 @@ def raycast_plane(context, event):
     return position_on_grid
 
 def get_matslot_from_faceid(obj, face_id):
-    # create empty bmesh
-    bm = bmesh.new()
-    # populate with meshdata
-    bm.from_mesh(obj.data)
-    # update face indices lookuptable
-    bm.faces.ensure_lookup_table()
-    # get matslot
-    matslot_index = bm.faces[face_id].material_index
-    # delete bmesh
-    bm.free()
-
-    return matslot_index
+    # material indices of the mesh are cached until it changes
+    return ad_raycast.material_indices.lookup(obj, face_id)
 
 def orient_to_vector(obj, vector, axis, rotation_offset):
     # axis inverted
@@ -194,123 +122,52 @@ def orient_to_vector_track(obj, vector, track, up):
 
     obj.rotation_euler = rot_difference.to_euler()
 
-def get_ws_extents(obj):
-    """ calculates bounding box in worldspace
-        returns a tuple of mathutils.Vectors
-
-        point order in bound box X|Y|Z|Corner
-        Left/Right | Front/Back | Top/Bottom | Corner
-
-        LeftFrontBottomCorner   => LFBC
-        LeftFrontTopCorner      => LFTC
-        LeftBackTopCorner       => LBTC
-        LeftBackBottomCorner    => LBBC
-        RightFrontBottomCorner  => RFBC
-        RightFrontTopCorner     => RFTC
-        RightBackTopCorner      => RBTC
-        RightBackBottomCorner   => RBBC
-    """
-
-    ws_extents = []
-    for coords in obj.bound_box:
-        ws_extents.append(obj.matrix_world @ Vector(coords))
-
-    return tuple(ws_extents)
-
 def get_ws_min_max(objects):
     """ gets the min and max bounds of a group of objects
         in worldspace
         returns a tuple of 2 mathutils.Vector
     """
-
-    # get all ws bounding boxes
-    ws_extents = []
-    for obj in objects:
-        ws_extents.append(get_ws_extents(obj))
-
-    # get min and maximum
-    ws_min = ws_extents[0][0].copy()
-    ws_max = ws_extents[0][1].copy()
-    for extents in ws_extents:
-        for vec in extents:
-            for i, val in enumerate(vec):
-                if val < ws_min[i]:
-                    ws_min[i] = val
-
-            for i, val in enumerate(vec):
-                if val > ws_max[i]:
-                    ws_max[i] = val
-
-    return (ws_min, ws_max)
+    # bounds of all objects are cached and computed at once
+    return ad_bounds.group_min_max(objects)
 
 def get_center(extents, axis):
     """ calculates the center of the chosen bounding box side
         return the location in worldspace as mathutils.Vector
     """
+    return ad_bounds.face_center(extents, axis)
 
-    ws_min, ws_max = extents
-
-    # Left/Right|Front/Back|Top/Bottom Corner
-    LFBC = ws_min
-    LFTC = Vector((ws_min[0], ws_min[1], ws_max[2])) 
-    LBTC = Vector((ws_min[0], ws_max[1], ws_max[2]))
-    LBBC = Vector((ws_min[0], ws_max[1], ws_min[2]))
-    RFBC = Vector((ws_max[0], ws_min[1], ws_min[2]))
-    RFTC = Vector((ws_max[0], ws_min[1], ws_max[2]))
-    RBTC = ws_max
-    RBBC = Vector((ws_max[0], ws_max[1], ws_min[2]))
-
-    if axis == '-X':
-        x_min = LFBC - (LFBC - LBTC)/2
-        return x_min
-    if axis == 'X':
-        x_max   = RFBC - (RFBC - RBTC)/2
-        return x_max
-    if axis == '-Y':
-        y_min   = LFBC - (LFBC - RFTC)/2
-        return y_min
-    if axis == 'Y':
-        y_max   = LBBC - (LBBC - RBTC)/2
-        return y_max
-    if axis == '-Z':
-        z_min   = LFBC - (LFBC - RBBC)/2
-        return z_min
-    if axis == 'Z':
-        z_max   = LFTC - (LFTC - RBTC)/2
-        return z_max
-    if axis == 'CENTER':
-        center  = LFBC - (LFBC - RBTC)/2
-        return center
-
-    return False
-
-def background_worker(scriptpath, filepath=""):
-    """ starts a headless blender instance
+# python expression starting the job loop of a headless blender instance
+WORKER_EXPRESSION = "import {0}.ad_worker; {0}.ad_worker.main()".format(__package__)
+
+def worker_command(filepath="", threads=0, arguments=()):
+    """ builds the command line for a headless blender worker
 
         filepath: blendfile to open
-        scriptpath: pythonscript to pass to the instance
+        threads: number of render threads, 0 lets blender decide
+        arguments: job source and options passed to the worker after '--'
     """
-    import shlex
-
+    command = [bpy.app.binary_path]
 
     if filepath != "":
-        command = '"{}" "{}" -b -P "{}" --addons {}'.format(
-                bpy.app.binary_path,
-                filepath,
-                scriptpath,
-                __package__
-                )
-
-    else:
-        command = '"{}" -b -P "{}" --addons {}'.format(
-                bpy.app.binary_path,
-                scriptpath,
-                __package__
-                )
-
-    command = shlex.split(command)
-
-    log("=============== Background Worker ===============")
-    # subprocess.call(command, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
-    subprocess.call(command)
-    log("=============== Background Worker ===============")
+        command.append(filepath)
+
+    command += ["-b", "--addons", __package__]
+
+    if threads > 0:
+        command += ["-t", str(threads)]
+
+    # make failing jobs visible in the return code
+    command += ["--python-exit-code", "1"]
+    command += ["--python-expr", WORKER_EXPRESSION]
+
+    command.append("--")
+    command += list(arguments)
+
+    return command
+
+def temp_filepath(prefix, suffix):
+    """ returns a new unique filepath in blenders temp directory """
+    handle, path = tempfile.mkstemp(prefix=prefix, suffix=suffix, dir=bpy.app.tempdir)
+    os.close(handle)
+
+    return path
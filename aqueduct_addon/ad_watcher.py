@@ -0,0 +1,500 @@
+# Library folder watcher
+#
+# Notices .blend files being added, changed, moved or removed in the library
+# folder. Uses inotify on linux and polls the folder elsewhere. Events get
+# debounced and then
+#   - update the catalog entries of the affected files only
+#   - fix or prune the batch render list entries of moved/removed files
+#   - queue thumbnails of changed files whose thumbnail got stale
+# Everything is driven from a bpy.app.timers callback.
+import os
+import sys
+import time
+import struct
+import threading
+
+import bpy
+
+from .ad_utils import log
+
+# seconds without new events before they get processed
+DEBOUNCE = 1.0
+# seconds between polls of the polling watcher
+POLL_INTERVAL = 2.0
+# files the polling watcher stats per poll
+POLL_BATCH = 2000
+
+# inotify event masks, see inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+
+def is_blendfile(path):
+    return path.endswith(".blend")
+
+def watched_folders(folder):
+    """ folder and its subfolders, hidden ones are skipped """
+    for root, dirs, _ in os.walk(folder):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        yield root
+
+def blendfiles_below(folder):
+    for root in watched_folders(folder):
+        try:
+            names = os.listdir(root)
+        except OSError:
+            continue
+        for name in names:
+            if is_blendfile(name):
+                yield os.path.join(root, name)
+
+class InotifyWatcher:
+    """ reports changes below folder through linux inotify
+
+        read() returns a list of events:
+            ('CHANGED', path, None)
+            ('REMOVED', path, None), path may be a folder
+            ('MOVED', source, destination), paths may be folders
+            ('OVERFLOW', folder, None), events were lost
+    """
+
+    def __init__(self, folder):
+        import ctypes
+        import ctypes.util
+
+        if not sys.platform.startswith('linux'):
+            raise OSError("inotify is only available on linux")
+
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self.folder = folder
+        self.watches = {}
+        # cookie -> (path, is folder) of moves waiting for their destination
+        self.moved_from = {}
+
+        for path in watched_folders(folder):
+            self.add_watch(path)
+
+    def add_watch(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd >= 0:
+            self.watches[wd] = path
+
+    def read(self):
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            events += self.parse(data)
+
+        # moves without destination left the watched folder
+        for path, is_folder in self.moved_from.values():
+            if is_folder or is_blendfile(path):
+                events.append(('REMOVED', path, None))
+        self.moved_from.clear()
+
+        return events
+
+    def parse(self, data):
+        events = []
+        offset = 0
+        while offset + 16 <= len(data):
+            wd, mask, cookie, length = struct.unpack_from("iIII", data, offset)
+            name = os.fsdecode(data[offset + 16:offset + 16 + length].rstrip(b"\0"))
+            offset += 16 + length
+
+            if mask & IN_Q_OVERFLOW:
+                events.append(('OVERFLOW', self.folder, None))
+                continue
+
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+
+            parent = self.watches.get(wd)
+            if parent is None or name.startswith("."):
+                continue
+
+            path = os.path.join(parent, name)
+            is_folder = bool(mask & IN_ISDIR)
+
+            if mask & IN_MOVED_FROM:
+                self.moved_from[cookie] = (path, is_folder)
+
+            elif mask & IN_MOVED_TO:
+                source = self.moved_from.pop(cookie, None)
+                if source is not None and is_folder:
+                    events.append(('MOVED', source[0], path))
+                    self.rename_watches(source[0], path)
+                elif source is not None and is_blendfile(source[0]):
+                    # Case: Renamed away from .blend, like the backup Blender keeps on save
+                    if is_blendfile(path):
+                        events.append(('MOVED', source[0], path))
+                    else:
+                        events.append(('REMOVED', source[0], None))
+                elif is_folder:
+                    events += self.add_folder(path)
+                elif is_blendfile(path):
+                    events.append(('CHANGED', path, None))
+
+            elif mask & IN_CREATE and is_folder:
+                events += self.add_folder(path)
+
+            elif mask & IN_CLOSE_WRITE and is_blendfile(path):
+                events.append(('CHANGED', path, None))
+
+            elif mask & IN_DELETE and (is_folder or is_blendfile(path)):
+                events.append(('REMOVED', path, None))
+
+        return events
+
+    def add_folder(self, folder):
+        """ watches a new folder and reports the files that are already in it """
+        for path in watched_folders(folder):
+            self.add_watch(path)
+        return [('CHANGED', path, None) for path in blendfiles_below(folder)]
+
+    def rename_watches(self, source, destination):
+        prefix = os.path.join(source, "")
+        for wd, path in self.watches.items():
+            if path == source:
+                self.watches[wd] = destination
+            elif path.startswith(prefix):
+                self.watches[wd] = os.path.join(destination, path[len(prefix):])
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingWatcher:
+    """ reports changes below folder by comparing stats, see InotifyWatcher.read
+
+        Folders are checked by their mtime and only listed once it changes.
+        Known files are stat'ed in batches of POLL_BATCH to notice changes
+        without walking the whole library on every poll. The first snapshot
+        is taken on a thread, walking a large library would block the ui.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.last_poll = 0.0
+        self.cursor = 0
+
+        self.folders = {}
+        self.files = {}
+        self.snapshot = threading.Thread(target=self.take_snapshot, daemon=True)
+        self.snapshot.start()
+
+    def take_snapshot(self):
+        folders = {path: self.stat(path) for path in watched_folders(self.folder)}
+        files = {path: self.stat(path) for path in blendfiles_below(self.folder)}
+        self.folders, self.files = folders, files
+
+    @staticmethod
+    def stat(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def read(self):
+        # Case: First snapshot isn't taken yet
+        if self.snapshot.is_alive():
+            return []
+        if time.time() - self.last_poll < POLL_INTERVAL:
+            return []
+        self.last_poll = time.time()
+
+        events = []
+
+        # list folders whose entries changed
+        for folder, known in list(self.folders.items()):
+            if folder not in self.folders:
+                # removed along with its parent
+                continue
+
+            current = self.stat(folder)
+            if current == known:
+                continue
+
+            if current is None:
+                events += self.remove_folder(folder)
+                continue
+
+            self.folders[folder] = current
+            try:
+                names = [n for n in os.listdir(folder) if not n.startswith(".")]
+            except OSError:
+                continue
+
+            for name in names:
+                path = os.path.join(folder, name)
+                if path in self.folders or path in self.files:
+                    continue
+                if os.path.isdir(path):
+                    for sub in watched_folders(path):
+                        self.folders[sub] = self.stat(sub)
+                    for blend in blendfiles_below(path):
+                        self.files[blend] = self.stat(blend)
+                        events.append(('CHANGED', blend, None))
+                elif is_blendfile(name):
+                    self.files[path] = self.stat(path)
+                    events.append(('CHANGED', path, None))
+
+        # stat a batch of the known files
+        paths = sorted(self.files)
+        batch = paths[self.cursor:self.cursor + POLL_BATCH]
+        self.cursor = self.cursor + POLL_BATCH if self.cursor + POLL_BATCH < len(paths) else 0
+        for path in batch:
+            if path not in self.files:
+                continue
+            current = self.stat(path)
+            if current is None:
+                del self.files[path]
+                events.append(('REMOVED', path, None))
+            elif current != self.files[path]:
+                self.files[path] = current
+                events.append(('CHANGED', path, None))
+
+        return events
+
+    def remove_folder(self, folder):
+        prefix = os.path.join(folder, "")
+        for path in [p for p in self.folders if p == folder or p.startswith(prefix)]:
+            del self.folders[path]
+        for path in [p for p in self.files if p.startswith(prefix)]:
+            del self.files[path]
+        return [('REMOVED', folder, None)]
+
+    def close(self):
+        pass
+
+# Watcher state, owned by the timer
+
+watcher = None
+# events waiting for the debounce period to pass
+pending = []
+last_event = 0.0
+# catalog update running in the background
+updater = None
+# events were lost, the library gets scanned once the update finished
+rescan = False
+
+def start(folder):
+    global watcher
+
+    stop()
+
+    try:
+        watcher = InotifyWatcher(folder)
+    except (OSError, AttributeError):
+        watcher = PollingWatcher(folder)
+    log("Watching library folder {} ({})".format(folder, type(watcher).__name__))
+
+    if not bpy.app.timers.is_registered(tick):
+        bpy.app.timers.register(tick, first_interval=0.5, persistent=True)
+
+def stop():
+    global watcher, rescan
+
+    if bpy.app.timers.is_registered(tick):
+        bpy.app.timers.unregister(tick)
+
+    if watcher is not None:
+        watcher.close()
+        watcher = None
+    pending.clear()
+    rescan = False
+
+def tick():
+    """ timer callback collecting events, processes them once they settle """
+    global last_event, rescan
+
+    if watcher is None:
+        return None
+
+    try:
+        events = watcher.read()
+    except OSError as e:
+        log("Library watcher failed: {}".format(e))
+        return None
+
+    if events:
+        pending.extend(events)
+        last_event = time.time()
+
+    # wait for the catalog update of the last batch to finish
+    if pending and time.time() - last_event > DEBOUNCE and (updater is None or not updater.is_alive()):
+        events = list(pending)
+        pending.clear()
+        process(events)
+
+    # the scanner runs as its own process, never forked from blender
+    if rescan and (updater is None or not updater.is_alive()):
+        from .ad_ops_catalog import catalog_path, start_scan
+        rescan = False
+        start_scan(watcher.folder, catalog_path())
+
+    return 0.5
+
+def collapse(events):
+    """ reduces a sequence of events to the moves, changed and removed paths """
+    moves = []
+    changed = set()
+    removed = set()
+    overflow = False
+
+    for kind, path, destination in events:
+        prefix = os.path.join(path, "")
+        below = {p for p in changed if p == path or p.startswith(prefix)}
+
+        if kind == 'OVERFLOW':
+            overflow = True
+        elif kind == 'MOVED':
+            moves.append((path, destination))
+            changed -= below
+            changed |= {destination + p[len(path):] for p in below}
+        elif kind == 'CHANGED':
+            changed.add(path)
+            removed.discard(path)
+        elif kind == 'REMOVED':
+            removed.add(path)
+            changed -= below
+
+    return moves, changed, removed, overflow
+
+def process(events):
+    """ applies a settled batch of events """
+    global updater, rescan
+
+    from . import ad_catalog
+    from .ad_ops_catalog import catalog_path
+
+    moves, changed, removed, overflow = collapse(events)
+    log("Library changes: {} moved, {} changed, {} removed".format(len(moves), len(changed), len(removed)))
+
+    update_batch_list(moves, removed)
+    queue_thumbnails(changed)
+
+    database = catalog_path()
+    if database == "" or not os.path.exists(database):
+        return
+
+    # events were lost, let the scan compare mtimes and sizes
+    if overflow:
+        rescan = True
+
+    def update_catalog():
+        try:
+            for source, destination in moves:
+                ad_catalog.move_path(database, source, destination)
+            for path in removed:
+                ad_catalog.remove_folder(database, path)
+            ad_catalog.update_files(database, sorted(changed | removed))
+        except Exception as e:
+            log("Updating the library catalog failed: {}".format(e))
+
+    updater = threading.Thread(target=update_catalog, daemon=True)
+    updater.start()
+
+def update_batch_list(moves, removed):
+    """ points entries of moved files to their new path and drops removed ones """
+    prefs = bpy.context.preferences.addons[__package__].preferences
+    _list = prefs.AD_batchrender_list
+
+    for source, destination in moves:
+        prefix = os.path.join(source, "")
+        for entry in _list:
+            if entry.filepath == source:
+                entry.filepath = destination
+            elif entry.filepath.startswith(prefix):
+                entry.filepath = os.path.join(destination, entry.filepath[len(prefix):])
+
+    prefixes = tuple(os.path.join(path, "") for path in removed)
+    dead = [i for i, entry in enumerate(_list)
+            if entry.filepath in removed or entry.filepath.startswith(prefixes)]
+
+    for i in reversed(dead):
+        log("Removing {} from the batch list, the file is gone".format(_list[i].filepath))
+        _list.remove(i)
+
+    if dead:
+        prefs.AD_batchrender_list_index = min(prefs.AD_batchrender_list_index, max(0, len(_list) - 1))
+
+def queue_thumbnails(changed):
+    """ renders thumbnails of changed files that have an older thumbnail
+        or are on the batch render list
+    """
+    from . import ad_thumbcache
+    from .ad_jobs import run_jobs, pending_paths
+    from .ad_blendfile import BlendFile, BlendFileError
+    from .ad_ops_utility import thumbnail_batch_jobs
+
+    prefs = bpy.context.preferences.addons[__package__].preferences
+    if not prefs.AD_watch_thumbnails:
+        return
+
+    modes = {entry.filepath: entry.mode for entry in prefs.AD_batchrender_list}
+    # files our own jobs are still writing get their thumbnails from those jobs
+    busy = pending_paths()
+
+    stale = []
+    for path in sorted(changed):
+        if not os.path.exists(path) or os.path.normpath(path) in busy:
+            continue
+
+        thumbnail = ad_thumbcache.rendered_thumbnail(path)
+        if thumbnail != "" and os.path.getmtime(thumbnail) >= os.path.getmtime(path):
+            continue
+
+        if path in modes:
+            mode = modes[path]
+        elif thumbnail != "":
+            # files without objects are material libraries
+            try:
+                with BlendFile(path) as blend:
+                    mode = 'OBJECT' if blend.id_blocks('OB') else 'MATERIAL'
+            except (OSError, BlendFileError):
+                continue
+        else:
+            continue
+
+        stale.append((path, mode))
+
+    stale = ad_thumbcache.split_cached(stale)
+    if stale:
+        log("Queueing {} stale thumbnails".format(len(stale)))
+        run_jobs(thumbnail_batch_jobs(stale), background=True)
+
+def update_watcher(prefs, context):
+    """ starts or stops the watcher when the settings change """
+    if prefs.AD_watch_library and os.path.isdir(prefs.AD_library_path):
+        start(os.path.normpath(prefs.AD_library_path))
+    else:
+        stop()
+
+def register():
+    # preferences are only available once the addon finished loading
+    bpy.app.timers.register(
+            lambda: update_watcher(bpy.context.preferences.addons[__package__].preferences, bpy.context),
+            first_interval=1.0)
+
+def unregister():
+    stop()
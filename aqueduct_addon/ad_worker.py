@@ -0,0 +1,797 @@
+# Entry module of the headless blender workers
+#
+# Runs json job specs in a background blender instance started with
+# blender -b --addons aqueduct_addon --python-expr "..." -- <source> [--results path]
+#
+# sources:
+#   --connect host:port   receive jobs from the worker pool until it quits
+#   --jobs path           run the job spec (or list of specs) in the json file
+#   --stdin               run the job spec (or list of specs) read from stdin
+#
+# Each spec has a 'type' and the 'filepath' of the blendfile it runs in,
+# an empty filepath runs the job in an empty file.
+#
+# Render jobs keep their studio file open. Its datablocks are recorded once
+# after opening it, and the next render in the same studio file purges the
+# datablocks of the last asset instead of loading the studio again.
+import os
+import sys
+import json
+import math
+import shutil
+import tempfile
+import time
+import socket
+import traceback
+
+import numpy as np
+
+import bpy
+
+from mathutils import Matrix, Vector
+
+from .ad_utils import log
+from .ad_pool import Connection
+from .ad_thumbcache import SIDECAR_SUFFIX, VARIANT_SEPARATOR, SIZE_SEPARATOR, FORMAT_EXTENSIONS
+from .ad_thumbcache import stem_variants, stem_thumbnail, variant_entry, sort_variants, variant_name, write_sidecar
+
+def get_arguments():
+    """ returns the arguments passed after '--' """
+    if "--" in sys.argv:
+        return sys.argv[sys.argv.index("--") + 1:]
+    return []
+
+def memory_usage():
+    """ resident memory of this process in bytes, 0 if unknown """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # linux reports kilobytes, macOS bytes
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        return 0
+
+def reset_file(filepath):
+    """ opens the blendfile or resets to an empty file """
+    if filepath != "":
+        bpy.ops.wm.open_mainfile(filepath=filepath)
+    else:
+        bpy.ops.wm.read_homefile(use_empty=True)
+
+def save_file(filepath=""):
+    """ saves the open file, to filepath if given, without .blend1 backups """
+    bpy.context.preferences.filepaths.save_version = 0
+    if filepath != "":
+        bpy.ops.wm.save_as_mainfile(filepath=filepath)
+    else:
+        bpy.ops.wm.save_mainfile()
+
+def render_still(scene, output, size):
+    """ renders the scene camera to output, the file extension gets added """
+    render = scene.render
+    render.resolution_x = size
+    render.resolution_y = size
+    render.use_file_extension = True
+    render.filepath = output
+
+    bpy.ops.render.render(write_still=True)
+
+# render settings of the quality tiers as attribute paths from the scene,
+# STANDARD keeps the settings of the studio file
+QUALITY_SETTINGS = {
+        'PREVIEW': {
+            'render.engine': 'BLENDER_WORKBENCH',
+            'display.shading.light': 'STUDIO',
+            'display.shading.color_type': 'MATERIAL',
+            'display.render_aa': '8',
+            },
+        'DRAFT': {
+            'render.engine': 'CYCLES',
+            'cycles.device': 'CPU',
+            'cycles.samples': 16,
+            'cycles.max_bounces': 4,
+            'cycles.use_adaptive_sampling': False,
+            'cycles.use_denoising': True,
+            },
+        'FINAL': {
+            'render.engine': 'CYCLES',
+            'cycles.samples': 1024,
+            'cycles.use_adaptive_sampling': True,
+            'cycles.adaptive_threshold': 0.005,
+            # not in older versions of blender
+            'cycles.time_limit': 60.0,
+            'cycles.use_denoising': True,
+            'cycles.denoiser': 'OPENIMAGEDENOISE',
+            },
+        }
+
+def resolve_setting(scene, path):
+    """ owner and name of a setting path like cycles.samples, owner is None if it doesn't exist """
+    names = path.split(".")
+    owner = scene
+    for name in names[:-1]:
+        owner = getattr(owner, name, None)
+        if owner is None:
+            return None, names[-1]
+
+    if not hasattr(owner, names[-1]):
+        return None, names[-1]
+    return owner, names[-1]
+
+def apply_quality(scene, quality):
+    """ changes the render settings of the scene to a quality tier """
+    for path, value in QUALITY_SETTINGS.get(quality, {}).items():
+        owner, name = resolve_setting(scene, path)
+        if owner is None:
+            continue
+        try:
+            setattr(owner, name, value)
+        except (TypeError, ValueError):
+            log("Render setting {} not available, skipped".format(path))
+
+def write_sidecars(spec, duration, rendered):
+    """ records quality, render time and variants next to the thumbnails of a render spec
+        rendered: output -> sidecar entries of the material and scaled down thumbnails the render wrote
+    """
+    items = spec.get('assets', [spec])
+    for item in items:
+        thumbnail = stem_thumbnail(item['output'])
+        size = os.path.getsize(thumbnail) if thumbnail != "" else 0
+        write_sidecar(item['output'] + SIDECAR_SUFFIX, spec.get('quality', 'STANDARD'),
+                duration / len(items), size, sort_variants(rendered.get(item['output'], [])))
+
+def writable_formats(formats):
+    """ the image formats this blender version can write """
+    known = {item.identifier for item in bpy.types.Image.bl_rna.properties['file_format'].enum_items}
+    for image_format in formats:
+        if image_format not in known:
+            log("Image format {} not available, skipped".format(image_format))
+    return [image_format for image_format in formats if image_format in known]
+
+def area_weights(source, target):
+    """ (target, source) matrix averaging source pixels into target pixels by their overlap """
+    edges = np.arange(target + 1) * source / target
+    left = np.arange(source)
+    overlap = np.minimum(edges[1:, None], left[None] + 1) - np.maximum(edges[:-1, None], left[None])
+    overlap = np.clip(overlap, 0.0, None)
+    return overlap / overlap.sum(axis=1, keepdims=True)
+
+def downsample(pixels, width, height):
+    """ scales rgba pixels (h, w, 4) down to width x height, averaging with premultiplied alpha """
+    alpha = pixels[:, :, 3:]
+    premultiplied = np.concatenate([pixels[:, :, :3] * alpha, alpha], axis=2)
+
+    rows = area_weights(pixels.shape[0], height)
+    columns = area_weights(pixels.shape[1], width)
+    scaled = np.einsum('ij,jkc,lk->ilc', rows, premultiplied, columns)
+
+    covered = scaled[:, :, 3:]
+    scaled[:, :, :3] = np.where(covered > 0.0, scaled[:, :, :3] / np.maximum(covered, 1e-12), 0.0)
+    return scaled
+
+def read_pixels(path):
+    """ rgba pixels (h, w, 4) and color space of an image file, rows from the bottom """
+    image = bpy.data.images.load(path)
+    width, height = image.size
+    pixels = np.empty(width * height * 4, dtype=np.float32)
+    image.pixels.foreach_get(pixels)
+    colorspace = image.colorspace_settings.name
+    bpy.data.images.remove(image)
+    return pixels.reshape(height, width, 4), colorspace
+
+def write_pixels(pixels, path, image_format, colorspace):
+    height, width = pixels.shape[:2]
+    image = bpy.data.images.new("THUMBNAIL_PYRAMID", width, height, alpha=True)
+    image.colorspace_settings.name = colorspace
+    image.pixels.foreach_set(pixels.astype(np.float32).ravel())
+    image.file_format = image_format
+    image.filepath_raw = path
+    image.save()
+    bpy.data.images.remove(image)
+
+def write_pyramid(stem, spec, pixels=None, colorspace="sRGB"):
+    """ writes the scaled down thumbnails of the rendered thumbnail stem + extension
+        in the sizes and formats of the spec, from the pixels if given
+        returns their sidecar entries, with suffixes after the stem
+    """
+    # sizes or formats of an earlier render, as listed in its sidecar
+    for suffix, path in stem_variants(stem).items():
+        if suffix.startswith(SIZE_SEPARATOR):
+            os.remove(path)
+
+    sizes = spec.get('pyramid', [])
+    formats = writable_formats(spec.get('formats', []))
+    if not sizes or not formats:
+        return []
+
+    if pixels is None:
+        pixels, colorspace = read_pixels(stem + bpy.context.scene.render.file_extension)
+
+    height, width = pixels.shape[:2]
+    largest = max(width, height)
+    variants = []
+    for size in sizes:
+        # Case: Larger than the render, the draft tier renders at half size
+        if size > largest:
+            continue
+
+        scaled = pixels
+        if size != largest:
+            scaled = downsample(pixels, max(1, round(width * size / largest)), max(1, round(height * size / largest)))
+
+        for image_format in formats:
+            suffix = SIZE_SEPARATOR + str(size) + FORMAT_EXTENSIONS[image_format]
+            write_pixels(scaled, stem + suffix, image_format, colorspace)
+            variants.append(variant_entry(suffix, size, image_format))
+
+    return variants
+
+# datablock collections an asset can add to the studio file
+STUDIO_DATA = (
+        'actions',
+        'armatures',
+        'cameras',
+        'collections',
+        'curves',
+        'fonts',
+        'grease_pencils',
+        'images',
+        'lattices',
+        'libraries',
+        'lights',
+        'materials',
+        'meshes',
+        'metaballs',
+        'node_groups',
+        'objects',
+        'particles',
+        'textures',
+        'worlds',
+        )
+
+# images blender creates while rendering, not part of an asset
+RENDER_IMAGES = {'RENDER_RESULT', 'COMPOSITING'}
+
+# part of a sheet cell the bounding sphere of an asset fills
+SHEET_FILL = 0.9
+
+# camera data the renders change
+CAMERA_SETTINGS = ('type', 'lens', 'ortho_scale', 'clip_start', 'clip_end', 'shift_x', 'shift_y')
+
+def file_mtime(filepath):
+    try:
+        return os.stat(filepath).st_mtime_ns
+    except OSError:
+        return 0
+
+class StudioBaseline:
+    """ datablocks and scene state of an open studio file, restored between renders """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.mtime = file_mtime(filepath)
+
+        self.blocks = {name: set(block.as_pointer() for block in getattr(bpy.data, name))
+                for name in STUDIO_DATA}
+
+        scene = bpy.context.scene
+        self.camera = None
+        if scene.camera is not None:
+            data = scene.camera.data
+            self.camera = {
+                    'matrix_world': scene.camera.matrix_world.copy(),
+                    'data': {attribute: getattr(data, attribute) for attribute in CAMERA_SETTINGS},
+                    }
+
+        # the material render assigns the asset material to the studio geometry
+        self.slots = {obj.as_pointer(): [slot.material for slot in obj.material_slots]
+                for obj in scene.objects}
+        # the contact sheet hides the studio geometry
+        self.hidden = {obj.as_pointer(): obj.hide_render for obj in scene.objects}
+
+        # render settings the quality tiers change
+        self.settings = {}
+        for path in set(path for settings in QUALITY_SETTINGS.values() for path in settings):
+            owner, name = resolve_setting(scene, path)
+            if owner is not None:
+                self.settings[path] = getattr(owner, name)
+
+    def matches(self, spec):
+        """ True if the spec renders in this studio file and it didn't change on disk """
+        return (spec['type'] in studio_types and spec['filepath'] == self.filepath
+                and file_mtime(self.filepath) == self.mtime)
+
+    def added_blocks(self):
+        added = []
+        for name in STUDIO_DATA:
+            known = self.blocks[name]
+            for block in getattr(bpy.data, name):
+                if block.as_pointer() in known:
+                    continue
+                if name == 'images' and block.type in RENDER_IMAGES:
+                    continue
+                added.append(block)
+        return added
+
+    def restore(self):
+        """ removes the datablocks added since the studio file was opened """
+        added = self.added_blocks()
+        bpy.data.batch_remove(added)
+
+        scene = bpy.context.scene
+        if self.camera is not None and scene.camera is not None:
+            scene.camera.matrix_world = self.camera['matrix_world']
+            for attribute, value in self.camera['data'].items():
+                setattr(scene.camera.data, attribute, value)
+
+        for obj in scene.objects:
+            materials = self.slots.get(obj.as_pointer(), [])
+            for slot, material in zip(obj.material_slots, materials):
+                slot.material = material
+            obj.hide_render = self.hidden.get(obj.as_pointer(), obj.hide_render)
+
+        for path, value in self.settings.items():
+            owner, name = resolve_setting(scene, path)
+            setattr(owner, name, value)
+
+        log("Purged {} datablocks of the last asset".format(len(added)))
+
+# studio file kept open between render jobs
+baseline = None
+
+# Job types
+# each gets the spec after its blendfile is opened
+
+def setup_library(mode, pivot):
+    """ links the datablocks of the open file to its scene """
+    context = bpy.context
+    scene = context.scene
+
+    # rename the scene from Empty to Scene
+    scene.name = 'Scene'
+
+    if mode == 'OBJECT':
+        # link the resources to the master collection
+        for obj in bpy.data.objects:
+            scene.collection.objects.link(obj)
+
+        # center the objects around origin
+        bpy.ops.object.select_all(action='SELECT')
+        bpy.ops.ad.center_objects(pivot=pivot)
+
+    if mode == 'COLLECTION':
+        # link all collections to the scene master collection
+        for col in bpy.data.collections:
+            scene.collection.children.link(col)
+
+        # center the objects around origin
+        bpy.ops.object.select_all(action='SELECT')
+        bpy.ops.ad.center_objects(pivot=pivot)
+
+    if mode == 'MATERIAL':
+        # create geometry to hold the materials
+        # TODO: Bevel geometry
+        for i, mat in enumerate(bpy.data.materials):
+            bpy.ops.mesh.primitive_cube_add(location=(4*i, 0, 0))
+            bpy.ops.object.material_slot_add()
+            context.active_object.material_slots[0].material = mat
+
+def package_images(spec):
+    """ packages the textures of the open file with the settings of the spec """
+    bpy.ops.ad.package_images(**spec.get('textures', {}))
+
+def save_library(spec):
+    save_file(spec['output'])
+
+    if spec['package_images']:
+        # relink and save after relinking
+        package_images(spec)
+        save_file(spec['output'])
+
+def export_library(spec):
+    """ turns the open staging library into a standalone library file
+
+        output: path of the library file
+        mode: OBJECT, COLLECTION or MATERIAL
+        pivot: pivot placement of the objects
+        package_images: copy textures next to the file
+        textures: settings of ad.package_images, texture store and link mode
+    """
+    setup_library(spec['mode'], spec['pivot'])
+    save_library(spec)
+
+def export_asset(spec):
+    """ saves a single datablock of a staging library to its own library file
+
+        library: staging library holding the datablock
+        block: name of the datablock
+        output, mode, pivot, package_images, textures: see export_library
+    """
+    attribute = {
+            'OBJECT': 'objects',
+            'COLLECTION': 'collections',
+            'MATERIAL': 'materials',
+            }[spec['mode']]
+
+    # append the datablock into the empty file
+    with bpy.data.libraries.load(spec['library']) as (data_from, data_to):
+        setattr(data_to, attribute, [spec['block']])
+
+    setup_library(spec['mode'], spec['pivot'])
+    save_library(spec)
+
+def render_object(spec):
+    """ renders the objects of a library file in the open studio file
+
+        asset: library file to render
+        output: thumbnail path without extension
+        size: thumbnail resolution
+
+        returns the sidecar entries of the scaled down thumbnails
+    """
+    scene = bpy.context.scene
+
+    # merge all objects from the blendfile
+    with bpy.data.libraries.load(spec['asset']) as (data_from, data_to):
+        data_to.objects = data_from.objects
+
+    # link all objects to the scene and select them
+    for obj in data_to.objects:
+        if obj is not None:
+            scene.collection.objects.link(obj)
+            obj.select_set(True)
+
+    # frame all objects with camera
+    scene.camera.data.lens += 5
+    bpy.ops.view3d.camera_to_view_selected()
+    scene.camera.data.lens -= 5
+
+    render_still(scene, spec['output'], spec['size'])
+    return {spec['output']: write_pyramid(spec['output'], spec)}
+
+def render_material(spec):
+    """ renders every material of a library file in the open studio file
+        the first material is also the thumbnail of the file
+
+        asset: library file to render
+        output: thumbnail path without extension, materials get output__<material>
+        size: thumbnail resolution
+
+        returns the sidecar entries of the material and scaled down thumbnails
+    """
+    context = bpy.context
+    scene = context.scene
+
+    # merge all materials from the blendfile
+    with bpy.data.libraries.load(spec['asset']) as (data_from, data_to):
+        data_to.materials = data_from.materials
+
+    materials = [mat for mat in data_to.materials if mat is not None]
+    if len(materials) == 0:
+        raise RuntimeError("{} has no materials".format(spec['asset']))
+
+    # get material geo
+    matgeo = [obj for obj in scene.objects if 'MATGEO' in obj.name]
+
+    for geo in matgeo:
+        # create matslots on geo if it doesn't have em
+        if len(geo.material_slots) == 0:
+            context.view_layer.objects.active = geo
+            bpy.ops.object.material_slot_add()
+
+    # thumbnails of renamed or removed materials
+    for path in stem_variants(spec['output']).values():
+        os.remove(path)
+
+    # swap the materials on the geo, the scene stays loaded between renders
+    names = set()
+    variants = []
+    for i, material in enumerate(materials):
+        for geo in matgeo:
+            geo.material_slots[0].material = material
+
+        name = variant_name(material.name)
+        if name in names:
+            name += "_{}".format(i)
+        names.add(name)
+
+        output = spec['output'] + VARIANT_SEPARATOR + name
+        render_still(scene, output, spec['size'])
+
+        extension = scene.render.file_extension
+        variants.append(variant_entry(VARIANT_SEPARATOR + name + extension,
+                spec['size'], scene.render.image_settings.file_format, name))
+        for variant in write_pyramid(output, spec):
+            variants.append(variant_entry(VARIANT_SEPARATOR + name + variant['suffix'],
+                    variant['size'], variant['format'], name))
+
+        if i == 0:
+            shutil.copyfile(output + extension, spec['output'] + extension)
+            variants += write_pyramid(spec['output'], spec)
+
+    return {spec['output']: variants}
+
+def sheet_layout(groups, columns, rows, rotation):
+    """ places each group of objects in a cell of a grid facing the camera
+        every group is scaled to fit its cell, the grid is centered on the origin
+        returns the size of a cell
+    """
+    bounds = []
+    for objects in groups:
+        corners = [obj.matrix_world @ Vector(corner) for obj in objects for corner in obj.bound_box]
+        if len(corners) == 0:
+            corners = [Vector((0, 0, 0))]
+        low = Vector(tuple(min(corner[i] for corner in corners) for i in range(3)))
+        high = Vector(tuple(max(corner[i] for corner in corners) for i in range(3)))
+        center = (low + high) / 2
+        radius = max(max((corner - center).length for corner in corners), 1e-6)
+        bounds.append((center, radius))
+
+    # cells at the typical asset size keep the studio lighting plausible
+    diameters = sorted(radius * 2 for _, radius in bounds)
+    cell = diameters[len(diameters) // 2] / SHEET_FILL
+
+    right, up = rotation.col[0], rotation.col[1]
+    for index, (objects, (center, radius)) in enumerate(zip(groups, bounds)):
+        column, row = index % columns, index // columns
+        cell_center = right * (column - (columns - 1) / 2) * cell + up * ((rows - 1) / 2 - row) * cell
+
+        # the bounding sphere fits the cell from any view direction
+        scale = cell * SHEET_FILL / 2 / radius
+        pivot = bpy.data.objects.new("SHEET_{}".format(index), None)
+        bpy.context.scene.collection.objects.link(pivot)
+        pivot.matrix_world = (Matrix.Translation(cell_center) @ Matrix.Scale(scale, 4)
+                @ Matrix.Translation(-center))
+
+        for obj in objects:
+            if obj.parent is None or obj.parent not in objects:
+                world = obj.matrix_world.copy()
+                obj.parent = pivot
+                obj.matrix_parent_inverse = Matrix.Identity(4)
+                obj.matrix_world = pivot.matrix_world @ world
+
+    return cell
+
+def slice_sheet(filepath, spec, columns, file_format):
+    """ cuts a rendered sheet into one image per asset of the spec, saved to its output
+        returns output -> sidecar entries of the scaled down thumbnails
+    """
+    sheet = bpy.data.images.load(filepath)
+    width, height = sheet.size
+    pixels = np.empty(width * height * 4, dtype=np.float32)
+    sheet.pixels.foreach_get(pixels)
+    pixels = pixels.reshape(height, width, 4)
+
+    tile_width = width // columns
+    tile_height = tile_width
+    tile = bpy.data.images.new("SHEET_TILE", tile_width, tile_height, alpha=True)
+    tile.colorspace_settings.name = sheet.colorspace_settings.name
+    tile.file_format = file_format
+    extension = bpy.context.scene.render.file_extension
+
+    variants = {}
+    for index, item in enumerate(spec['assets']):
+        column, row = index % columns, index // columns
+        # image rows start at the bottom
+        top = height - row * tile_height
+        x = column * tile_width
+        tile_pixels = pixels[top - tile_height:top, x:x + tile_width]
+        tile.pixels.foreach_set(tile_pixels.ravel())
+        tile.filepath_raw = item['output'] + extension
+        tile.save()
+
+        variants[item['output']] = write_pyramid(item['output'], spec, tile_pixels, sheet.colorspace_settings.name)
+
+    bpy.data.images.remove(tile)
+    bpy.data.images.remove(sheet)
+    return variants
+
+def render_sheet(spec):
+    """ renders the objects of many library files in one frame of the open studio file
+        and cuts it into their thumbnails
+
+        The assets are laid out in a grid seen by an orthographic camera with
+        the orientation of the studio camera. The studio geometry is hidden,
+        its lights and world stay.
+
+        assets: list of {'asset': library file, 'output': thumbnail path without extension}
+        columns: assets per row of the sheet
+        size: thumbnail resolution
+
+        returns output -> sidecar entries of the scaled down thumbnails
+    """
+    scene = bpy.context.scene
+    camera = scene.camera
+    items = spec['assets']
+    columns = max(1, min(spec['columns'], len(items)))
+    rows = math.ceil(len(items) / columns)
+
+    # studio geometry would cover the sheet
+    for obj in scene.objects:
+        if obj.type not in {'LIGHT', 'CAMERA'}:
+            obj.hide_render = True
+
+    groups = []
+    for item in items:
+        with bpy.data.libraries.load(item['asset']) as (data_from, data_to):
+            data_to.objects = data_from.objects
+
+        objects = [obj for obj in data_to.objects if obj is not None]
+        for obj in objects:
+            scene.collection.objects.link(obj)
+        groups.append(objects)
+
+    bpy.context.view_layer.update()
+
+    rotation = camera.matrix_world.to_3x3().normalized()
+    cell = sheet_layout(groups, columns, rows, rotation)
+
+    # orthographic camera looking at the grid from outside of it
+    extent = max(columns, rows) * cell
+    forward = -rotation.col[2]
+    distance = max(camera.matrix_world.translation.length, extent * 2)
+    camera.matrix_world = Matrix.Translation(-forward * distance) @ rotation.to_4x4()
+    camera.data.type = 'ORTHO'
+    camera.data.ortho_scale = extent
+    camera.data.shift_x = 0.0
+    camera.data.shift_y = 0.0
+    camera.data.clip_start = min(camera.data.clip_start, distance / 100)
+    camera.data.clip_end = distance * 2
+
+    render = scene.render
+    render.resolution_x = columns * spec['size']
+    render.resolution_y = rows * spec['size']
+    render.use_file_extension = True
+
+    output = os.path.join(tempfile.mkdtemp(prefix="ad_sheet_"), "sheet")
+    render.filepath = output
+    bpy.ops.render.render(write_still=True)
+
+    sheetpath = output + render.file_extension
+    try:
+        return slice_sheet(sheetpath, spec, columns, render.image_settings.file_format)
+    finally:
+        shutil.rmtree(os.path.dirname(sheetpath), ignore_errors=True)
+
+def relocate_file(spec):
+    """ saves the open file to destination and packages its textures there """
+    save_file(spec['destination'])
+
+    # package its assets next to it and save again
+    package_images(spec)
+    save_file()
+
+def package_file(spec):
+    """ packages the textures of the open file next to it """
+    package_images(spec)
+    save_file()
+
+job_types = {
+        'EXPORT': export_library,
+        'EXPORT_ASSET': export_asset,
+        'RENDER_OBJECT': render_object,
+        'RENDER_MATERIAL': render_material,
+        'RENDER_SHEET': render_sheet,
+        'RELOCATE': relocate_file,
+        'PACKAGE': package_file,
+        }
+
+# jobs rendering in a studio file, they can share an open one
+studio_types = {'RENDER_OBJECT', 'RENDER_MATERIAL', 'RENDER_SHEET'}
+
+def open_file(spec, reset):
+    """ prepares the blendfile of a spec, reusing the open studio file for renders """
+    global baseline
+
+    # Case: Render in the studio file that is open already
+    if baseline is not None and baseline.matches(spec):
+        try:
+            baseline.restore()
+            return
+        except Exception:
+            log("Restoring the studio file failed, opening it again:\n{}".format(traceback.format_exc()))
+            reset = True
+
+    baseline = None
+    if reset:
+        reset_file(spec['filepath'])
+
+    if spec['type'] in studio_types:
+        baseline = StudioBaseline(spec['filepath'])
+
+def run_job(spec, reset=True):
+    """ runs a single job spec and returns its result
+        reset: open the blendfile of the spec first, renders reuse an open studio file
+    """
+    start = time.time()
+    try:
+        open_file(spec, reset)
+        # render time without loading the studio file
+        rendering = time.time()
+        if spec['type'] in studio_types:
+            apply_quality(bpy.context.scene, spec.get('quality', 'STANDARD'))
+
+        rendered = job_types[spec['type']](spec)
+        result = {'ok': True, 'error': ""}
+
+        if spec['type'] in studio_types:
+            write_sidecars(spec, time.time() - rendering, rendered or {})
+    except Exception:
+        result = {'ok': False, 'error': traceback.format_exc()}
+        log("Job {} failed:\n{}".format(spec['type'], result['error']))
+
+    result['duration'] = time.time() - start
+    return result
+
+def run_jobs(specs, opened=""):
+    """ runs a job spec or a list of them, returns the combined result
+        opened: blendfile opened from the command line, the first job
+        doesn't need to load it again
+    """
+    if isinstance(specs, dict):
+        specs = [specs]
+
+    results = []
+    for i, spec in enumerate(specs):
+        reset = i != 0 or opened == "" or os.path.abspath(spec['filepath']) != opened
+        results.append(run_job(spec, reset))
+
+    return {
+            'ok': all(result['ok'] for result in results),
+            'error': "\n".join(result['error'] for result in results if not result['ok']),
+            'results': results,
+            }
+
+def serve(address):
+    """ runs jobs sent by the worker pool until it asks us to quit """
+    host, port = address.rsplit(":", 1)
+    sock = socket.create_connection((host, int(port)))
+    conn = Connection(sock)
+    conn.send({'token': os.environ.get('AD_WORKER_TOKEN', ""), 'pid': os.getpid()})
+
+    while True:
+        try:
+            message = conn.recv()
+        except (ConnectionError, OSError):
+            # the pool is gone
+            break
+
+        if message.get('type') == 'QUIT':
+            break
+
+        result = run_jobs(message['jobs'])
+        result['memory'] = memory_usage()
+        conn.send(result)
+
+    conn.close()
+
+def main():
+    arguments = get_arguments()
+
+    if "--connect" in arguments:
+        serve(arguments[arguments.index("--connect") + 1])
+        return
+
+    if "--jobs" in arguments:
+        with open(arguments[arguments.index("--jobs") + 1], encoding='utf-8') as specfile:
+            specs = json.load(specfile)
+    elif "--stdin" in arguments:
+        specs = json.loads(sys.stdin.read())
+    else:
+        log("No job source given to the background worker")
+        sys.exit(1)
+
+    result = run_jobs(specs, opened=bpy.data.filepath)
+
+    if "--results" in arguments:
+        with open(arguments[arguments.index("--results") + 1], 'w', encoding='utf-8') as resultfile:
+            json.dump(result, resultfile)
+
+    if not result['ok']:
+        sys.exit(1)
@@ -11,8 +11,24 @@ cp ad_ops_export.py "$folder"
 cp ad_ops_filelist.py "$folder"
 cp ad_ops_import.py "$folder"
 cp ad_ops_tools.py "$folder"
+cp ad_ops_jobs.py "$folder"
+cp ad_ops_catalog.py "$folder"
 cp ad_ops_utility.py "$folder"
 cp ad_utils.py "$folder"
+cp ad_raycast.py "$folder"
+cp ad_bounds.py "$folder"
+cp ad_transform.py "$folder"
+cp ad_modal.py "$folder"
+cp ad_scatter.py "$folder"
+cp ad_pool.py "$folder"
+cp ad_worker.py "$folder"
+cp ad_jobs.py "$folder"
+cp ad_hash.py "$folder"
+cp ad_thumbcache.py "$folder"
+cp ad_textures.py "$folder"
+cp ad_blendfile.py "$folder"
+cp ad_catalog.py "$folder"
+cp ad_watcher.py "$folder"
 cp -r ./resources "$folder"
 zip -r "${name}_${version}.zip" "$folder"
 rm -r "$folder"
@@ -0,0 +1,133 @@
+# Tests of the blendfile reader against a small corpus
+#
+# The corpus is the studio file shipped with the addon and copies of it
+# generated at test time: gzip and zstd compressed, and converted to the
+# header format of blender 5.0 with 64 bit block sizes. Each copy has to
+# list the same content as the uncompressed original. Runs without blender:
+#
+#   python -m unittest discover tests
+import os
+import gzip
+import shutil
+import struct
+import tempfile
+import unittest
+import importlib.util
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ORIGINAL = os.path.join(ROOT, "aqueduct_addon", "resources", "studio_objects.blend")
+
+# load the module alone, the addon package needs blender
+_spec = importlib.util.spec_from_file_location("ad_blendfile",
+        os.path.join(ROOT, "aqueduct_addon", "ad_blendfile.py"))
+ad_blendfile = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(ad_blendfile)
+
+def zstd_compress(data):
+    """ zstd compressed data, None without a zstd module """
+    try:
+        import zstandard
+        return zstandard.ZstdCompressor().compress(data)
+    except ImportError:
+        pass
+
+    try:
+        # python 3.14+
+        from compression import zstd
+        return zstd.compress(data)
+    except ImportError:
+        return None
+
+def large_header_copy(data):
+    """ converts a little endian 64 bit blendfile to the header format of blender 5.0 """
+    version = data[9:12].decode('ascii')
+    converted = [b"BLENDER17-01v0" + version.encode('ascii')]
+
+    small = struct.Struct("<4siQii")
+    large = struct.Struct("<4siQqq")
+    offset = 12
+    while offset + small.size <= len(data):
+        code, size, old, sdna, count = small.unpack_from(data, offset)
+        offset += small.size
+        converted.append(large.pack(code, sdna, old, size, count))
+        converted.append(data[offset:offset + size])
+        offset += size
+        if code == b"ENDB":
+            break
+
+    return b"".join(converted)
+
+def content(summary):
+    """ summary without the path and compression of the file """
+    return {key: value for key, value in summary.items() if key not in ('filepath', 'compressed')}
+
+class BlendFileCorpusTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.mkdtemp(prefix="ad_blendfile_")
+        with open(ORIGINAL, 'rb') as original:
+            data = original.read()
+
+        cls.corpus = {'original': ORIGINAL}
+
+        cls.corpus['gzip'] = os.path.join(cls.folder, "gzip.blend")
+        with open(cls.corpus['gzip'], 'wb') as copy:
+            copy.write(gzip.compress(data))
+
+        compressed = zstd_compress(data)
+        if compressed is not None:
+            cls.corpus['zstd'] = os.path.join(cls.folder, "zstd.blend")
+            with open(cls.corpus['zstd'], 'wb') as copy:
+                copy.write(compressed)
+
+        cls.corpus['large_header'] = os.path.join(cls.folder, "large_header.blend")
+        with open(cls.corpus['large_header'], 'wb') as copy:
+            copy.write(large_header_copy(data))
+
+        with ad_blendfile.BlendFile(ORIGINAL) as blend:
+            cls.expected = blend.summary()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.folder, ignore_errors=True)
+
+    def summary(self, name):
+        with ad_blendfile.BlendFile(self.corpus[name]) as blend:
+            summary = blend.summary()
+        return content(summary)
+
+    def assertMatchesOriginal(self, name):
+        self.assertEqual(self.summary(name), content(self.expected))
+
+    def test_original(self):
+        self.assertFalse(self.expected['compressed'])
+        self.assertIn('Camera', self.expected['datablocks']['objects'])
+        self.assertIn('Sun', self.expected['datablocks']['lights'])
+        self.assertEqual(self.expected['preview'], [128, 128])
+
+    def test_gzip(self):
+        self.assertMatchesOriginal('gzip')
+
+    def test_zstd(self):
+        if 'zstd' not in self.corpus:
+            self.skipTest("needs the zstandard module or python 3.14")
+        self.assertMatchesOriginal('zstd')
+
+    def test_large_header(self):
+        self.assertMatchesOriginal('large_header')
+
+    def test_read_datablocks(self):
+        for name in self.corpus:
+            with self.subTest(name):
+                self.assertEqual(ad_blendfile.read_datablocks(self.corpus[name]), self.expected['datablocks'])
+
+    def test_not_a_blendfile(self):
+        path = os.path.join(self.folder, "text.blend")
+        with open(path, 'w') as text:
+            text.write("not a blendfile")
+        with self.assertRaises(ad_blendfile.BlendFileError):
+            ad_blendfile.BlendFile(path)
+
+if __name__ == "__main__":
+    unittest.main()